@@ -4,17 +4,22 @@
 # Basic utility functions (namely, modulation and demodulation) used 
 # throughout the rest of the PPM code base. 
 
-# import numpy as np
+import numpy as np
 # import scipy as sp
 # import matplotlib.pyplot as plt
 import doctest
 from math import ceil
+from ppm_instrument import INSTRUMENT, count, timed
 
+# Preamble, SFD0 and SFD1 symbol values used with 16-PPM (ppm16_demod.v)
+SYNC_DEFAULTS = (0, 7, 10)
+
+@timed()
 def ppm_mod_vals(values, chips_per_symbol, bits_per_chip, mode=None):
 	"""
 	Inputs:
-		values: Collection of integers (not bits) to encode. Individual value
-			must not exceed the chips per symbol.
+		values: Collection (or NumPy array) of integers (not bits) to encode. 
+			Individual value must not exceed the chips per symbol.
 		chips_per_symbol: Number of chips to use for a single symbol in the
 			PPM encoding.
 		bits_per_chip: Number of bits associated with a single chip. For 
@@ -24,7 +29,7 @@ def ppm_mod_vals(values, chips_per_symbol, bits_per_chip, mode=None):
 			goes in the 0th index. Does not change the order of the symbols
 			amongst one another.
 	Outputs:
-		Returns a flattened array where elements 0 to chips_per_symbol-1 
+		Returns a flattened uint8 array where elements 0 to chips_per_symbol-1 
 		correspond to the PPM form of the 0th element in values, etc.
 		Note that the MSB goes in the 0th element.
 	Raises:
@@ -36,26 +41,29 @@ def ppm_mod_vals(values, chips_per_symbol, bits_per_chip, mode=None):
 	>>> output = ppm_mod_vals(values, 4, 2, None)
 	>>> expected_output == list(output)
 	True
+	>>> list(ppm_mod_vals([1], 4, 2, 'rev')) == [0,0,1,1,0,0,0,0]
+	True
 	"""
-	mod_values = []
-	for val in values:
-		# Check that the value doesn't exceed the max possible value
-		if val >= chips_per_symbol:
-			raise UserWarning("{0} > Max {1}".format(val, chips_per_symbol))
-			val_mod = chips_per_symbol - 1
-		else:
-			val_mod = val
-			
-		# The value indicates where the high value should go amongst the 0s
-		mod_val = [0]*(chips_per_symbol-val_mod-1)*bits_per_chip \
-					+ [1]*bits_per_chip \
-					+ [0]*val_mod*bits_per_chip
-					
-		if mode == 'rev':
-			mod_val = mod_val[::-1]
-			
-		mod_values.extend(mod_val)
-	return np.asarray(mod_values)
+	# Validate the whole batch up front rather than symbol by symbol
+	values = np.asarray(values, dtype=np.int64).ravel()
+	out_of_range = (values >= chips_per_symbol) | (values < 0)
+	if np.any(out_of_range):
+		raise UserWarning("{0} > Max {1}".format(values[out_of_range][0], 
+							chips_per_symbol))
+	
+	# The value indicates which chip should be high amongst the 0s. Reversing
+	# a symbol with all-equal chip bits just mirrors the chip index.
+	if mode == 'rev':
+		chip_idx = values
+	else:
+		chip_idx = chips_per_symbol - 1 - values
+	
+	# Scatter the pulses into an array of zeros in one shot
+	mod_values = np.zeros((len(values), chips_per_symbol, bits_per_chip), 
+						dtype=np.uint8)
+	mod_values[np.arange(len(values)), chip_idx, :] = 1
+	count('ppm_mod_vals.symbols', len(values))
+	return mod_values.ravel()
 
 def ppm_mod_bits(symbols, chips_per_symbol, bits_per_chip, mode=None):
 	"""
@@ -72,7 +80,10 @@ def ppm_mod_bits(symbols, chips_per_symbol, bits_per_chip, mode=None):
 			symbols amongst one another.
 	Outputs:
 		Returns a flattened array where the symbols have been modulated 
-		using chips_per_symbol-PPM and bits_per_chip.
+		using chips_per_symbol-PPM and bits_per_chip. A trailing partial
+		symbol is treated as a shorter binary number.
+	Raises:
+		ValueError if 'symbols' contains anything other than 0 and 1.
 		
 	>>> symbols_flat = [0,1] + [1,0] + [1,1]
 	>>> expected_output = [0,0,0,0,1,1,0,0] + [0,0,1,1,0,0,0,0] + [1,1,0,0,0,0,0,0]
@@ -83,13 +94,67 @@ def ppm_mod_bits(symbols, chips_per_symbol, bits_per_chip, mode=None):
 	>>> output_rev = ppm_mod_bits(symbols_flat, 4, 2, 'rev')
 	>>> list(output_rev) == expected_output_rev
 	True
+	>>> ppm_mod_bits([1,0,1], 4, 1, None).tolist()
+	[0, 1, 0, 0, 0, 0, 1, 0]
 	"""
-	bits_per_symbol = int(np.log2(chips_per_symbol))
-	symbols_unflat = [symbols[i*bits_per_symbol : (i+1)*bits_per_symbol] \
-		for i in range((len(symbols)+bits_per_symbol-1)//bits_per_symbol)]
-	values = [int(''.join(map(str,symbol)), 2) for symbol in symbols_unflat]
+	bits_per_symbol = int_log2(chips_per_symbol)
+	symbols = np.asarray(symbols).ravel()
+	if np.any((symbols != 0) & (symbols != 1)):
+		raise ValueError("Symbols must only contain 0 and 1")
+	
+	# Full symbols are packed in bulk. A trailing partial symbol is read
+	# as a shorter binary number, same as slicing the list would.
+	num_full = len(symbols) // bits_per_symbol
+	values = bits_to_ints(symbols[:num_full*bits_per_symbol], bits_per_symbol)
+	if len(symbols) % bits_per_symbol != 0:
+		values = np.append(values, bits_to_ints(symbols[num_full*bits_per_symbol:],
+			len(symbols) % bits_per_symbol))
 	return ppm_mod_vals(values, chips_per_symbol, bits_per_chip, mode=mode)
 
+def int_log2(n):
+	"""
+	Inputs:
+		n: Positive integer.
+	Outputs:
+		Returns floor(log2(n)) in integer arithmetic, so large orders can't
+		be rounded down by floating point.
+		
+	>>> [int_log2(n) for n in [1, 4, 5, 4096]]
+	[0, 2, 2, 12]
+	"""
+	return int(n).bit_length() - 1
+
+def bits_to_ints(bits, width):
+	"""
+	Inputs:
+		bits: Flattened collection of 0 and 1 where each grouping of 'width'
+			bits is an unsigned integer with the MSB first.
+		width: Integer. Number of bits per integer.
+	Outputs:
+		Returns a flattened NumPy array of the integers. Widths up to 8 are
+		shifted together column by column and come back as uint8, wider ones 
+		go through a weighted dot product and come back as int64.
+		
+	>>> bits_to_ints([0,1,1, 1,0,0], 3).tolist()
+	[3, 4]
+	>>> bits_to_ints([1]+[0]*8 + [0]*8+[1], 9).tolist()
+	[256, 1]
+	"""
+	bits = np.asarray(bits, dtype=np.uint8).reshape(-1, width)
+	if width == 1:
+		return bits[:,0]
+	if width <= 8:
+		# Shift-and-or down the (short) columns
+		ints = bits[:,0] << 1
+		for k in range(1, width-1):
+			ints |= bits[:,k]
+			ints <<= 1
+		ints |= bits[:,width-1]
+		return ints
+	weights = np.left_shift(1, np.arange(width-1, -1, -1, dtype=np.int64))
+	return bits.astype(np.int64) @ weights
+
+@timed()
 def ppm_bits_to_chips(symbol_mod_bits, bits_per_chip):
 	"""
 	Inputs:
@@ -110,16 +175,54 @@ def ppm_bits_to_chips(symbol_mod_bits, bits_per_chip):
 	if len(symbol_mod_bits) % bits_per_chip != 0:
 		raise ValueError("{0} bits in symbol not divisible by {1}".format(len(symbol_mod_bits), bits_per_chip))
 	
-	chips_per_symbol = int(len(symbol_mod_bits)/bits_per_chip)
-	chips = []
-	
 	# Flattened modulated symbol -> flattened demodulated chips
-	for i in range(chips_per_symbol):
-		bits = symbol_mod_bits[i*bits_per_chip:(i+1)*bits_per_chip]
-		c = int(''.join(map(str,bits)), 2)
-		chips.append(c)
-	return chips
+	count('ppm_bits_to_chips.chips', len(symbol_mod_bits) // bits_per_chip)
+	return bits_to_ints(symbol_mod_bits, bits_per_chip).tolist()
 
+@timed()
+def ppm_correlate_bits(mod_bits, chips_per_symbol, bits_per_chip, threshold=0):
+	"""
+	Inputs:
+		mod_bits: Collection of bits where the MSB is in the 0th index
+			of a given symbol.
+		chips_per_symbol: Integer. Number of chips used for a single symbol
+			in the PPM encoding.
+		bits_per_chip:	Integer. Number of bits associated with a single chip.
+		threshold: Integer. Minimum value a maximum must take in order to be 
+			considered a non-noise pulse.
+	Outputs:
+		Batch equivalent of ppm16_correlator.v for any number of symbols. 
+		Returns three NumPy arrays with one entry per symbol:
+		(1) symbol: the demodulated symbol (integer, not bits)
+		(2) peak_value: the magnitude of the largest chip
+		(3) threshold_unmet: True where peak_value < threshold
+		Ties go to the larger symbol value (the earliest chip).
+	Raises:
+		ValueError if the number of bits received does not contain an integer
+		number of symbols.
+		
+	>>> mod_bits = [0,0, 0,1, 1,1, 0,0] + [1,0, 0,0, 0,0, 0,0]
+	>>> symbol, peak_value, threshold_unmet = ppm_correlate_bits(mod_bits, 4, 2, 3)
+	>>> symbol.tolist(), peak_value.tolist(), threshold_unmet.tolist()
+	([1, 3], [3, 2], [False, True])
+	"""
+	mod_bits = np.asarray(mod_bits, dtype=np.uint8).ravel()
+	bits_per_symbol = chips_per_symbol * bits_per_chip
+	
+	# Check that there's no fragmentation of a received symbol
+	if len(mod_bits) % bits_per_symbol != 0:
+		raise ValueError("{0} received bits not divisible by {1}".format(len(mod_bits), \
+							bits_per_symbol))
+	
+	# (symbols, chips) view of the chip magnitudes
+	chips = bits_to_ints(mod_bits, bits_per_chip).reshape(-1, chips_per_symbol)
+	peak_idx = np.argmax(chips, axis=1)
+	peak_value = chips[np.arange(len(chips)), peak_idx]
+	symbol = chips_per_symbol - 1 - peak_idx
+	if INSTRUMENT['enabled']:
+		count('ppm_correlate_bits.symbols', len(chips))
+		count('ppm_correlate_bits.threshold_misses', np.count_nonzero(peak_value < threshold))
+	return symbol, peak_value, peak_value < threshold
 
 def ppm_demod_bits_vals(mod_bits, chips_per_symbol, bits_per_chip, threshold=0):
 	"""
@@ -130,12 +233,11 @@ def ppm_demod_bits_vals(mod_bits, chips_per_symbol, bits_per_chip, threshold=0):
 			in the PPM encoding.
 		bits_per_chip:	Integer. Number of bits associated with a single chip.
 		threshold: Integer. Minimum value a maximum must take in order to be 
-			considered a non-noise pulse.
+			considered a non-noise pulse. Unused here; see ppm_correlate_bits
+			for the per-symbol threshold and peak values.
 	Outputs:
-		Returns (1) a collection of symbols (integers, not bits) where the incoming
-		chips have been demodulated to find their associated symbol (2) a
-		collection of boolean values indicating if the symbol of the same index 
-		met the threshold for being considered non-noise.
+		Returns a NumPy array of symbols (integers, not bits) where the incoming
+		chips have been demodulated to find their associated symbol.
 	Raises:
 		ValueError if the number of bits received does not contain an integer
 		number of symbols.
@@ -150,23 +252,100 @@ def ppm_demod_bits_vals(mod_bits, chips_per_symbol, bits_per_chip, threshold=0):
 	>>> list(values_reclaimed) == list(values)
 	True
 	"""
-	bits_per_symbol = chips_per_symbol * bits_per_chip
-	demod_values = []
-	threshold_met = []
-	
-	# Check that there's no fragmentation of a received symbol
-	if len(mod_bits) % bits_per_symbol != 0:
-		raise ValueError("{0} received bits not divisible by {1}".format(mod_bits, \
-							bits_per_symbol))
+	demod_values, _, _ = ppm_correlate_bits(mod_bits, chips_per_symbol, 
+										bits_per_chip, threshold=threshold)
+	return demod_values
+
+def ppm_vals_to_bits(values, bits_per_symbol):
+	"""
+	Inputs:
+		values: Collection of integers (not bits), e.g. demodulated symbols.
+		bits_per_symbol: Integer. Number of bits to expand each value to.
+	Outputs:
+		Returns a flattened uint8 array of bits where each value has been
+		expanded MSB first. Inverse of the packing done in ppm_mod_bits.
+		
+	>>> ppm_vals_to_bits([1, 2, 3], 2).tolist()
+	[0, 1, 1, 0, 1, 1]
+	"""
+	values = np.asarray(values, dtype=np.int64).reshape(-1, 1)
+	shifts = np.arange(bits_per_symbol-1, -1, -1, dtype=np.int64)
+	return ((values >> shifts) & 1).astype(np.uint8).ravel()
+
+def sync_vals(chips_per_symbol, preamble_val=None, sfd0_val=None, sfd1_val=None):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol.
+		preamble_val, sfd0_val, sfd1_val: Integers or None. Sync symbol
+			values. None takes the value from SYNC_DEFAULTS, keeping only the
+			low bits that fit in a symbol (what a lower order sends anyway).
+	Outputs:
+		Returns (preamble_val, sfd0_val, sfd1_val).
+	Raises:
+		ValueError if a value given doesn't fit in a symbol.
+
+	>>> sync_vals(16), sync_vals(4), sync_vals(4, sfd1_val=1)
+	((0, 7, 10), (0, 3, 2), (0, 3, 1))
+	>>> sync_vals(4, sfd0_val=7)
+	Traceback (most recent call last):
+	...
+	ValueError: Sync symbol value 7 doesn't fit in 4-PPM
+	"""
+	vals = []
+	for val, default in zip([preamble_val, sfd0_val, sfd1_val], SYNC_DEFAULTS):
+		if val is None:
+			val = default % chips_per_symbol
+		elif not 0 <= val < chips_per_symbol:
+			raise ValueError("Sync symbol value {0} doesn't fit in {1}-PPM".format(val,
+				chips_per_symbol))
+		vals.append(val)
+	return tuple(vals)
+
+@timed()
+def ppm_correlate_offsets(mod_bits, chips_per_symbol, bits_per_chip, threshold=0):
+	"""
+	Inputs:
+		mod_bits: Collection of received bits (not necessarily symbol-aligned)
+			where the MSB of a symbol comes first.
+		chips_per_symbol: Integer. Number of chips used for a single symbol
+			in the PPM encoding.
+		bits_per_chip:	Integer. Number of bits associated with a single chip.
+		threshold: Integer. Minimum value a maximum must take in order to be 
+			considered a non-noise pulse.
+	Outputs:
+		Same as ppm_correlate_bits, but for the symbol starting at every bit
+		offset, i.e. entry t is the correlator output for 
+		mod_bits[t : t+chips_per_symbol*bits_per_chip]. This is what the
+		correlator in ppm16_demod.v sees on every cycle while scanning.
+		
+	>>> mod_bits = [0,0,0] + [0,0,0,1]
+	>>> symbol, peak_value, threshold_unmet = ppm_correlate_offsets(mod_bits, 4, 1, 1)
+	>>> symbol.tolist(), peak_value.tolist(), threshold_unmet.tolist()
+	([3, 3, 3, 0], [0, 0, 0, 1], [True, True, True, False])
+	"""
+	mod_bits = np.asarray(mod_bits, dtype=np.uint8).ravel()
+	num_offsets = len(mod_bits) - chips_per_symbol*bits_per_chip + 1
+	if num_offsets <= 0:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), \
+			np.zeros(0, dtype=bool)
 	
-	# Split the bits into their symbol groupings
-	split_mod_bits = [mod_bits[i:i+bits_per_symbol] for i \
-					in range(0,len(mod_bits),bits_per_symbol)]
+	# Chip magnitude starting at every bit offset
+	num_chips = len(mod_bits) - bits_per_chip + 1
+	if bits_per_chip <= 8:
+		chips = mod_bits[:num_chips].copy()
+	else:
+		chips = mod_bits[:num_chips].astype(np.int64)
+	for k in range(1, bits_per_chip):
+		chips <<= 1
+		chips |= mod_bits[k:k+num_chips]
 	
-	# Convert each chip from bits to an integer value
-	for symbol_bits in split_mod_bits:
-		chips = ppm_bits_to_chips(symbol_bits, bits_per_chip)
-		demod_val = chips_per_symbol - 1 - np.argmax(chips)
-		threshold_met.append(np.max(chips) >= threshold)
-		demod_values.append(demod_val)
-	return demod_values
+	# Running maximum over the chips of each window. Strict > keeps the 
+	# first (earliest) chip on ties, same as ppm_correlate_bits.
+	peak_value = chips[:num_offsets].copy()
+	peak_idx = np.zeros(num_offsets, dtype=np.int64)
+	for j in range(1, chips_per_symbol):
+		chip = chips[j*bits_per_chip : j*bits_per_chip+num_offsets]
+		np.copyto(peak_idx, j, where=chip > peak_value)
+		np.maximum(peak_value, chip, out=peak_value)
+	count('ppm_correlate_offsets.offsets', num_offsets)
+	return chips_per_symbol - 1 - peak_idx, peak_value, peak_value < threshold
@@ -0,0 +1,237 @@
+# Created 2026/10/17
+
+# Benchmarks for the hot paths: modulation, chip packing, demodulation,
+# packet extraction, .b generation and .arb export. Each case is timed over a
+# grid of PPM orders, bits per chip and payload sizes, reporting symbols/s,
+# MB/s of modulated bits and peak memory (tracemalloc). Results go to a JSON
+# file which can be checked against a stored baseline to flag regressions.
+
+import numpy as np
+import doctest
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from itertools import product
+from ppm_base import ppm_mod_vals, ppm_mod_bits, ppm_bits_to_chips, ppm_demod_bits_vals
+from ppm_filegen import gen_rx_rand_data, gen_tx_data_arb
+from ppm_frame import frame_stream
+from ppm_rx import rx_ppm_packets
+
+# Default grid
+BENCH_CHIPS_PER_SYMBOL = [4, 16, 64, 256]
+BENCH_BITS_PER_CHIP = [1, 2, 4]
+BENCH_NUM_SYMBOLS = [1 << 8, 1 << 12]
+
+# Results which are slower or use more memory than the baseline by more than
+# this fraction are flagged
+BENCH_TOLERANCE = 0.25
+
+def _case_mod_vals(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	values = rng.integers(0, chips_per_symbol, size=num_symbols)
+	return lambda: ppm_mod_vals(values, chips_per_symbol, bits_per_chip)
+
+def _case_mod_bits(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	symbols = rng.integers(0, 2, size=num_symbols*int(np.log2(chips_per_symbol)), dtype=np.uint8)
+	return lambda: ppm_mod_bits(symbols, chips_per_symbol, bits_per_chip)
+
+def _case_bits_to_chips(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	mod_bits = ppm_mod_vals(rng.integers(0, chips_per_symbol, size=num_symbols),
+		chips_per_symbol, bits_per_chip)
+	return lambda: ppm_bits_to_chips(mod_bits, bits_per_chip)
+
+def _case_demod(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	mod_bits = ppm_mod_vals(rng.integers(0, chips_per_symbol, size=num_symbols),
+		chips_per_symbol, bits_per_chip)
+	return lambda: ppm_demod_bits_vals(mod_bits, chips_per_symbol, bits_per_chip)
+
+def _case_rx(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	# Back-to-back 16-octet packets filling roughly num_symbols symbols: the
+	# sync field, the header, 18 octets of data field and the gap
+	bits_per_value = int(np.log2(chips_per_symbol))
+	packet_symbols = 10 + 48//bits_per_value + 18*int(np.ceil(8/bits_per_value)) + 2
+	payloads = list(rng.integers(0, 256, size=(max(1, num_symbols//packet_symbols), 16),
+		dtype=np.uint8))
+	stream = frame_stream(payloads, chips_per_symbol, gap_bits=2*bits_per_value)
+	mod_bits = ppm_mod_bits(stream, chips_per_symbol, bits_per_chip)
+	run = lambda: sum([1 for _ in rx_ppm_packets(mod_bits, chips_per_symbol, bits_per_chip,
+		threshold_ext=2**bits_per_chip-1)])
+	return run, len(stream)//bits_per_value, mod_bits.size
+
+def _case_b_gen(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	outputFile = os.path.join(tmpDir, 'bench.b')
+	def run():
+		np.random.seed(0)
+		gen_rx_rand_data(outputFile, num_symbols, chips_per_symbol, chips_per_symbol,
+			bits_per_chip)
+	return run
+
+def _case_arb(chips_per_symbol, bits_per_chip, num_symbols, rng, tmpDir):
+	inputFile = os.path.join(tmpDir, 'bench_arb.b')
+	np.random.seed(0)
+	gen_rx_rand_data(inputFile, num_symbols, chips_per_symbol, chips_per_symbol, bits_per_chip)
+	return lambda: gen_tx_data_arb(inputFile, os.path.join(tmpDir, 'bench.arb'), 1, 100000)
+
+# name: (setup, whether it depends on the PPM order and bits per chip). A
+# setup returns the function to time, or (function, symbols, bytes of
+# modulated bits) when its input isn't exactly num_symbols symbols.
+BENCH_CASES = {
+	'ppm_mod_vals': (_case_mod_vals, True),
+	'ppm_mod_bits': (_case_mod_bits, True),
+	'ppm_bits_to_chips': (_case_bits_to_chips, True),
+	'ppm_demod_bits_vals': (_case_demod, True),
+	'rx_ppm_packets': (_case_rx, True),
+	'gen_rx_rand_data': (_case_b_gen, True),
+	'gen_tx_data_arb': (_case_arb, False),
+}
+
+def bench_case(name, chips_per_symbol, bits_per_chip, num_symbols, repeat=5,
+				min_time=0.2, seed=0):
+	"""
+	Inputs:
+		name: String. Key of BENCH_CASES.
+		chips_per_symbol, bits_per_chip: PPM order and bits per chip.
+		num_symbols: Integer. Symbols' worth of input per call.
+		repeat: Integer. Number of timed runs. Each run loops the call until
+			'min_time' seconds have passed.
+		min_time: Float. Minimum seconds per timed run.
+		seed: Integer. Seed for the input data.
+	Outputs:
+		Returns a dictionary with the case parameters, 'symbols' (symbols
+		actually processed per call, which only approximates num_symbols for
+		some cases), 'seconds' (best time per call), 'symbols_per_sec',
+		'mb_per_sec' (megabytes of modulated bits, one byte per bit as the
+		arrays hold them) and 'peak_mb' (peak traced allocation during one
+		call).
+
+	>>> r = bench_case('ppm_mod_vals', 16, 2, 1024, repeat=1, min_time=0)
+	>>> sorted(r.keys())[:4], r['symbols_per_sec'] > 0
+	(['bits_per_chip', 'chips_per_symbol', 'mb_per_sec', 'name'], True)
+	>>> bench_case('rx_ppm_packets', 4, 1, 256, repeat=1, min_time=0)['symbols']
+	216
+	"""
+	setup, _ = BENCH_CASES[name]
+	tmpDir = tempfile.mkdtemp(prefix='ppm_bench_')
+	try:
+		func = setup(chips_per_symbol, bits_per_chip, num_symbols,
+			np.random.default_rng(seed), tmpDir)
+		symbols = num_symbols
+		mod_bytes = num_symbols*chips_per_symbol*bits_per_chip
+		if isinstance(func, tuple):
+			func, symbols, mod_bytes = func
+		func()
+
+		best = np.inf
+		for _ in range(repeat):
+			calls = 0
+			start = time.perf_counter()
+			while True:
+				func()
+				calls = calls + 1
+				elapsed = time.perf_counter() - start
+				if elapsed >= min_time:
+					break
+			best = min(best, elapsed/calls)
+
+		# Separate run, since tracing slows everything down
+		tracemalloc.start()
+		func()
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+	finally:
+		shutil.rmtree(tmpDir, ignore_errors=True)
+
+	return dict(name=name, chips_per_symbol=chips_per_symbol, bits_per_chip=bits_per_chip,
+		num_symbols=num_symbols, symbols=symbols, seconds=best, symbols_per_sec=symbols/best,
+		mb_per_sec=mod_bytes/best/1e6, peak_mb=peak/1e6)
+
+def run_benchmarks(names=None, chips_per_symbol=BENCH_CHIPS_PER_SYMBOL,
+				bits_per_chip=BENCH_BITS_PER_CHIP, num_symbols=BENCH_NUM_SYMBOLS,
+				outputFile=None, **kwargs):
+	"""
+	Inputs:
+		names: List of BENCH_CASES keys, or None for all of them.
+		chips_per_symbol, bits_per_chip, num_symbols: Lists of values to run
+			every case over. Cases which don't depend on the PPM order run
+			at 16-PPM, 1 bit per chip only.
+		outputFile: String or None. JSON file to write the results to.
+		kwargs: Passed along to bench_case.
+	Outputs:
+		Returns {'meta': machine/version info, 'results': list of bench_case
+		results}, which is also what goes in the JSON file.
+	"""
+	if names is None:
+		names = list(BENCH_CASES.keys())
+	results = []
+	for name in names:
+		grid = product(chips_per_symbol, bits_per_chip) if BENCH_CASES[name][1] else [(16, 1)]
+		for (cps, bpc), n in product(list(grid), num_symbols):
+			results.append(bench_case(name, cps, bpc, n, **kwargs))
+	report = dict(meta=dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+		python=platform.python_version(), numpy=np.__version__,
+		machine=platform.machine(), processor=platform.processor(),
+		cpu_count=os.cpu_count()), results=results)
+	if outputFile is not None:
+		with open(outputFile, 'w') as f:
+			json.dump(report, f, indent=1)
+	return report
+
+def _bench_key(result):
+	return (result['name'], result['chips_per_symbol'], result['bits_per_chip'],
+		result['num_symbols'])
+
+def compare_baseline(report, baseline, tolerance=BENCH_TOLERANCE):
+	"""
+	Inputs:
+		report: Dictionary from run_benchmarks (or the path to its JSON).
+		baseline: Same, for the stored baseline.
+		tolerance: Float. Allowed fractional slowdown or memory growth.
+	Outputs:
+		Returns a list of (key, metric, baseline value, new value) for every
+		case which got slower (symbols_per_sec) or hungrier (peak_mb) by more
+		than 'tolerance'. Cases missing from either side are skipped.
+
+	>>> old = dict(results=[dict(name='a', chips_per_symbol=16, bits_per_chip=1,
+	...		num_symbols=8, symbols_per_sec=100.0, peak_mb=1.0)])
+	>>> new = dict(results=[dict(old['results'][0], symbols_per_sec=70.0)])
+	>>> compare_baseline(new, old)
+	[(('a', 16, 1, 8), 'symbols_per_sec', 100.0, 70.0)]
+	"""
+	if isinstance(report, str):
+		with open(report, 'r') as f:
+			report = json.load(f)
+	if isinstance(baseline, str):
+		with open(baseline, 'r') as f:
+			baseline = json.load(f)
+	old = dict([(_bench_key(r), r) for r in baseline['results']])
+	regressions = []
+	for r in report['results']:
+		key = _bench_key(r)
+		if key not in old:
+			continue
+		if r['symbols_per_sec'] < old[key]['symbols_per_sec']*(1-tolerance):
+			regressions.append((key, 'symbols_per_sec', old[key]['symbols_per_sec'],
+				r['symbols_per_sec']))
+		# Tiny allocations are all noise
+		if r['peak_mb'] > max(old[key]['peak_mb']*(1+tolerance), old[key]['peak_mb'] + 1):
+			regressions.append((key, 'peak_mb', old[key]['peak_mb'], r['peak_mb']))
+	return regressions
+
+if __name__ == "__main__":
+	outputFile = "bench_results.json"
+	baselineFile = "bench_baseline.json"
+	report = run_benchmarks(outputFile=outputFile)
+	for r in report['results']:
+		print("{name:20s} {chips_per_symbol:4d}-PPM {bits_per_chip} b/chip {symbols:7d} sym"
+			"  {symbols_per_sec:12.0f} sym/s {mb_per_sec:9.1f} MB/s {peak_mb:8.2f} MB".format(**r))
+	if os.path.exists(baselineFile):
+		regressions = compare_baseline(report, baselineFile)
+		for key, metric, old, new in regressions:
+			print("REGRESSION", key, metric, old, "->", new)
+		print("{0} regressions against {1}".format(len(regressions), baselineFile))
+	else:
+		shutil.copyfile(outputFile, baselineFile)
+		print("No baseline yet, saved this run as {0}".format(baselineFile))
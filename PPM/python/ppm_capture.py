@@ -0,0 +1,295 @@
+# Created 2026/10/17
+
+# Reading and writing received captures. Besides the ASCII .b files used by
+# the Verilog testbenches ($readmemb), captures can be stored in a packed
+# binary format (8 bits per byte behind a small header) which is read through
+# np.memmap, so multi-GB SPAD dumps never have to be loaded whole.
+
+import numpy as np
+import doctest
+import struct
+from itertools import islice
+from ppm_instrument import count, timed
+
+# Packed capture header: magic, header size, bits per chip, chips per row,
+# number of bits, bit order (0 = earliest bit in the MSB of a byte), RNG seed
+# (-1 if unknown). Padded out to CAPTURE_HEADER_SIZE bytes.
+CAPTURE_MAGIC = b'SPADCAP1'
+CAPTURE_HEADER_FMT = '<8sIHIQBq'
+CAPTURE_HEADER_SIZE = 64
+BIT_ORDERS = ['big', 'little']
+
+# Chunk size when a reader is handed one big array
+ARRAY_CHUNK_BITS = 1 << 16
+
+def b_rows_to_text(rows):
+	"""
+	Inputs:
+		rows: 2D array of 0 and 1. Each row becomes one line of characters,
+			leftmost column first.
+	Outputs:
+		Returns the ASCII bytes for the rows, newline-terminated, built in
+		one go.
+
+	>>> b_rows_to_text([[0,1,1], [1,0,0]])
+	b'011\\n100\\n'
+	"""
+	rows = np.asarray(rows, dtype=np.uint8)
+	text = np.empty((rows.shape[0], rows.shape[1]+1), dtype=np.uint8)
+	text[:,:-1] = rows + ord('0')
+	text[:,-1] = ord('\n')
+	return text.tobytes()
+
+@timed()
+def read_b_chunks(inputFile, chunk_rows=4096):
+	"""
+	Inputs:
+		inputFile: String. Path to a .b file as written by ppm_filegen, where
+			the LSB (earliest bit) of a row is the rightmost character.
+		chunk_rows: Integer. Number of rows to read in per chunk.
+	Outputs:
+		Generator of uint8 arrays of bits in the order they were received. Only
+		'chunk_rows' rows are held in memory at a time.
+	"""
+	with open(inputFile, 'rb') as f:
+		while True:
+			lines = list(islice(f, chunk_rows))
+			if len(lines) == 0:
+				return
+			buf = b''.join([line.rstrip(b'\r\n')[::-1] for line in lines])
+			count('read_b_chunks.bits', len(buf))
+			yield np.frombuffer(buf, dtype=np.uint8) - ord('0')
+
+def count_b_bits(inputFile, block_bytes=1 << 20):
+	"""
+	Inputs:
+		inputFile: String. Path to a .b file.
+		block_bytes: Integer. Bytes read per block.
+	Outputs:
+		Returns the number of bits in the file, counted a block at a time
+		without parsing any rows.
+	"""
+	num_bits = 0
+	with open(inputFile, 'rb') as f:
+		while True:
+			block = f.read(block_bytes)
+			if len(block) == 0:
+				return num_bits
+			num_bits = num_bits + len(block) - block.count(b'\n') - block.count(b'\r')
+
+def _pack_header(bits_per_chip, chips_per_row, num_bits, bitorder, seed):
+	"""
+	Outputs:
+		Returns the CAPTURE_HEADER_SIZE bytes of a packed capture header.
+	"""
+	header = struct.pack(CAPTURE_HEADER_FMT, CAPTURE_MAGIC, CAPTURE_HEADER_SIZE,
+				bits_per_chip, chips_per_row, num_bits, BIT_ORDERS.index(bitorder),
+				-1 if seed is None else seed)
+	return header + b'\x00'*(CAPTURE_HEADER_SIZE-len(header))
+
+def is_capture_file(inputFile):
+	"""
+	Inputs:
+		inputFile: String. Path to a file.
+	Outputs:
+		Returns True if the file starts with the packed capture magic.
+	"""
+	with open(inputFile, 'rb') as f:
+		return f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+
+def read_capture_header(inputFile):
+	"""
+	Inputs:
+		inputFile: String. Path to a packed capture.
+	Outputs:
+		Returns a dictionary with 'bits_per_chip', 'chips_per_row', 'num_bits',
+		'bitorder' and 'seed' (None if unknown).
+	Raises:
+		ValueError if the file isn't a packed capture.
+	"""
+	with open(inputFile, 'rb') as f:
+		raw = f.read(CAPTURE_HEADER_SIZE)
+	if len(raw) < CAPTURE_HEADER_SIZE or not raw.startswith(CAPTURE_MAGIC):
+		raise ValueError("{0} is not a packed capture".format(inputFile))
+	_, header_size, bits_per_chip, chips_per_row, num_bits, bitorder, seed = \
+		struct.unpack_from(CAPTURE_HEADER_FMT, raw)
+	return dict(header_size=header_size, bits_per_chip=bits_per_chip,
+		chips_per_row=chips_per_row, num_bits=num_bits,
+		bitorder=BIT_ORDERS[bitorder], seed=None if seed == -1 else seed)
+
+def write_capture(outputFile, bits, bits_per_chip, chips_per_row, seed=None,
+				bitorder='big'):
+	"""
+	Inputs:
+		outputFile: String. Path to write the packed capture to.
+		bits: Array of 0 and 1 in the order they were received.
+		bits_per_chip: Integer. Number of bits per chip.
+		chips_per_row: Integer. Chips per row of the equivalent .b file.
+		seed: Integer or None. RNG seed the capture was generated with.
+		bitorder: 'big' or 'little'. Bit order within each packed byte.
+	Outputs:
+		No return value. Writes the header followed by the packed bits.
+	"""
+	bits = np.asarray(bits, dtype=np.uint8).ravel()
+	with open(outputFile, 'wb') as f:
+		f.write(_pack_header(bits_per_chip, chips_per_row, len(bits), bitorder, seed))
+		f.write(np.packbits(bits, bitorder=bitorder).tobytes())
+
+def open_capture(inputFile):
+	"""
+	Inputs:
+		inputFile: String. Path to a packed capture.
+	Outputs:
+		Returns (header, packed) where header is from read_capture_header and
+		packed is a read-only np.memmap of the packed bytes. Nothing is read
+		from disk until it's indexed.
+	"""
+	header = read_capture_header(inputFile)
+	num_bytes = (header['num_bits']+7) // 8
+	if num_bytes == 0:
+		return header, np.zeros(0, dtype=np.uint8)
+	packed = np.memmap(inputFile, dtype=np.uint8, mode='r',
+				offset=header['header_size'], shape=(num_bytes,))
+	return header, packed
+
+def capture_bits(inputFile, start=0, stop=None):
+	"""
+	Inputs:
+		inputFile: String. Path to a packed capture.
+		start: Integer. Index of the first bit to return.
+		stop: Integer or None. One past the last bit to return.
+	Outputs:
+		Returns a uint8 array of bits [start, stop). Only the bytes covering
+		that range are touched.
+	"""
+	header, packed = open_capture(inputFile)
+	if stop is None or stop > header['num_bits']:
+		stop = header['num_bits']
+	if stop <= start:
+		return np.zeros(0, dtype=np.uint8)
+	byte_start = start // 8
+	bits = np.unpackbits(packed[byte_start:(stop+7)//8], bitorder=header['bitorder'])
+	return bits[start-8*byte_start : stop-8*byte_start]
+
+@timed()
+def read_capture_chunks(inputFile, chunk_bits=1 << 20):
+	"""
+	Inputs:
+		inputFile: String. Path to a packed capture.
+		chunk_bits: Integer. Bits per chunk (rounded up to a whole byte).
+	Outputs:
+		Generator of uint8 arrays of bits in the order received, unpacked a
+		chunk at a time from the memory map.
+	"""
+	header, packed = open_capture(inputFile)
+	chunk_bytes = (chunk_bits+7) // 8
+	num_bits = header['num_bits']
+	for byte_start in range(0, len(packed), chunk_bytes):
+		bits = np.unpackbits(packed[byte_start:byte_start+chunk_bytes],
+					bitorder=header['bitorder'])
+		count('read_capture_chunks.bits', min(len(bits), num_bits-8*byte_start))
+		yield bits[:num_bits-8*byte_start]
+
+def iter_bit_chunks(source, chunk_rows=4096):
+	"""
+	Inputs:
+		source: String path to a .b file or packed capture, a NumPy array of
+			bits, or an iterable of NumPy arrays of bits.
+		chunk_rows: Integer. Rows per chunk when reading from a .b file.
+	Outputs:
+		Generator of uint8 arrays of bits in the order they were received.
+
+	>>> [c.tolist() for c in iter_bit_chunks([[1, 0], np.array([1])])]
+	[[1, 0], [1]]
+	"""
+	if isinstance(source, str) and is_capture_file(source):
+		yield from read_capture_chunks(source)
+	elif isinstance(source, str):
+		yield from read_b_chunks(source, chunk_rows)
+	elif isinstance(source, np.ndarray):
+		source = np.asarray(source, dtype=np.uint8).ravel()
+		for i in range(0, len(source), ARRAY_CHUNK_BITS):
+			yield source[i:i+ARRAY_CHUNK_BITS]
+	else:
+		for chunk in source:
+			yield np.asarray(chunk, dtype=np.uint8).ravel()
+
+def b_to_capture(inputFile, outputFile, bits_per_chip, seed=None, bitorder='big',
+				chunk_rows=4096):
+	"""
+	Inputs:
+		inputFile: String. Path to an existing .b file.
+		outputFile: String. Path to write the packed capture to.
+		bits_per_chip: Integer. Number of bits per chip.
+		seed: Integer or None. RNG seed to record in the header.
+		bitorder: 'big' or 'little'. Bit order within each packed byte.
+		chunk_rows: Integer. Rows converted per chunk.
+	Outputs:
+		No return value. Streams the .b file into a packed capture. The
+		conversion is lossless; see capture_to_b.
+	"""
+	with open(inputFile, 'rb') as f:
+		bits_per_row = len(f.readline().rstrip(b'\r\n'))
+	with open(outputFile, 'wb') as f:
+		f.write(_pack_header(bits_per_chip, bits_per_row // bits_per_chip, 0,
+					bitorder, seed))
+		num_bits = 0
+		leftover = np.zeros(0, dtype=np.uint8)
+		for chunk in read_b_chunks(inputFile, chunk_rows):
+			num_bits = num_bits + len(chunk)
+			bits = np.concatenate((leftover, chunk))
+			whole = 8*(len(bits)//8)
+			f.write(np.packbits(bits[:whole], bitorder=bitorder).tobytes())
+			leftover = bits[whole:]
+		f.write(np.packbits(leftover, bitorder=bitorder).tobytes())
+		# The bit count is only known at the end
+		f.seek(0)
+		f.write(_pack_header(bits_per_chip, bits_per_row // bits_per_chip, num_bits,
+					bitorder, seed))
+
+def capture_to_b(inputFile, outputFile, chunk_rows=4096):
+	"""
+	Inputs:
+		inputFile: String. Path to a packed capture.
+		outputFile: String. Path to write the .b file to.
+		chunk_rows: Integer. Rows converted per chunk.
+	Outputs:
+		No return value. Streams the capture back out as a .b file (earliest
+		bit of each row on the right) so the $readmemb testbenches can use it.
+		An empty capture gives an empty file.
+	Raises:
+		ValueError if the capture isn't a whole number of rows.
+
+	>>> import os, tempfile
+	>>> d = tempfile.mkdtemp()
+	>>> with open(os.path.join(d, 'a.b'), 'w') as f:
+	...     _ = f.write('0001\\n1000\\n0110\\n')
+	>>> b_to_capture(os.path.join(d, 'a.b'), os.path.join(d, 'a.cap'), 2, seed=7)
+	>>> header = read_capture_header(os.path.join(d, 'a.cap'))
+	>>> header['num_bits'], header['chips_per_row'], header['seed']
+	(12, 2, 7)
+	>>> capture_bits(os.path.join(d, 'a.cap')).tolist()
+	[1, 0, 0, 0, 0, 0, 0, 1, 0, 1, 1, 0]
+	>>> capture_to_b(os.path.join(d, 'a.cap'), os.path.join(d, 'b.b'))
+	>>> open(os.path.join(d, 'b.b')).read() == open(os.path.join(d, 'a.b')).read()
+	True
+	>>> _ = open(os.path.join(d, 'empty.b'), 'w').close()
+	>>> b_to_capture(os.path.join(d, 'empty.b'), os.path.join(d, 'empty.cap'), 2)
+	>>> capture_to_b(os.path.join(d, 'empty.cap'), os.path.join(d, 'c.b'))
+	>>> open(os.path.join(d, 'c.b')).read()
+	''
+	"""
+	header = read_capture_header(inputFile)
+	if header['num_bits'] == 0:
+		# Nothing to write, and no row width to go by
+		open(outputFile, 'wb').close()
+		return
+	bits_per_row = header['bits_per_chip']*header['chips_per_row']
+	if header['num_bits'] % bits_per_row != 0:
+		raise ValueError("{0} bits is not a whole number of {1}-bit rows".format(
+			header['num_bits'], bits_per_row))
+	# Whole rows and whole bytes in every chunk
+	chunk_rows = 8*((chunk_rows+7) // 8)
+	with open(outputFile, 'wb') as f:
+		for chunk in read_capture_chunks(inputFile, chunk_rows*bits_per_row):
+			f.write(b_rows_to_text(chunk.reshape(-1, bits_per_row)[:,::-1]))
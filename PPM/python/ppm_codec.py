@@ -0,0 +1,231 @@
+# Created 2026/10/17
+
+# Table-driven PPM codec. Everything that depends only on the PPM order, bits
+# per chip, chip ordering and symbol mapping (binary or Gray) is built once
+# and cached, so modulation is a gather of chip patterns and demodulation is
+# an argmax followed by a gather of bits. Supports any power-of-two order up
+# to CODEC_MAX_CHIPS.
+
+import numpy as np
+import doctest
+from functools import lru_cache
+from ppm_base import bits_to_ints, int_log2, ppm_vals_to_bits
+
+CODEC_MAX_CHIPS = 4096
+
+# Above this many bytes the (symbol, modulated bits) pattern table isn't
+# kept and modulation scatters the pulses instead
+CODEC_PATTERN_MAX_BYTES = 1 << 20
+
+def gray_encode(values):
+	"""
+	Inputs:
+		values: Collection of non-negative integers.
+	Outputs:
+		Returns the binary-reflected Gray codes of 'values' as an int64 array.
+
+	>>> gray_encode(range(8)).tolist()
+	[0, 1, 3, 2, 6, 7, 5, 4]
+	"""
+	values = np.asarray(values, dtype=np.int64)
+	return values ^ (values >> 1)
+
+def gray_decode(codes, bits_per_symbol):
+	"""
+	Inputs:
+		codes: Collection of Gray codes.
+		bits_per_symbol: Integer. Width of the codes.
+	Outputs:
+		Returns the integers whose Gray codes are 'codes' (inverse of
+		gray_encode) as an int64 array.
+
+	>>> gray_decode(gray_encode(range(8)), 3).tolist()
+	[0, 1, 2, 3, 4, 5, 6, 7]
+	"""
+	values = np.asarray(codes, dtype=np.int64).copy()
+	shift = 1
+	while shift < bits_per_symbol:
+		values ^= values >> shift
+		shift = shift << 1
+	return values
+
+@lru_cache(maxsize=64)
+def ppm_codec(chips_per_symbol, bits_per_chip, mode=None, gray=False):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. PPM order, a power of two no larger than
+			CODEC_MAX_CHIPS.
+		bits_per_chip: Integer. Number of bits associated with a single chip.
+		mode: 'rev' means the LSB of a symbol goes in the 0th index, otherwise
+			the MSB goes in the 0th index (same as ppm_mod_vals).
+		gray: Boolean. If True, values are Gray coded before picking the
+			pulse position, so neighbouring chips differ by a single bit.
+	Outputs:
+		Returns a dictionary of read-only tables, built once per set of
+		arguments and cached:
+		'bits_per_symbol': Integer. log2(chips_per_symbol).
+		'chip_of_value': Pulse chip index for each value.
+		'value_of_chip': Value for each pulse chip index.
+		'bits_of_chip': (chips_per_symbol, bits_per_symbol) uint8 array of
+			the demodulated bits (MSB first) for each pulse chip index.
+		'patterns': (chips_per_symbol, chips_per_symbol*bits_per_chip)
+			uint8 array of the modulated bits for each value, or None if it
+			would be larger than CODEC_PATTERN_MAX_BYTES.
+	Raises:
+		ValueError if chips_per_symbol isn't a supported power of two.
+
+	>>> codec = ppm_codec(4, 1, gray=True)
+	>>> codec['chip_of_value'].tolist(), codec['bits_of_chip'][3].tolist()
+	([3, 2, 0, 1], [0, 0])
+	>>> ppm_codec(4, 1, gray=True) is codec
+	True
+	"""
+	bits_per_symbol = int_log2(chips_per_symbol)
+	if chips_per_symbol < 2 or chips_per_symbol != 1 << bits_per_symbol \
+			or chips_per_symbol > CODEC_MAX_CHIPS:
+		raise ValueError("Chips per symbol {0} not a power of two from 2 to {1}".format(
+			chips_per_symbol, CODEC_MAX_CHIPS))
+
+	values = np.arange(chips_per_symbol, dtype=np.int64)
+	symbols = gray_encode(values) if gray else values
+	if mode == 'rev':
+		chip_of_value = symbols
+	else:
+		chip_of_value = chips_per_symbol - 1 - symbols
+	value_of_chip = np.empty_like(chip_of_value)
+	value_of_chip[chip_of_value] = values
+	bits_of_chip = ppm_vals_to_bits(value_of_chip, bits_per_symbol).reshape(
+		chips_per_symbol, bits_per_symbol)
+
+	patterns = None
+	if chips_per_symbol*chips_per_symbol*bits_per_chip <= CODEC_PATTERN_MAX_BYTES:
+		patterns = np.zeros((chips_per_symbol, chips_per_symbol, bits_per_chip), dtype=np.uint8)
+		patterns[values, chip_of_value, :] = 1
+		patterns = patterns.reshape(chips_per_symbol, -1)
+
+	codec = dict(bits_per_symbol=bits_per_symbol, chip_of_value=chip_of_value,
+		value_of_chip=value_of_chip, bits_of_chip=bits_of_chip, patterns=patterns)
+	for table in codec.values():
+		if isinstance(table, np.ndarray):
+			table.setflags(write=False)
+	return codec
+
+def codec_mod_vals(values, chips_per_symbol, bits_per_chip, mode=None, gray=False):
+	"""
+	Inputs:
+		values: Collection of integers (not bits) to encode.
+		chips_per_symbol, bits_per_chip, mode, gray: See ppm_codec.
+	Outputs:
+		Returns a flattened uint8 array of the modulated bits, identical to
+		ppm_mod_vals when gray is False.
+	Raises:
+		UserWarning if a value doesn't fit in a symbol.
+
+	>>> from ppm_base import ppm_mod_vals
+	>>> values = np.arange(16)
+	>>> np.array_equal(codec_mod_vals(values, 16, 2, 'rev'), ppm_mod_vals(values, 16, 2, 'rev'))
+	True
+	>>> codec_mod_vals([2], 4, 1, gray=True).tolist()
+	[1, 0, 0, 0]
+	"""
+	codec = ppm_codec(chips_per_symbol, bits_per_chip, mode, gray)
+	values = np.asarray(values, dtype=np.int64).ravel()
+	out_of_range = (values >= chips_per_symbol) | (values < 0)
+	if np.any(out_of_range):
+		raise UserWarning("{0} > Max {1}".format(values[out_of_range][0],
+							chips_per_symbol))
+
+	if codec['patterns'] is not None:
+		return codec['patterns'][values].ravel()
+	mod_values = np.zeros((len(values), chips_per_symbol, bits_per_chip), dtype=np.uint8)
+	mod_values[np.arange(len(values)), codec['chip_of_value'][values], :] = 1
+	return mod_values.ravel()
+
+def codec_mod_bits(bits, chips_per_symbol, bits_per_chip, mode=None, gray=False):
+	"""
+	Inputs:
+		bits: Flattened collection of 0 and 1, MSB of each symbol first.
+		chips_per_symbol, bits_per_chip, mode, gray: See ppm_codec.
+	Outputs:
+		Returns a flattened uint8 array of the modulated bits.
+	Raises:
+		ValueError if 'bits' isn't a whole number of symbols.
+
+	>>> codec_mod_bits([0,1, 1,0], 4, 2).tolist()
+	[0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0]
+	"""
+	bits_per_symbol = ppm_codec(chips_per_symbol, bits_per_chip, mode, gray)['bits_per_symbol']
+	bits = np.asarray(bits, dtype=np.uint8).ravel()
+	if len(bits) % bits_per_symbol != 0:
+		raise ValueError("{0} bits not divisible by {1}".format(len(bits), bits_per_symbol))
+	return codec_mod_vals(bits_to_ints(bits, bits_per_symbol), chips_per_symbol,
+		bits_per_chip, mode, gray)
+
+def _peak_chips(mod_bits, chips_per_symbol, bits_per_chip):
+	"""
+	Outputs:
+		Returns the index of the largest chip of each symbol, earliest chip
+		on ties (same as ppm_correlate_bits).
+	"""
+	mod_bits = np.asarray(mod_bits, dtype=np.uint8).ravel()
+	bits_per_symbol = chips_per_symbol*bits_per_chip
+	if len(mod_bits) % bits_per_symbol != 0:
+		raise ValueError("{0} received bits not divisible by {1}".format(len(mod_bits),
+							bits_per_symbol))
+	chips = bits_to_ints(mod_bits, bits_per_chip).reshape(-1, chips_per_symbol)
+	return np.argmax(chips, axis=1)
+
+def codec_demod_vals(mod_bits, chips_per_symbol, bits_per_chip, mode=None, gray=False):
+	"""
+	Inputs:
+		mod_bits: Collection of received bits, a whole number of symbols.
+		chips_per_symbol, bits_per_chip, mode, gray: See ppm_codec.
+	Outputs:
+		Returns an int64 array of the demodulated values.
+	Raises:
+		ValueError if the number of bits received does not contain an integer
+		number of symbols.
+
+	>>> values = np.arange(4096)
+	>>> mod_bits = codec_mod_vals(values, 4096, 1, gray=True)
+	>>> np.array_equal(codec_demod_vals(mod_bits, 4096, 1, gray=True), values)
+	True
+	"""
+	codec = ppm_codec(chips_per_symbol, bits_per_chip, mode, gray)
+	return codec['value_of_chip'][_peak_chips(mod_bits, chips_per_symbol, bits_per_chip)]
+
+def codec_demod_bits(mod_bits, chips_per_symbol, bits_per_chip, mode=None, gray=False):
+	"""
+	Inputs:
+		mod_bits, chips_per_symbol, bits_per_chip, mode, gray: See
+			codec_demod_vals.
+	Outputs:
+		Returns a flattened uint8 array of the demodulated bits, MSB of each
+		symbol first.
+
+	>>> bits = np.random.default_rng(0).integers(0, 2, size=60, dtype=np.uint8)
+	>>> mod_bits = codec_mod_bits(bits, 32, 2, 'rev', gray=True)
+	>>> np.array_equal(codec_demod_bits(mod_bits, 32, 2, 'rev', gray=True), bits)
+	True
+	"""
+	codec = ppm_codec(chips_per_symbol, bits_per_chip, mode, gray)
+	return codec['bits_of_chip'][_peak_chips(mod_bits, chips_per_symbol, bits_per_chip)].ravel()
+
+if __name__ == "__main__":
+	# Round trip and timing against the string-free base functions
+	import time
+	from ppm_base import ppm_mod_bits, ppm_demod_bits_vals
+	rng = np.random.default_rng(0)
+	for chips_per_symbol in [16, 256, 4096]:
+		bits_per_symbol = int_log2(chips_per_symbol)
+		bits = rng.integers(0, 2, size=bits_per_symbol*(1 << 14), dtype=np.uint8)
+		start = time.perf_counter()
+		mod_bits = ppm_mod_bits(bits, chips_per_symbol, 1)
+		values = ppm_demod_bits_vals(mod_bits, chips_per_symbol, 1)
+		t_base = time.perf_counter() - start
+		start = time.perf_counter()
+		mod_bits = codec_mod_bits(bits, chips_per_symbol, 1, gray=True)
+		bits_out = codec_demod_bits(mod_bits, chips_per_symbol, 1, gray=True)
+		t_codec = time.perf_counter() - start
+		print(chips_per_symbol, np.array_equal(bits, bits_out),
+			"{0:.4f}s base, {1:.4f}s codec".format(t_base, t_codec))
@@ -0,0 +1,296 @@
+# Created 2026/10/17
+
+# Time-correlated fading for the optical channel: scintillation (log-normal
+# or gamma-gamma) and pointing jitter (through point_base's L_point), as a
+# power gain sequence over link time. Correlated Gaussian processes are made
+# by filtering white noise in the frequency domain, at a rate set by the
+# coherence time rather than the chip rate, and the gain is interpolated up
+# to the chips as they're pushed through the photon-counting channel. That
+# way seconds of link time at full chip rate only cost a few thousand FFT
+# samples plus O(1) work per chip.
+
+import numpy as np
+import doctest
+import os
+import sys
+from ppm_sim import channel_bits
+
+# point_base.py lives in the pointing folder next to this one
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+	'pointing', 'python'))
+from point_base import calc_theta_e2, interp_L_point
+
+# Fading samples per coherence time. The gain is linearly interpolated in
+# between, so this only has to resolve the fastest fades.
+FADING_SAMPLES_PER_COHERENCE = 32
+
+# Extra coherence times generated past each end so the circular FFT filter
+# doesn't correlate the end of a sequence with its start
+FADING_PAD_COHERENCE = 4
+
+SCINTILLATION_MODELS = [None, 'lognormal', 'gamma-gamma']
+
+def correlated_gaussian(num_samples, corr_samples, rng=None):
+	"""
+	Inputs:
+		num_samples: Integer. Length of the sequence.
+		corr_samples: Float. Correlation time in samples. The autocorrelation
+			is exp(-(lag/corr_samples)**2).
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a stationary, zero-mean, unit-variance Gaussian sequence,
+		made by shaping the spectrum of white noise with one real FFT and
+		its inverse, i.e. O(n log n).
+
+	>>> g = correlated_gaussian(1 << 16, 20, rng=np.random.default_rng(0))
+	>>> round(float(g.std()), 1), round(float(np.mean(g[20:]*g[:-20])), 1)
+	(1.0, 0.4)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	pad = int(np.ceil(FADING_PAD_COHERENCE*corr_samples))
+	n = num_samples + pad
+	# Gaussian autocorrelation <-> Gaussian power spectrum
+	freq = np.fft.rfftfreq(n)
+	H = np.exp(-(np.pi*freq*corr_samples)**2/2)
+	# Normalize to unit variance over the full (two-sided) spectrum
+	weights = np.full(len(H), 2.0)
+	weights[0] = 1
+	if n % 2 == 0:
+		weights[-1] = 1
+	H = H/np.sqrt((weights*H**2).sum()/n)
+	return np.fft.irfft(np.fft.rfft(rng.standard_normal(n))*H, n)[:num_samples]
+
+def _gaussian_to_marginal(g, samples):
+	"""
+	Outputs:
+		Returns 'samples' rearranged to follow the ranks of 'g', so the
+		result has exactly the marginal distribution of 'samples' and the
+		time correlation (rank-wise) of 'g'.
+	"""
+	out = np.empty(len(g))
+	out[np.argsort(g)] = np.sort(samples)
+	return out
+
+def gamma_gamma_params(rytov_var):
+	"""
+	Inputs:
+		rytov_var: Float. Rytov variance of the path (plane wave).
+	Outputs:
+		Returns (alpha, beta), the effective numbers of large- and small-scale
+		eddies for the gamma-gamma model (Andrews & Phillips).
+
+	>>> [round(x, 2) for x in gamma_gamma_params(1.0)]
+	[4.39, 2.56]
+	"""
+	s = rytov_var**(6/5)
+	alpha = 1/(np.exp(0.49*rytov_var/(1 + 1.11*s)**(7/6)) - 1)
+	beta = 1/(np.exp(0.51*rytov_var/(1 + 0.69*s)**(5/6)) - 1)
+	return float(alpha), float(beta)
+
+def scintillation_gain(num_samples, corr_samples, model='lognormal', sigma_I2=0.1,
+				alpha=None, beta=None, rng=None):
+	"""
+	Inputs:
+		num_samples: Integer. Length of the sequence.
+		corr_samples: Float. Coherence time in samples.
+		model: 'lognormal' (weak turbulence) or 'gamma-gamma' (moderate to
+			strong).
+		sigma_I2: Float. Scintillation index for the log-normal model.
+		alpha, beta: Floats. Gamma-gamma parameters (see gamma_gamma_params).
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a unit-mean irradiance sequence. Log-normal is the
+		exponential of a correlated Gaussian. Gamma-gamma is the product of
+		two unit-mean gamma draws, reordered to follow two independent
+		correlated Gaussians so its marginal is exact.
+	Raises:
+		ValueError for an unknown model.
+
+	>>> I = scintillation_gain(1 << 16, 50, 'gamma-gamma', alpha=4.0, beta=2.0,
+	...		rng=np.random.default_rng(0))
+	>>> round(float(I.mean()), 1), round(float(I.var()/I.mean()**2), 1)
+	(1.0, 0.9)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if model == 'lognormal':
+		sigma2 = np.log(1 + sigma_I2)
+		g = correlated_gaussian(num_samples, corr_samples, rng)
+		return np.exp(np.sqrt(sigma2)*g - sigma2/2)
+	if model == 'gamma-gamma':
+		large = _gaussian_to_marginal(correlated_gaussian(num_samples, corr_samples, rng),
+			rng.gamma(alpha, 1/alpha, size=num_samples))
+		small = _gaussian_to_marginal(correlated_gaussian(num_samples, corr_samples, rng),
+			rng.gamma(beta, 1/beta, size=num_samples))
+		return large*small
+	raise ValueError("Unknown scintillation model {0}, use one of {1}".format(model,
+		SCINTILLATION_MODELS))
+
+def pointing_gain(num_samples, corr_samples, sigma_theta, z, r_RX, z_range=None,
+				theta_bias=0, M=None, lamb=None, n=None, w_0=None, theta_e2=None,
+				rng=None):
+	"""
+	Inputs:
+		num_samples: Integer. Length of the sequence.
+		corr_samples: Float. Correlation time of the jitter in samples.
+		sigma_theta: Float. Standard deviation in radians of the pointing
+			jitter along each of the two axes.
+		z: Float. Distance in meters between TX and RX.
+		r_RX: Float. Radius of the RX aperture in meters.
+		z_range: (z_min, z_max) of point_base's cached L_point table, or None
+			for z/2 to 2z.
+		theta_bias: Float. Static pointing offset in radians along one axis.
+		M, lamb, n, w_0, theta_e2: Beam parameters, see point_base.calc_sigma.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns the fraction of power kept, 1-L_point, as the beam wanders
+		(same convention as the L_point input of link_base.calc_rx_power,
+		which should then be 0).
+
+	>>> T = pointing_gain(4096, 100, 2e-5, 1e3, .01, theta_e2=1e-4, rng=np.random.default_rng(0))
+	>>> T.shape, bool(((T > 0) & (T <= 1)).all())
+	((4096,), True)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if theta_e2 is None:
+		theta_e2 = calc_theta_e2(M, lamb, n, w_0)
+	if z_range is None:
+		z_range = (z/2, 2*z)
+	theta_x = theta_bias + sigma_theta*correlated_gaussian(num_samples, corr_samples, rng)
+	theta_y = sigma_theta*correlated_gaussian(num_samples, corr_samples, rng)
+	theta_max = max(3*theta_e2, float(np.abs(theta_bias)) + 6*sigma_theta)
+	return 1 - interp_L_point(np.hypot(theta_x, theta_y), z, r_RX, z_range,
+		theta_e2=theta_e2, theta_max=theta_max)
+
+def fading_gain(duration, coherence_time, scintillation='lognormal', sigma_I2=0.1,
+				alpha=None, beta=None, pointing=None, pointing_time=None,
+				samples_per_coherence=FADING_SAMPLES_PER_COHERENCE, rng=None):
+	"""
+	Inputs:
+		duration: Float. Seconds of link time.
+		coherence_time: Float. Scintillation coherence time in seconds
+			(typically around a millisecond).
+		scintillation: One of SCINTILLATION_MODELS. See scintillation_gain
+			for sigma_I2, alpha and beta.
+		pointing: Dictionary or None. pointing_gain arguments (sigma_theta,
+			z, r_RX and the beam), or None for perfect pointing.
+		pointing_time: Float or None. Correlation time of the pointing
+			jitter in seconds. Defaults to coherence_time.
+		samples_per_coherence: Integer. Gain samples per (shorter) coherence
+			time.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns (sample_rate, gain): the power gain sequence sampled at
+		sample_rate Hz over 'duration'. Feed it to fading_chips to scale the
+		signal photons chip by chip.
+
+	>>> sample_rate, gain = fading_gain(1.0, 1e-3, rng=np.random.default_rng(0))
+	>>> sample_rate, len(gain), round(float(gain.mean()), 2)
+	(32000.0, 32001, 1.01)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if pointing_time is None:
+		pointing_time = coherence_time
+	sample_rate = samples_per_coherence/min(coherence_time, pointing_time)
+	num_samples = int(np.ceil(duration*sample_rate)) + 1
+
+	gain = np.ones(num_samples)
+	if scintillation is not None:
+		gain = gain*scintillation_gain(num_samples, coherence_time*sample_rate,
+			scintillation, sigma_I2=sigma_I2, alpha=alpha, beta=beta, rng=rng)
+	if pointing is not None:
+		gain = gain*pointing_gain(num_samples, pointing_time*sample_rate, rng=rng, **pointing)
+	return sample_rate, gain
+
+def chip_gain(gain, sample_rate, chip_rate, chip_start, num_chips):
+	"""
+	Inputs:
+		gain, sample_rate: From fading_gain.
+		chip_rate: Float. Chips per second.
+		chip_start: Integer. Index of the first chip (time chip_start/chip_rate).
+		num_chips: Integer. Number of chips.
+	Outputs:
+		Returns the gain at each chip, linearly interpolated.
+
+	>>> chip_gain(np.array([1.0, 3.0]), 1.0, 4.0, 1, 3).tolist()
+	[1.5, 2.0, 2.5]
+	"""
+	t = (chip_start + np.arange(num_chips))*(sample_rate/chip_rate)
+	return np.interp(t, np.arange(len(gain)), gain)
+
+def fading_chips(chunks, bits_per_chip, chip_rate, gain, sample_rate, photons_signal,
+				photons_bg=0, sigma_bg=0, rng=None):
+	"""
+	Inputs:
+		chunks: Iterable of arrays of modulated bits (a whole number of chips
+			each) in the order they're sent, e.g. a 2D array with one packet
+			per row, or one flat array.
+		bits_per_chip: Integer. Number of bits per chip.
+		chip_rate: Float. Chips per second.
+		gain, sample_rate: From fading_gain, covering the whole stream.
+		photons_signal: Float. Mean signal photons in a pulse chip without
+			fading.
+		photons_bg, sigma_bg: See ppm_sim.channel_bits. Background isn't
+			faded.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Generator of arrays of received bits, one per chunk, with each
+		chip's signal photons scaled by the fading gain at its time. Only
+		one chunk is in memory at a time, so it can run for seconds of link
+		time, and plugs straight into ppm_rx.rx_ppm_packets.
+
+	>>> from ppm_base import ppm_mod_vals
+	>>> tx = ppm_mod_vals(np.zeros(4, dtype=int), 4, 2)
+	>>> gain = np.array([0.0, 0.0, 1.0, 1.0])
+	>>> rx = np.concatenate(list(fading_chips(tx, 2, 4.0, gain, 1.0, 100.0)))
+	>>> rx.reshape(4, -1).sum(axis=1).tolist()
+	[0, 2, 2, 2]
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if isinstance(chunks, np.ndarray) and chunks.ndim == 1:
+		chunks = [chunks]
+	chip_start = 0
+	for chunk in chunks:
+		chunk = np.asarray(chunk, dtype=np.uint8).ravel()
+		num_chips = len(chunk) // bits_per_chip
+		g = chip_gain(gain, sample_rate, chip_rate, chip_start, num_chips)
+		yield channel_bits(chunk, bits_per_chip, sigma_bg=sigma_bg,
+			photons_signal=photons_signal*g, photons_bg=photons_bg, rng=rng)
+		chip_start = chip_start + num_chips
+
+if __name__ == "__main__":
+	# One second of 16-PPM at 100 Mchips/s through moderate turbulence and
+	# pointing jitter, back to back packets, and how bursty the losses are
+	import time
+	from ppm_base import ppm_mod_bits, ppm_correlate_bits, ppm_vals_to_bits
+	from ppm_sim import sim_packet_bits
+	rng = np.random.default_rng(0)
+	chip_rate = 1e8
+	chips_per_symbol = 16
+	bits_per_chip = 2
+	alpha, beta = gamma_gamma_params(0.5)
+	start = time.perf_counter()
+	sample_rate, gain = fading_gain(1.0, 1e-3, 'gamma-gamma', alpha=alpha, beta=beta,
+		pointing=dict(sigma_theta=1e-5, z=1e3, r_RX=.01, theta_e2=1e-4),
+		pointing_time=1e-2, rng=rng)
+	print("{0} gain samples in {1:.2f}s, mean {2:.3f}".format(len(gain),
+		time.perf_counter()-start, gain.mean()))
+
+	packets, _ = sim_packet_bits(4096, chips_per_symbol, rng=rng)
+	tx = ppm_mod_bits(packets, chips_per_symbol, bits_per_chip).reshape(len(packets), -1)
+	packet_errors = []
+	start = time.perf_counter()
+	for n, rx in enumerate(fading_chips(tx, bits_per_chip, chip_rate, gain, sample_rate, 8.0,
+			photons_bg=0.01, rng=rng)):
+		symbols, _, _ = ppm_correlate_bits(rx, chips_per_symbol, bits_per_chip)
+		packet_errors.append(not np.array_equal(ppm_vals_to_bits(symbols, 4), packets[n]))
+	packet_errors = np.array(packet_errors)
+	print("{0} packets in {1:.2f}s, PER {2:.3f}".format(len(packets),
+		time.perf_counter()-start, packet_errors.mean()))
+	# Back-to-back errors are far more likely than the PER alone suggests
+	both = np.mean(packet_errors[1:] & packet_errors[:-1])
+	print("P(error | previous error) = {0:.3f}".format(both/max(packet_errors.mean(), 1e-12)))
@@ -0,0 +1,298 @@
+# Created 2026/10/17
+
+# Forward error correction for the packet payload: the K=7 (171, 133)
+# convolutional code, punctured to the usual higher rates, a block
+# interleaver to break up bursts (a wrong PPM symbol takes out log2(M) bits
+# at once), and a Viterbi decoder which runs a whole batch of packets through
+# the trellis together. The decoder takes hard bits or the soft LLRs from
+# ppm_soft.
+
+import numpy as np
+import doctest
+from ppm_base import ppm_mod_bits, ppm_correlate_bits, ppm_vals_to_bits
+from ppm_sim import channel_bits, wilson_interval
+from ppm_soft import ppm_soft_bits, llr_to_bits
+
+# Constraint length and generator polynomials (octal 171, 133); the MSB taps
+# the newest input bit
+CONV_K = 7
+CONV_GENERATORS = [0o171, 0o133]
+CONV_STATES = 1 << (CONV_K-1)
+
+# Puncturing patterns: one row per generator, a 1 where the coded bit is sent
+PUNCTURE_PATTERNS = {
+	'1/2': [[1], [1]],
+	'2/3': [[1, 0], [1, 1]],
+	'3/4': [[1, 0, 1], [1, 1, 0]],
+	'5/6': [[1, 0, 1, 0, 1], [1, 1, 0, 1, 0]],
+	'7/8': [[1, 0, 0, 0, 1, 0, 1], [1, 1, 1, 1, 0, 1, 0]],
+}
+
+def _parity(x):
+	"""
+	Outputs:
+		Returns the parity of every entry of the integer array x.
+	"""
+	x = np.asarray(x, dtype=np.int64)
+	p = np.zeros_like(x)
+	while x.any():
+		p ^= x & 1
+		x = x >> 1
+	return p
+
+def fec_code_rate(rate):
+	"""
+	Inputs:
+		rate: String. Key of PUNCTURE_PATTERNS.
+	Outputs:
+		Returns the code rate as a float (before the tail bits), e.g. to
+		scale the data rate in a link budget.
+
+	>>> [fec_code_rate(r) for r in ['1/2', '3/4']]
+	[0.5, 0.75]
+	"""
+	pattern = np.asarray(PUNCTURE_PATTERNS[rate])
+	return pattern.shape[1]/pattern.sum()
+
+def _puncture_mask(num_steps, rate):
+	"""
+	Outputs:
+		Returns a boolean array over the 2*num_steps mother code bits
+		(generator outputs interleaved step by step), True where it's sent.
+	"""
+	pattern = np.asarray(PUNCTURE_PATTERNS[rate], dtype=bool)
+	reps = -(-num_steps // pattern.shape[1])
+	return np.tile(pattern, reps)[:, :num_steps].T.ravel()
+
+def fec_coded_length(num_bits, rate='1/2'):
+	"""
+	Inputs:
+		num_bits: Integer. Number of information bits.
+		rate: String. Key of PUNCTURE_PATTERNS.
+	Outputs:
+		Returns the number of coded bits fec_encode makes from them,
+		including the CONV_K-1 tail bits which return the encoder to state 0.
+
+	>>> fec_coded_length(100, '1/2'), fec_coded_length(100, '3/4')
+	(212, 142)
+	"""
+	return int(_puncture_mask(num_bits+CONV_K-1, rate).sum())
+
+def interleave_perm(length, depth):
+	"""
+	Inputs:
+		length: Integer. Number of bits.
+		depth: Integer. Number of rows of the block interleaver.
+	Outputs:
+		Returns the permutation which writes the bits row by row into
+		'depth' rows and reads them out column by column, so neighbouring
+		bits end up about length/depth apart. Works for any length.
+
+	>>> interleave_perm(7, 3).tolist()
+	[0, 3, 6, 1, 4, 2, 5]
+	"""
+	return np.concatenate([np.arange(r, length, depth) for r in range(depth)])
+
+def fec_encode(bits, rate='1/2', interleave_depth=None):
+	"""
+	Inputs:
+		bits: Array of information bits, one packet per row (or 1D for one).
+		rate: String. Key of PUNCTURE_PATTERNS.
+		interleave_depth: Integer or None. Rows of the block interleaver, or
+			None for no interleaving.
+	Outputs:
+		Returns the coded bits as a uint8 array, one row per packet, of
+		fec_coded_length(bits) columns. The encoder starts in state 0 and
+		is flushed back to it with CONV_K-1 zeros.
+
+	>>> fec_encode([1, 0, 1, 1]).tolist()
+	[1, 1, 1, 0, 0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 1, 1, 0, 1, 1]
+	"""
+	bits = np.asarray(bits, dtype=np.uint8)
+	shape = bits.shape
+	bits = bits.reshape(-1, shape[-1])
+	u = np.pad(bits, ((0, 0), (CONV_K-1, CONV_K-1)))
+	num_steps = shape[-1] + CONV_K-1
+
+	# Each generator output is the XOR of the delayed inputs it taps
+	coded = np.zeros((bits.shape[0], num_steps, len(CONV_GENERATORS)), dtype=np.uint8)
+	for j, g in enumerate(CONV_GENERATORS):
+		for delay in range(CONV_K):
+			if (g >> (CONV_K-1-delay)) & 1:
+				coded[:, :, j] ^= u[:, CONV_K-1-delay:CONV_K-1-delay+num_steps]
+	coded = coded.reshape(bits.shape[0], -1)[:, _puncture_mask(num_steps, rate)]
+
+	if interleave_depth is not None:
+		coded = coded[:, interleave_perm(coded.shape[1], interleave_depth)]
+	return coded.reshape(shape[:-1] + (coded.shape[-1],))
+
+def _trellis():
+	"""
+	Outputs:
+		Returns (prev, outputs): for every next state and the low bit b of
+		the state it came from, the previous state (CONV_STATES, 2) and the
+		+1/-1 signs of the generator outputs (CONV_STATES, 2, generators),
+		+1 for a 0. The state is the last CONV_K-1 inputs, newest in the MSB.
+	"""
+	next_state = np.arange(CONV_STATES).reshape(-1, 1)
+	b = np.arange(2).reshape(1, -1)
+	prev = ((next_state & (CONV_STATES//2 - 1)) << 1) | b
+	register = (next_state << 1) | b
+	outputs = np.stack([1 - 2*_parity(register & g) for g in CONV_GENERATORS], axis=-1)
+	return prev, outputs.astype(np.float64)
+
+def viterbi_decode(llr, num_bits, rate='1/2'):
+	"""
+	Inputs:
+		llr: Float array of log(P(bit = 0)/P(bit = 1)) for the punctured,
+			de-interleaved coded bits, one packet per row (or 1D for one).
+		num_bits: Integer. Number of information bits per packet.
+		rate: String. Key of PUNCTURE_PATTERNS.
+	Outputs:
+		Returns the maximum-likelihood information bits as a uint8 array,
+		one row per packet. All packets go through the trellis together.
+
+	>>> llr = 1.0 - 2*fec_encode([1, 0, 1, 1, 0, 0, 1], '3/4')
+	>>> llr[2] = -llr[2]
+	>>> viterbi_decode(llr, 7, '3/4').tolist()
+	[1, 0, 1, 1, 0, 0, 1]
+	"""
+	llr = np.asarray(llr, dtype=np.float64)
+	shape = llr.shape
+	llr = llr.reshape(-1, shape[-1])
+	num_packets = llr.shape[0]
+	num_steps = num_bits + CONV_K-1
+
+	# Punctured bits come back as "no idea"
+	mask = _puncture_mask(num_steps, rate)
+	full = np.zeros((num_packets, len(mask)))
+	full[:, mask] = llr
+	full = full.reshape(num_packets, num_steps, len(CONV_GENERATORS))
+
+	prev, outputs = _trellis()
+	metric = np.full((num_packets, CONV_STATES), -np.inf)
+	metric[:, 0] = 0
+	decisions = np.empty((num_steps, num_packets, CONV_STATES), dtype=np.uint8)
+	for t in range(num_steps):
+		# (packets, next state, b) correlation with the received LLRs
+		branch = full[:, t, :] @ outputs.reshape(-1, len(CONV_GENERATORS)).T
+		candidates = metric[:, prev] + branch.reshape(num_packets, CONV_STATES, 2)
+		choice = candidates[:, :, 1] > candidates[:, :, 0]
+		decisions[t] = choice
+		metric = np.where(choice, candidates[:, :, 1], candidates[:, :, 0])
+		# Keep the metrics from drifting off
+		metric = metric - metric.max(axis=1, keepdims=True)
+
+	# Trace back from state 0, where the tail leaves the encoder
+	state = np.zeros(num_packets, dtype=np.int64)
+	rows = np.arange(num_packets)
+	decoded = np.empty((num_packets, num_steps), dtype=np.uint8)
+	for t in range(num_steps-1, -1, -1):
+		decoded[:, t] = state >> (CONV_K-2)
+		state = prev[state, decisions[t, rows, state]]
+	return decoded[:, :num_bits].reshape(shape[:-1] + (num_bits,))
+
+def fec_decode(rx, num_bits, rate='1/2', interleave_depth=None):
+	"""
+	Inputs:
+		rx: Coded bits as received, one packet per row (or 1D for one).
+			Floats are taken as LLRs (e.g. from ppm_soft_bits), integers as
+			hard bits.
+		num_bits: Integer. Number of information bits per packet.
+		rate, interleave_depth: What fec_encode was called with.
+	Outputs:
+		Returns the decoded information bits as a uint8 array.
+
+	>>> bits = np.random.default_rng(0).integers(0, 2, size=(3, 40), dtype=np.uint8)
+	>>> coded = fec_encode(bits, '2/3', interleave_depth=8)
+	>>> coded[:, 10:14] ^= 1
+	>>> (fec_decode(coded, 40, '2/3', interleave_depth=8) == bits).all()
+	True
+	"""
+	rx = np.asarray(rx)
+	if np.issubdtype(rx.dtype, np.floating):
+		llr = rx.astype(np.float64)
+	else:
+		llr = 1.0 - 2.0*rx
+	if interleave_depth is not None:
+		llr = llr[..., np.argsort(interleave_perm(llr.shape[-1], interleave_depth))]
+	return viterbi_decode(llr, num_bits, rate)
+
+def sim_fec_ber(num_packets, chips_per_symbol, bits_per_chip, num_bits=256, rate='1/2',
+				interleave_depth=None, soft=True, sigma_bg=0, photons_signal=None,
+				photons_bg=0, batch_packets=1024, z=1.96, rng=None):
+	"""
+	Inputs:
+		num_packets: Integer. Number of payloads to simulate.
+		chips_per_symbol, bits_per_chip: PPM order and bits per chip.
+		num_bits: Integer. Information bits per payload.
+		rate: String or None. Key of PUNCTURE_PATTERNS, or None for uncoded.
+		interleave_depth: Integer or None. See fec_encode.
+		soft: Boolean. Decode from ppm_soft_bits LLRs rather than the
+			correlator's hard symbols. Needs photons_signal.
+		sigma_bg, photons_signal, photons_bg: See ppm_sim.sim_channel.
+		batch_packets: Integer. Payloads per batch.
+		z: Float. Normal quantile for the confidence intervals.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a dictionary with the information bit error rate ('ber',
+		'ber_low', 'ber_high', 'bit_errors', 'bits'), the payload error rate
+		('per', 'packet_errors', 'packets') and the number of PPM symbols
+		sent per payload ('symbols').
+
+	>>> r = sim_fec_ber(50, 16, 2, num_bits=64, photons_signal=3, photons_bg=.2,
+	...		rng=np.random.default_rng(0))
+	>>> r['symbols'], r['ber'] < 0.01
+	(35, True)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if soft and photons_signal is None:
+		raise ValueError("Soft decisions need the photon counting channel")
+	bits_per_value = int(np.log2(chips_per_symbol))
+	coded_bits = num_bits if rate is None else fec_coded_length(num_bits, rate)
+	pad = -coded_bits % bits_per_value
+
+	bit_errors = 0
+	packet_errors = 0
+	for batch_start in range(0, num_packets, batch_packets):
+		batch = min(batch_packets, num_packets - batch_start)
+		bits = rng.integers(0, 2, size=(batch, num_bits), dtype=np.uint8)
+		coded = bits if rate is None else fec_encode(bits, rate, interleave_depth)
+		coded = np.pad(coded, ((0, 0), (0, pad)))
+		rx_bits = channel_bits(ppm_mod_bits(coded, chips_per_symbol,
+			bits_per_chip).reshape(batch, -1), bits_per_chip, sigma_bg=sigma_bg,
+			photons_signal=photons_signal, photons_bg=photons_bg, rng=rng)
+
+		if soft:
+			rx = ppm_soft_bits(rx_bits, chips_per_symbol, bits_per_chip,
+				photons_signal, photons_bg).reshape(batch, -1)
+		else:
+			corr_symbol, _, _ = ppm_correlate_bits(rx_bits, chips_per_symbol, bits_per_chip)
+			rx = ppm_vals_to_bits(corr_symbol, bits_per_value).reshape(batch, -1)
+		rx = rx[:, :coded_bits]
+		if rate is None:
+			decoded = llr_to_bits(rx) if soft else rx
+		else:
+			decoded = fec_decode(rx, num_bits, rate, interleave_depth)
+
+		wrong = decoded != bits
+		bit_errors = bit_errors + int(wrong.sum())
+		packet_errors = packet_errors + int(wrong.any(axis=1).sum())
+
+	bits = num_packets*num_bits
+	ber_low, ber_high = wilson_interval(bit_errors, bits, z)
+	return dict(bit_errors=bit_errors, bits=bits, ber=bit_errors/bits if bits else 0.0,
+		ber_low=ber_low, ber_high=ber_high, packet_errors=packet_errors,
+		packets=num_packets, per=packet_errors/num_packets if num_packets else 0.0,
+		symbols=(coded_bits+pad)//bits_per_value)
+
+if __name__ == "__main__":
+	# Coded vs. uncoded BER at a few photon budgets
+	for photons_signal in [1, 2, 4]:
+		for rate in [None, '1/2', '3/4']:
+			for soft in [False, True]:
+				r = sim_fec_ber(2000, 16, 2, rate=rate, interleave_depth=16, soft=soft,
+					photons_signal=photons_signal, photons_bg=0.2,
+					rng=np.random.default_rng(0))
+				print(photons_signal, rate, soft, r['ber'], r['symbols'])
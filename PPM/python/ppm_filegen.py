@@ -5,12 +5,32 @@
 # simulation or using binary files to generate .arb files for the 
 # arbitrary waveform generator.
 
-# import numpy as np
+import numpy as np
 # import scipy as sp
 # import matplotlib.pyplot as plt
 import doctest
+import os
 from math import ceil
-# from ppm_base import ppm_mod_vals, ppm_mod_bits
+from ppm_base import ppm_mod_vals, ppm_mod_bits
+from ppm_capture import b_rows_to_text, read_b_chunks, read_capture_chunks, \
+	read_capture_header, is_capture_file, count_b_bits
+from ppm_instrument import count, timed, timer
+
+def _write_b_rows(outputFile, rows):
+	"""
+	Inputs:
+		outputFile: String. Path and name of the file to write to.
+		rows: 2D array of 0 and 1. Each row is written out as one line of
+			characters, leftmost column first.
+	Outputs:
+		No return value. Converts all the rows to ASCII in one go and writes 
+		them to 'outputFile' with a single write.
+	"""
+	with timer('_write_b_rows'):
+		text = b_rows_to_text(rows)
+		with open(outputFile, 'wb') as file:
+			file.write(text)
+	count('_write_b_rows.bytes', len(text))
 
 def gen_rx_uniform(outputFile, num_rows, chips_per_row, bits_per_chip, val=0):
 	"""
@@ -27,9 +47,8 @@ def gen_rx_uniform(outputFile, num_rows, chips_per_row, bits_per_chip, val=0):
 	Outputs:
 		No return value. Writes to 'outputFile' rows of 'val'.
 	"""
-	with open(outputFile, 'w+') as file:
-		for r in range(num_rows):
-			file.write(''.join([str(val)]*chips_per_row*bits_per_chip+'\n'))
+	rows = np.full((num_rows, chips_per_row*bits_per_chip), val, dtype=np.uint8)
+	_write_b_rows(outputFile, rows)
 	return
 
 
@@ -53,20 +72,59 @@ def gen_rx_rand_pulses(outputFile, num_rows, chips_per_row, bits_per_chip,
 		all 0 or all 1 chips; this was intended for testing parts of the frequency
 		recovery block.
 	"""
-	with open(outputFile, 'w') as file:
-		for r in range(num_rows):
-			row_floats_unexpanded = np.random.random(chips_per_row)
-			row = []
-			for x in row_floats_unexpanded:
-				if x >= p:
-					val = 0
-				else:
-					val = 1
-				row = row + [str(val)]*bits_per_chip
-			file.write(''.join(row)+'\n')
+	row_floats_unexpanded = np.random.random((num_rows, chips_per_row))
+	rows = np.repeat((row_floats_unexpanded < p).astype(np.uint8), 
+				bits_per_chip, axis=1)
+	_write_b_rows(outputFile, rows)
 	return
 
 
+def packet_data_bits(chips_per_symbol, p_datalen):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		p_datalen: List of 1 and 0. Contents of the data length field.
+	Outputs:
+		Returns the number of (demodulated) bits in the data field of a packet
+		with the given data length field. Each octet is padded out to a 
+		whole number of symbols.
+		
+	>>> packet_data_bits(16, [0]*15 + [1]), packet_data_bits(64, [0]*14 + [1,0])
+	(8, 24)
+	"""
+	p_datalen_octets_str = ''.join([str(i) for i in p_datalen])
+	p_datalen_octets_dec = int(p_datalen_octets_str, 2)
+
+	symbols_per_octet = int(ceil(8/np.log2(chips_per_symbol)))
+	demod_bits_per_symbol = int(np.log2(chips_per_symbol))
+	return demod_bits_per_symbol * symbols_per_octet * p_datalen_octets_dec
+
+def gen_packet_bits(p_data, preamble=[0,0,0,0], sfd0=[0,1,1,1], sfd1=[1,0,1,0],
+				p_version=[0,0,0], p_id=[1]*13, p_seqcontr=[0,1]+[0]*14,
+				p_datalen=[0]*16):
+	"""
+	Inputs:
+		p_data: Array of 1 and 0. Packet data field, either one packet's worth 
+			(1D) or one packet per row (2D).
+		preamble, sfd0, sfd1, p_version, p_id, p_seqcontr, p_datalen: See
+			gen_rx_rand_data.
+	Outputs:
+		Returns the (unmodulated) packet bits as a uint8 array, with the same
+		number of dimensions as 'p_data'. The preamble is repeated 8 times and
+		is followed by SFD0, SFD1, the primary header and the data field.
+		
+	>>> gen_packet_bits([1,1], preamble=[0], sfd0=[1], sfd1=[0], p_version=[],
+	...		p_id=[], p_seqcontr=[], p_datalen=[0,1]).tolist()
+	[0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 1, 1, 1]
+	"""
+	p_data = np.asarray(p_data, dtype=np.uint8)
+	header = np.asarray(preamble*8 + sfd0 + sfd1 + p_version + p_id \
+		+ p_seqcontr + p_datalen, dtype=np.uint8)
+	header = np.broadcast_to(header, p_data.shape[:-1] + header.shape)
+	return np.concatenate((header, p_data), axis=-1)
+
+@timed()
 def gen_rx_rand_data(outputFile, num_rows, chips_per_row, chips_per_symbol, bits_per_chip,
 				preamble=[0,0,0,0], sfd0=[0,1,1,1], sfd1=[1,0,1,0],
 				p_version=[0,0,0], p_id=[1]*13, p_seqcontr=[0,1]+[0]*14,
@@ -100,10 +158,12 @@ def gen_rx_rand_data(outputFile, num_rows, chips_per_row, chips_per_symbol, bits
 		sigma_bg: Float. Standard deviation (in bits) to inject into the background
 			of all transmitted bits.
 	Outputs:
-		No return value. Writes to 'outputFile' with the fully constructed 
-		packet randomly placed somewhere in the file. Format is what the 
-		receiver sees (so it's modulated with PPM). This intentionally transmits
-		a single packet, and everything else is randomized.
+		Returns (loc, p_data): the bit index where the packet starts and the
+		(noiseless) data field bits, for checking a receiver against. Writes
+		to 'outputFile' with the fully constructed packet randomly placed
+		somewhere in the file. Format is what the receiver sees (so it's 
+		modulated with PPM). This intentionally transmits a single packet, 
+		and everything else is randomized.
 	Raises:
 		ValueError if the specified number of chips is insufficient to fit the
 			packet.
@@ -117,20 +177,21 @@ def gen_rx_rand_data(outputFile, num_rows, chips_per_row, chips_per_symbol, bits
 		
 		In all of the above (preamble, sfd0, sfd1, etc.) the LSB is on
 		the right and the MSB goes on the leftmost index.
+		
+		Random draws are made in bulk. With mode='rand' and sigma_bg != 0 
+		the background noise is drawn before the background bits, so for a 
+		fixed seed the file differs from the old bit-by-bit generator 
+		(statistically it's the same). Every other combination reproduces
+		it exactly.
 	"""
 	# Creating random packet data based on specified data length
-	p_datalen_octets_str = ''.join([str(i) for i in p_datalen])
-	p_datalen_octets_dec = int(p_datalen_octets_str, 2)
-
-	symbols_per_octet = int(ceil(8/np.log2(chips_per_symbol)))
-	demod_bits_per_symbol = int(np.log2(chips_per_symbol))
-	p_datalen_bits_demod = demod_bits_per_symbol * symbols_per_octet \
-							* p_datalen_octets_dec
+	p_datalen_bits_demod = packet_data_bits(chips_per_symbol, p_datalen)
 	p_data_demod = np.random.randint(2, size=p_datalen_bits_demod)
 	# Constructing the packet first as chips and inserting TX noise
 	# (if any)
-	packet_demod_noiseless = preamble*8 + sfd0 + sfd1 + p_version \
-		+ p_id + p_seqcontr + p_datalen + list(p_data_demod)
+	packet_demod_noiseless = list(gen_packet_bits(p_data_demod, preamble=preamble,
+		sfd0=sfd0, sfd1=sfd1, p_version=p_version, p_id=p_id, 
+		p_seqcontr=p_seqcontr, p_datalen=p_datalen))
 	if sigma_tx != 0:
 		noise_tx = np.random.normal(loc=0, scale=sigma_tx, 
 							size=len(packet_demod_noiseless))
@@ -155,51 +216,39 @@ def gen_rx_rand_data(outputFile, num_rows, chips_per_row, chips_per_symbol, bits
 		loc = np.random.randint(total_bits-len(packet))
 	bits_per_row = bits_per_chip*chips_per_row
 	
-	with open(outputFile, 'w+') as file:
-		idx = 0
-		col = 0
-		write_str = ''
-		while idx < total_bits:
-			# Constructing the row to write
-			if sigma_bg != 0:
-				noise_bg = np.random.normal(loc=0, scale=sigma_bg)
-			else:
-				noise_bg = 0
-				
-			if idx >= loc and idx < loc+len(packet):
-				val = packet[idx-loc]
-			elif mode == 'zero':
-				val = 0
-			elif mode == 'one':
-				val = 1
-			else:
-				val = np.random.randint(2)
-
-			if round(val + noise_bg) > 1:
-				val = 1
-			elif round(val + noise_bg) < 0:
-				val = 0
-			else:
-				val = int(round(val + noise_bg))
-				
-			write_str = write_str + str(val)
-			# End of the row
-			if col == bits_per_row-1:
-				col = 0
-				file.write(write_str[::-1]+'\n')
-				write_str = ''
-			else:
-				col = col + 1
+	# Building the whole capture as one array. Noise and background bits
+	# are drawn in bulk, and when only one kind of draw is needed this 
+	# consumes the global RNG exactly as drawing bit by bit would.
+	rx_bits = np.empty(total_bits, dtype=np.float64)
+	if sigma_bg != 0:
+		noise_bg = np.random.normal(loc=0, scale=sigma_bg, size=total_bits)
+	else:
+		noise_bg = 0
+	if mode == 'zero':
+		rx_bits[:] = 0
+	elif mode == 'one':
+		rx_bits[:] = 1
+	else:
+		rx_bits[:loc] = np.random.randint(2, size=loc)
+		rx_bits[loc+len(packet):] = np.random.randint(2, 
+			size=total_bits-loc-len(packet))
+	rx_bits[loc:loc+len(packet)] = packet
+	rx_bits = np.clip(np.round(rx_bits + noise_bg), 0, 1).astype(np.uint8)
 
-			idx = idx + 1
-	return
+	# Each row is written with the earliest bit on the right
+	_write_b_rows(outputFile, rx_bits.reshape(num_rows, bits_per_row)[:,::-1])
+	return loc, p_data_demod
 
+@timed()
 def gen_tx_data_arb(inputFile, outputFile, channelCount, sampleRate,
 	fileFormat="1.10", columnChar="TAB", highLevel=1, lowLevel=0, dataType='Short',
-	filterOn=False):
+	filterOn=False, chunk_bits=1 << 20):
 	"""
 	Inputs:
-		inputFile: Path to the file with the data bits to be transmitted.
+		inputFile: Path to the file with the data bits to be transmitted, either
+			a .b file or a packed capture (see ppm_capture). Can also be a NumPy 
+			array of bits in the order they're sent, e.g. straight from 
+			ppm_mod_bits, in which case no intermediate file is needed.
 		outputFile: Path to the .arb file to write to.
 		channelCount: Integer 1 or 2. The channel to use on the waveform
 			generator.
@@ -211,15 +260,53 @@ def gen_tx_data_arb(inputFile, outputFile, channelCount, sampleRate,
 		dataType: String. Unknown, but I'm guessing it's the number of bits to use
 			for resolution when writing.
 		filterOn: Boolean. Unknown purpose.
+		chunk_bits: Integer. Roughly how many bits are converted and written at
+			a time.
 	Outputs:
 		No return value. Writes the .arb file to 'outputFile' based on the data from
-		'inputFile' and the rest of the specs.
+		'inputFile' and the rest of the specs. The input is streamed, so only
+		one chunk is held in memory at a time.
+	
+	>>> import os, tempfile
+	>>> outputFile = os.path.join(tempfile.mkdtemp(), 'a.arb')
+	>>> gen_tx_data_arb(np.asarray([1,0,1]), outputFile, 1, 100000)
+	>>> print(open(outputFile).read().split('Data Points:')[1])
+	3
+	Data:
+	1
+	0
+	1
+	<BLANKLINE>
+	>>> inputFile = os.path.join(os.path.dirname(outputFile), 'a.b')
+	>>> for text in ['01\\n10\\n', '01\\n10']:
+	...     _ = open(inputFile, 'w').write(text)
+	...     gen_tx_data_arb(inputFile, outputFile, 1, 100000)
+	...     print(open(outputFile).read().split('Data Points:')[1].split())
+	['4', 'Data:', '1', '0', '0', '1']
+	['4', 'Data:', '1', '0', '0', '1']
 	"""
 	if filterOn:
 		filterTxt = '"ON"'
 	else:
 		filterTxt = '"OFF"'
 	
+	# Counting the data points without reading the data in
+	if isinstance(inputFile, np.ndarray):
+		data_points = inputFile.size
+	elif is_capture_file(inputFile):
+		data_points = read_capture_header(inputFile)['num_bits']
+	else:
+		# Rows are fixed-width, so the file size gives the row count unless
+		# the file is ragged (or lacks the last newline)
+		with open(inputFile, 'rb') as f:
+			row = f.readline()
+		bits_per_row = len(row.rstrip(b'\r\n'))
+		file_size = os.path.getsize(inputFile)
+		if len(row) > 0 and file_size % len(row) == 0:
+			data_points = file_size // len(row) * bits_per_row
+		else:
+			data_points = count_b_bits(inputFile)
+	
 	header = "File Format:{0}\n".format(fileFormat) + \
 		"Channel Count:{0}\n".format(str(channelCount)) + \
 		"Column Char:{0}\n".format(columnChar) + \
@@ -227,22 +314,23 @@ def gen_tx_data_arb(inputFile, outputFile, channelCount, sampleRate,
 		"High Level:{0}\n".format(str(highLevel)) + \
 		"Low Level:{0}\n".format(str(lowLevel)) + \
 		'Data Type:"{0}"\n'.format(dataType) + \
-		"Filter:{0}\n".format(filterTxt)
+		"Filter:{0}\n".format(filterTxt) + \
+		"Data Points:{0}\n".format(str(data_points)) + \
+		"Data:\n"
 		
-	with open(outputFile, 'w+') as fileOut:
-		with open(inputFile, 'r') as fileIn:
-			# Check what size restrictions are on read(), or this could get
-			# unwieldy.
-			txt_in = fileIn.read()
-			data_points = len(txt_in) - txt_in.count('\n')
-			header = header + "Data Points:{0}\n".format(str(data_points)) + \
-				"Data:\n"
-			fileOut.write(header)
-		with open(inputFile, 'r') as fileIn:
-			for line in fileIn.readlines():
-				line_rev = line[::-1]
-				line_rev = line_rev.replace('\n', '')
-				fileOut.write('\n'.join(line_rev)+'\n')
+	# One bit per line, in the order they're sent
+	if isinstance(inputFile, np.ndarray):
+		chunks = (inputFile.ravel()[i:i+chunk_bits] 
+					for i in range(0, inputFile.size, chunk_bits))
+	elif is_capture_file(inputFile):
+		chunks = read_capture_chunks(inputFile, chunk_bits)
+	else:
+		chunks = read_b_chunks(inputFile, max(1, chunk_bits // max(1, bits_per_row)))
+	with open(outputFile, 'wb', buffering=1 << 20) as fileOut:
+		fileOut.write(header.encode())
+		for chunk in chunks:
+			count('gen_tx_data_arb.bits', len(chunk))
+			fileOut.write(b_rows_to_text(np.asarray(chunk).reshape(-1, 1)))
 
 if __name__ == "__main__":
 	# Generating and transmitting a single valid data packet in the midst
@@ -275,7 +363,7 @@ if __name__ == "__main__":
 			dataType="Short",
 			filterOn=False)
 			
-		gen_tx_data(**tx_arb_specs)
+		gen_tx_data_arb(**tx_arb_specs)
 	
 	# Generating a .b file with maxed out pulses separated
 	# by all zeros. Used for testing parts of frequency recovery.
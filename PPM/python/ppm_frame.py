@@ -0,0 +1,342 @@
+# Created 2026/10/17
+
+# Packet framing. Builds and takes apart the CCSDS-style packets the rest of
+# the code sends (preamble, SFD0, SFD1, primary header, data field), with the
+# header fields as integers instead of bit lists and an optional CRC-16 at the
+# end of the data field. Everything works on whole batches of packets:
+# headers are packed/unpacked as (packets, bits) arrays and the CRC runs down
+# the octet columns of every packet at once.
+
+import numpy as np
+import doctest
+from math import ceil
+from ppm_base import bits_to_ints, ppm_vals_to_bits, sync_vals
+from ppm_rx import rx_ppm_packets, PRIMARY_HEADER_BITS
+
+# Primary header fields, MSB first, in the order they're sent. The defaults
+# match gen_rx_rand_data (sequence flags 01, count 0).
+HEADER_FIELDS = [('version', 3), ('packet_id', 13), ('seqcontr', 16), ('datalen', 16)]
+HEADER_DEFAULTS = dict(version=0, packet_id=0x1FFF, seqcontr=0x4000)
+HEADER_OCTETS = PRIMARY_HEADER_BITS // 8
+
+# CRC-16-CCITT (polynomial 0x1021, initial value 0xFFFF, no final XOR), the
+# CCSDS frame error control code. Its octets go at the end of the data field.
+CRC_POLY = 0x1021
+CRC_INIT = 0xFFFF
+CRC_OCTETS = 2
+
+def _crc_table():
+	"""
+	Outputs:
+		Returns the 256-entry table for the byte-at-a-time CRC.
+	"""
+	crc = np.arange(256, dtype=np.uint32) << 8
+	for _ in range(8):
+		crc = np.where(crc & 0x8000, (crc << 1) ^ CRC_POLY, crc << 1) & 0xFFFF
+	return crc.astype(np.uint16)
+
+CRC_TABLE = _crc_table()
+
+def crc16(octets):
+	"""
+	Inputs:
+		octets: uint8 array, one message per row (or 1D for one).
+	Outputs:
+		Returns the CRC-16 of every row as uint16. Running it over a message
+		with its CRC appended (MSB first) gives 0.
+
+	>>> hex(int(crc16(np.frombuffer(b'123456789', dtype=np.uint8))))
+	'0x29b1'
+	"""
+	octets = np.asarray(octets, dtype=np.uint8)
+	rows = octets.reshape(-1, octets.shape[-1]) if octets.ndim > 0 else octets.reshape(1, 1)
+	crc = np.full(rows.shape[0], CRC_INIT, dtype=np.uint16)
+	for col in rows.T:
+		crc = (crc << 8) ^ CRC_TABLE[(crc >> 8) ^ col]
+	return crc.reshape(octets.shape[:-1])
+
+def append_crc(octets):
+	"""
+	Inputs:
+		octets: uint8 array, one message per row (or 1D for one).
+	Outputs:
+		Returns the messages with their CRC appended, MSB first.
+
+	>>> append_crc([0x31, 0x32]).tolist()
+	[49, 50, 61, 186]
+	"""
+	octets = np.asarray(octets, dtype=np.uint8)
+	crc = crc16(octets)[..., np.newaxis]
+	return np.concatenate((octets, (crc >> 8).astype(np.uint8), (crc & 0xFF).astype(np.uint8)),
+		axis=-1)
+
+def check_crc(octets):
+	"""
+	Inputs:
+		octets: uint8 array of messages with their CRC at the end, one per
+			row (or 1D for one).
+	Outputs:
+		Returns True for every message whose CRC checks out.
+
+	>>> check_crc([[0x31, 0x32, 0x3d, 0xba], [0x31, 0x33, 0x3d, 0xba]]).tolist()
+	[True, False]
+	"""
+	return crc16(octets) == 0
+
+def pack_headers(datalen, version=None, packet_id=None, seqcontr=None):
+	"""
+	Inputs:
+		datalen: Integer or array. Data field length in octets.
+		version, packet_id, seqcontr: Integers or arrays. Defaults are
+			HEADER_DEFAULTS.
+		All of them broadcast together.
+	Outputs:
+		Returns the primary headers as a (packets, PRIMARY_HEADER_BITS) uint8
+		array, each field MSB first.
+
+	>>> pack_headers(1)[0].tolist() == [0,0,0] + [1]*13 + [0,1]+[0]*14 + [0]*15+[1]
+	True
+	"""
+	values = dict(HEADER_DEFAULTS, datalen=datalen)
+	for name, value in [('version', version), ('packet_id', packet_id), ('seqcontr', seqcontr)]:
+		if value is not None:
+			values[name] = value
+	fields = np.broadcast_arrays(*[np.asarray(values[name], dtype=np.int64).reshape(-1)
+		for name, _ in HEADER_FIELDS])
+	return np.concatenate([ppm_vals_to_bits(f, width).reshape(len(f), width)
+		for f, (_, width) in zip(fields, HEADER_FIELDS)], axis=1)
+
+def unpack_headers(header_bits):
+	"""
+	Inputs:
+		header_bits: (packets, PRIMARY_HEADER_BITS) array of primary header
+			bits (or 1D for one header).
+	Outputs:
+		Returns a structured array with one int64 field per HEADER_FIELDS
+		entry, one record per packet.
+
+	>>> h = unpack_headers(pack_headers([1, 5], seqcontr=[0x4000, 0x4001]))
+	>>> h['datalen'].tolist(), h['seqcontr'].tolist(), int(h['packet_id'][0])
+	([1, 5], [16384, 16385], 8191)
+	"""
+	header_bits = np.asarray(header_bits, dtype=np.uint8).reshape(-1, PRIMARY_HEADER_BITS)
+	headers = np.empty(header_bits.shape[0], dtype=[(name, np.int64) for name, _ in HEADER_FIELDS])
+	start = 0
+	for name, width in HEADER_FIELDS:
+		headers[name] = bits_to_ints(header_bits[:, start:start+width].ravel(), width)
+		start = start + width
+	return headers
+
+def octet_slot_bits(chips_per_symbol):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol.
+	Outputs:
+		Returns the number of demodulated bits each data field octet takes
+		up: a whole number of symbols, like packet_data_bits.
+
+	>>> octet_slot_bits(16), octet_slot_bits(64)
+	(8, 12)
+	"""
+	demod_bits_per_symbol = int(ceil(np.log2(chips_per_symbol)))
+	return int(ceil(8/demod_bits_per_symbol))*demod_bits_per_symbol
+
+def octets_to_field(octets, chips_per_symbol):
+	"""
+	Inputs:
+		octets: uint8 array, one data field per row (or 1D for one).
+		chips_per_symbol: Integer. Number of chips per symbol.
+	Outputs:
+		Returns the data field bits: each octet MSB first, zero-padded out to
+		octet_slot_bits.
+
+	>>> octets_to_field([0xA5], 64).tolist()
+	[1, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0]
+	"""
+	octets = np.asarray(octets, dtype=np.uint8)
+	bits = np.unpackbits(octets[..., np.newaxis], axis=-1)
+	slot = octet_slot_bits(chips_per_symbol)
+	bits = np.pad(bits, [(0, 0)]*(bits.ndim-1) + [(0, slot-8)])
+	return bits.reshape(octets.shape[:-1] + (octets.shape[-1]*slot,))
+
+def field_to_octets(bits, chips_per_symbol):
+	"""
+	Inputs:
+		bits: Data field bits, one packet per row (or 1D for one), a whole
+			number of octet slots.
+		chips_per_symbol: Integer. Number of chips per symbol.
+	Outputs:
+		Returns the octets, dropping the padding. Inverse of octets_to_field.
+	"""
+	bits = np.asarray(bits, dtype=np.uint8)
+	slot = octet_slot_bits(chips_per_symbol)
+	slots = bits.reshape(bits.shape[:-1] + (bits.shape[-1]//slot, slot))[..., :8]
+	return np.packbits(slots, axis=-1)[..., 0]
+
+def _sync_bits(chips_per_symbol, preamble_val, sfd0_val, sfd1_val, preamble_symbols):
+	"""
+	Outputs:
+		Returns the unmodulated preamble, SFD0 and SFD1 bits.
+	"""
+	demod_bits_per_symbol = int(ceil(np.log2(chips_per_symbol)))
+	preamble_val, sfd0_val, sfd1_val = sync_vals(chips_per_symbol, preamble_val, sfd0_val,
+		sfd1_val)
+	return ppm_vals_to_bits([preamble_val]*preamble_symbols + [sfd0_val, sfd1_val],
+		demod_bits_per_symbol)
+
+def frame_packets(payloads, chips_per_symbol, crc=True, version=None, packet_id=None,
+				seqcontr=None, preamble_val=None, sfd0_val=None, sfd1_val=None,
+				preamble_symbols=8):
+	"""
+	Inputs:
+		payloads: (packets, octets) uint8 array of equal-length payloads (or
+			1D for one).
+		chips_per_symbol: Integer. Number of chips per symbol.
+		crc: Boolean. Append the CRC of header and payload to the data field.
+		version, packet_id: See pack_headers.
+		seqcontr: Integer, array or None. None numbers the packets 0, 1, ...
+			in the sequence count with flags 01.
+		preamble_val, sfd0_val, sfd1_val: Integers or None. Sync symbol values,
+			see ppm_base.sync_vals.
+		preamble_symbols: Integer. Number of preamble symbols.
+	Outputs:
+		Returns the unmodulated packets as a (packets, bits) uint8 array,
+		ready for ppm_mod_bits. The data length field counts the CRC octets.
+
+	>>> packets = frame_packets([[1, 2, 3], [4, 5, 6]], 16)
+	>>> packets.shape
+	(2, 128)
+	>>> [(int(h['datalen']), d.tolist()) for h, d, ok in zip(*deframe_packets(
+	...		packets[:, 40:88], packets[:, 88:], 16)) if ok]
+	[(5, [1, 2, 3]), (5, [4, 5, 6])]
+	"""
+	payloads = np.atleast_2d(np.asarray(payloads, dtype=np.uint8))
+	payloads = payloads.reshape(int(np.prod(payloads.shape[:-1])), payloads.shape[-1])
+	num_packets = payloads.shape[0]
+	datalen = payloads.shape[1] + (CRC_OCTETS if crc else 0)
+	if seqcontr is None:
+		seqcontr = HEADER_DEFAULTS['seqcontr'] | (np.arange(num_packets) & 0x3FFF)
+	header = pack_headers(datalen, version, packet_id, seqcontr)
+	header = np.broadcast_to(header, (num_packets, PRIMARY_HEADER_BITS))
+
+	data = payloads
+	if crc:
+		# Covers the header too, so a corrupted length can't slip through
+		data = append_crc(np.concatenate((np.packbits(header, axis=1), payloads),
+			axis=1))[:, HEADER_OCTETS:]
+	sync = _sync_bits(chips_per_symbol, preamble_val, sfd0_val, sfd1_val, preamble_symbols)
+	sync = np.broadcast_to(sync, (num_packets, len(sync)))
+	return np.concatenate((sync, header, octets_to_field(data, chips_per_symbol)), axis=1)
+
+def frame_stream(payloads, chips_per_symbol, gap_bits=0, **kwargs):
+	"""
+	Inputs:
+		payloads: List of uint8 arrays, one per packet, of any lengths.
+		chips_per_symbol: Integer. Number of chips per symbol.
+		gap_bits: Integer. Zero bits between packets (a whole number of
+			symbols keeps the packets symbol-aligned).
+		kwargs: Passed along to frame_packets.
+	Outputs:
+		Returns one 1D array of unmodulated bits with the packets back to
+		back in order. Packets of the same length are framed together.
+
+	>>> len(frame_stream([[1], [2, 3], [4]], 16))
+	344
+	>>> len(frame_stream([[1, 2], [], [3]], 16))
+	336
+	"""
+	seqcontr = kwargs.pop('seqcontr', None)
+	if seqcontr is None:
+		seqcontr = HEADER_DEFAULTS['seqcontr'] | (np.arange(len(payloads)) & 0x3FFF)
+	seqcontr = np.broadcast_to(seqcontr, (len(payloads),))
+	lengths = np.asarray([len(p) for p in payloads])
+	framed = [None]*len(payloads)
+	for length in np.unique(lengths):
+		rows = np.flatnonzero(lengths == length)
+		group = np.asarray([payloads[i] for i in rows], dtype=np.uint8).reshape(len(rows), length)
+		packets = frame_packets(group, chips_per_symbol, seqcontr=seqcontr[rows], **kwargs)
+		for i, packet in zip(rows, packets):
+			framed[i] = packet
+	gap = np.zeros(gap_bits, dtype=np.uint8)
+	return np.concatenate([part for packet in framed for part in (packet, gap)]
+		if len(framed) > 0 else [np.zeros(0, dtype=np.uint8)])
+
+def deframe_packets(header_bits, data_bits, chips_per_symbol, crc=True):
+	"""
+	Inputs:
+		header_bits: (packets, PRIMARY_HEADER_BITS) array of primary headers.
+		data_bits: (packets, bits) array of equal-length data fields, or a
+			list of data fields of any lengths.
+		chips_per_symbol: Integer. Number of chips per symbol.
+		crc: Boolean. Whether the data fields end in a CRC.
+	Outputs:
+		Returns (headers, payloads, crc_ok): the unpack_headers records, a
+		list of uint8 payload arrays (CRC stripped) and a boolean array which
+		is True where the CRC checks out (always True without a CRC). Data
+		fields of the same length are handled together.
+	"""
+	headers = unpack_headers(header_bits)
+	header_octets = np.packbits(np.asarray(header_bits, dtype=np.uint8).reshape(-1,
+		PRIMARY_HEADER_BITS), axis=1)
+	lengths = np.asarray([len(d) for d in data_bits])
+	payloads = [None]*len(lengths)
+	crc_ok = np.ones(len(lengths), dtype=bool)
+	for length in np.unique(lengths):
+		rows = np.flatnonzero(lengths == length)
+		group = np.asarray([data_bits[i] for i in rows], dtype=np.uint8).reshape(len(rows), length)
+		octets = field_to_octets(group, chips_per_symbol)
+		if crc:
+			crc_ok[rows] = check_crc(np.concatenate((header_octets[rows], octets), axis=1))
+			octets = octets[:, :max(0, octets.shape[1]-CRC_OCTETS)]
+		for i, payload in zip(rows, octets):
+			payloads[i] = payload
+	return headers, payloads, crc_ok
+
+def rx_frames(source, chips_per_symbol, bits_per_chip, crc=True, batch_packets=1024,
+				**kwargs):
+	"""
+	Inputs:
+		source: See ppm_rx.rx_ppm_packets.
+		chips_per_symbol: Integer. Number of chips per symbol.
+		bits_per_chip: Integer. Number of bits per chip.
+		crc: Boolean. Whether the data fields end in a CRC.
+		batch_packets: Integer. Packets collected before they're deframed
+			together.
+		kwargs: Passed along to rx_ppm_packets.
+	Outputs:
+		Generator which yields (packet_start, header, payload, crc_ok) for
+		every packet in the capture, in order. header is an unpack_headers
+		record.
+
+	>>> from ppm_base import ppm_mod_bits
+	>>> stream = frame_stream([[1, 2], [3], [4, 5, 6]], 16, gap_bits=8)
+	>>> rx_bits = ppm_mod_bits(stream, 16, 2)
+	>>> [(int(h['seqcontr']) & 0x3FFF, p.tolist(), bool(ok))
+	...		for _, h, p, ok in rx_frames(rx_bits, 16, 2, threshold_ext=2)]
+	[(0, [1, 2], True), (1, [3], True), (2, [4, 5, 6], True)]
+	"""
+	batch = []
+	def flush(batch):
+		headers, payloads, crc_ok = deframe_packets(np.asarray([b[1] for b in batch]),
+			[b[2] for b in batch], chips_per_symbol, crc)
+		return zip([b[0] for b in batch], headers, payloads, crc_ok)
+	for packet in rx_ppm_packets(source, chips_per_symbol, bits_per_chip, **kwargs):
+		batch.append(packet)
+		if len(batch) >= batch_packets:
+			yield from flush(batch)
+			batch = []
+	if len(batch) > 0:
+		yield from flush(batch)
+
+if __name__ == "__main__":
+	import time
+	from ppm_base import ppm_mod_bits
+	rng = np.random.default_rng(0)
+	payloads = [rng.integers(0, 256, size=rng.integers(1, 64), dtype=np.uint8)
+		for _ in range(10000)]
+	rx_bits = ppm_mod_bits(frame_stream(payloads, 16, gap_bits=16), 16, 2)
+	start = time.time()
+	frames = list(rx_frames(rx_bits, 16, 2, threshold_ext=2))
+	elapsed = time.time() - start
+	print("{0} packets in {1:.2f} s, {2:.0f} packets/s, {3} CRC failures".format(
+		len(frames), elapsed, len(frames)/elapsed, sum([not f[3] for f in frames])))
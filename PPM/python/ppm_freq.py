@@ -0,0 +1,271 @@
+# Created 2026/10/17
+
+# Frequency recovery over long chip streams. Mirrors what ppm_freq_recovery.v
+# measures (cycles between pulses, pulses per nominal symbol) with array
+# operations instead of counters, streams captures of any length a chunk at a
+# time, and simulates a TX/RX clock mismatch by resampling the chip stream so
+# the counters can be sized and the frequency estimate checked without HDL runs.
+
+import numpy as np
+import doctest
+from ppm_base import ppm_mod_vals
+from ppm_hdl_model import hdl_inputs
+from ppm_capture import iter_bit_chunks
+
+def pulse_chips(bits, bits_per_chip, pulse_threshold=None):
+	"""
+	Inputs:
+		bits: Array of received bits in the order received, a whole number
+			of chips.
+		bits_per_chip: Integer. Number of bits per chip.
+		pulse_threshold: Integer. Smallest chip value which counts as a pulse.
+			Defaults to what tb_ppm_freq_recovery.v uses, 1 followed by
+			bits_per_chip-1 zeros.
+	Outputs:
+		Returns a boolean array with one entry per chip, True where
+		ppm_freq_recovery.v sees pulse_detected (with freq_ok low).
+
+	>>> pulse_chips([0,0, 1,1, 0,1, 1,0], 2).tolist()
+	[False, True, True, False]
+	"""
+	if pulse_threshold is None:
+		pulse_threshold = 1 << (bits_per_chip-1)
+	return hdl_inputs(bits, bits_per_chip) >= pulse_threshold
+
+def interpulse_intervals(pulse_detected, max_count=None):
+	"""
+	Inputs:
+		pulse_detected: Boolean array, one entry per chip.
+		max_count: Integer or None. Saturate at this value, like the HDL
+			counter. None leaves the intervals alone.
+	Outputs:
+		Returns the number of chips between consecutive pulses, not counting
+		either pulse (what interpulse_cycles reports).
+
+	>>> interpulse_intervals([1,0,0,1,1,0,0,0,0,1]).tolist()
+	[2, 0, 4]
+	>>> interpulse_intervals([1,0,0,1,1,0,0,0,0,1], max_count=3).tolist()
+	[2, 0, 3]
+	"""
+	intervals = np.diff(np.flatnonzero(pulse_detected)) - 1
+	if max_count is not None:
+		intervals = np.minimum(intervals, max_count)
+	return intervals
+
+def intrasymbol_counts(pulse_detected, symbol_chips=16, max_count=None):
+	"""
+	Inputs:
+		pulse_detected: Boolean array, one entry per chip.
+		symbol_chips: Integer. Chips per nominal symbol.
+		max_count: Integer or None. Saturate at this value (the HDL register
+			saturates at 3). None leaves the counts alone.
+	Outputs:
+		Returns the number of pulses in each whole nominal symbol, counting
+		from the first chip. A trailing partial symbol is dropped.
+
+	>>> intrasymbol_counts([1,0,0,1, 0,0,0,0, 1,1,1,1, 1], 4).tolist()
+	[2, 0, 4]
+	"""
+	pulse_detected = np.asarray(pulse_detected, dtype=bool)
+	num_symbols = len(pulse_detected) // symbol_chips
+	counts = pulse_detected[:num_symbols*symbol_chips].reshape(num_symbols,
+		symbol_chips).sum(axis=1)
+	if max_count is not None:
+		counts = np.minimum(counts, max_count)
+	return counts
+
+def hdl_max_interpulse(symbol_chips=16):
+	"""
+	Inputs:
+		symbol_chips: Integer. SYMBOL_CHIPS.
+	Outputs:
+		Returns the value interpulse_cycles saturates at in
+		ppm_freq_recovery.v, which is ceilLog2(SYMBOL_CHIPS)+1 bits wide.
+
+	>>> hdl_max_interpulse(16)
+	31
+	"""
+	return (1 << (int(np.ceil(np.log2(symbol_chips)))+1)) - 1
+
+def freq_stats(source, bits_per_chip, symbol_chips=16, pulse_threshold=None,
+				chunk_rows=4096):
+	"""
+	Inputs:
+		source: String path to a .b file or packed capture, a NumPy array of
+			received bits, or an iterable of NumPy arrays of received bits.
+		bits_per_chip: Integer. Number of bits per chip.
+		symbol_chips: Integer. Chips per nominal symbol.
+		pulse_threshold: Integer. See pulse_chips.
+		chunk_rows: Integer. Rows per chunk when 'source' is a file.
+	Outputs:
+		Returns a dictionary with
+			'num_chips', 'num_pulses': totals over the stream.
+			'interpulse_hist': np.bincount of every (unsaturated) interval.
+			'intrasymbol_hist': np.bincount of the pulses per whole symbol.
+			'max_interpulse', 'max_intrasymbol': largest values seen.
+			'interpulse_bits', 'intrasymbol_bits': counter widths needed to
+				hold them without saturating.
+			'interpulse_saturated': fraction of intervals which the HDL
+				counter (see hdl_max_interpulse) would clip.
+		Only a chunk is held in memory at a time. Intervals which span chunks
+		are counted.
+
+	>>> bits = np.zeros(64, dtype=np.uint8)
+	>>> bits[[3, 20, 21, 60]] = 1
+	>>> stats = freq_stats(iter([bits[:10], bits[10:50], bits[50:]]), 1)
+	>>> stats['interpulse_hist'].tolist()[::16], stats['intrasymbol_hist'].tolist()
+	([1, 1, 0], [1, 2, 1])
+	>>> stats['max_interpulse'], stats['interpulse_bits']
+	(38, 6)
+	"""
+	interpulse_hist = np.zeros(1, dtype=np.int64)
+	intrasymbol_hist = np.zeros(1, dtype=np.int64)
+	num_chips = 0
+	num_pulses = 0
+	last_pulse = None
+	leftover = np.zeros(0, dtype=np.uint8)
+	partial = np.zeros(0, dtype=bool)
+
+	for chunk in iter_bit_chunks(source, chunk_rows):
+		bits = np.concatenate((leftover, chunk))
+		whole = bits_per_chip*(len(bits)//bits_per_chip)
+		leftover = bits[whole:]
+		pulse_detected = pulse_chips(bits[:whole], bits_per_chip, pulse_threshold)
+
+		# Intervals, including the one from the previous chunk's last pulse
+		pulses = np.flatnonzero(pulse_detected) + num_chips
+		if last_pulse is not None:
+			pulses = np.concatenate(([last_pulse], pulses))
+		if len(pulses) > 0:
+			last_pulse = pulses[-1]
+		hist = np.bincount(np.diff(pulses) - 1)
+		interpulse_hist = _add_hist(interpulse_hist, hist)
+
+		# Whole symbols, carrying the partial one over
+		symbols = np.concatenate((partial, pulse_detected))
+		counts = intrasymbol_counts(symbols, symbol_chips)
+		partial = symbols[len(counts)*symbol_chips:]
+		intrasymbol_hist = _add_hist(intrasymbol_hist, np.bincount(counts))
+
+		num_chips = num_chips + len(pulse_detected)
+		num_pulses = num_pulses + int(pulse_detected.sum())
+
+	max_interpulse = int(np.flatnonzero(interpulse_hist)[-1]) if interpulse_hist.any() else 0
+	max_intrasymbol = int(np.flatnonzero(intrasymbol_hist)[-1]) if intrasymbol_hist.any() else 0
+	num_intervals = int(interpulse_hist.sum())
+	saturated = int(interpulse_hist[hdl_max_interpulse(symbol_chips)+1:].sum())
+	return dict(num_chips=num_chips, num_pulses=num_pulses,
+		interpulse_hist=interpulse_hist, intrasymbol_hist=intrasymbol_hist,
+		max_interpulse=max_interpulse, max_intrasymbol=max_intrasymbol,
+		interpulse_bits=max_interpulse.bit_length(),
+		intrasymbol_bits=max_intrasymbol.bit_length(),
+		interpulse_saturated=saturated/num_intervals if num_intervals > 0 else 0.0)
+
+def _add_hist(a, b):
+	"""
+	Outputs:
+		Returns the sum of two histograms of possibly different lengths.
+	"""
+	if len(b) > len(a):
+		a, b = b, a
+	a = a.copy()
+	a[:len(b)] += b
+	return a
+
+def resample_clock(chips, freq_offset_ppm=0, jitter_rms=0, phase=0, rng=None):
+	"""
+	Inputs:
+		chips: Array whose first axis is chips as sent by the TX, e.g. chip
+			values or (num_chips, bits_per_chip) bits.
+		freq_offset_ppm: Float. How much faster the RX clock runs than the
+			TX clock, in parts per million.
+		jitter_rms: Float. RMS jitter of each RX sampling instant, in TX chips.
+		phase: Float. Where the first RX sample lands, in TX chips [0, 1).
+		rng: np.random.Generator. Source of randomness for the jitter.
+	Outputs:
+		Returns the chips the RX samples: RX chip k is the TX chip in flight
+		at k/(1+freq_offset_ppm*1e-6) + phase (+ jitter). A faster RX clock
+		samples some chips twice and a slower one skips some. Samples past
+		the end of 'chips' are dropped.
+
+	>>> resample_clock(np.arange(10), freq_offset_ppm=1e5).tolist()
+	[0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+	>>> resample_clock(np.arange(10), freq_offset_ppm=-2e5).tolist()
+	[0, 1, 2, 3, 5, 6, 7, 8]
+	"""
+	chips = np.asarray(chips)
+	rate = 1 + freq_offset_ppm*1e-6
+	num_samples = int(np.ceil((len(chips) - phase)*rate))
+	times = np.arange(num_samples)/rate + phase
+	if jitter_rms != 0:
+		if rng is None:
+			rng = np.random.default_rng()
+		times = times + rng.normal(0, jitter_rms, size=num_samples)
+	idx = np.floor(times).astype(np.int64)
+	return chips[np.clip(idx[idx < len(chips)], 0, len(chips)-1)]
+
+def estimate_freq_error(pulse_detected, symbol_chips=16):
+	"""
+	Inputs:
+		pulse_detected: Boolean array, one entry per RX chip, from a stretch
+			where the TX sends one pulse per symbol in the same chip (e.g.
+			the preamble).
+		symbol_chips: Integer. Chips per symbol.
+	Outputs:
+		Returns the estimated RX clock frequency offset in ppm (same sign as
+		resample_clock's freq_offset_ppm), or NaN if there are fewer than two
+		pulses. Runs of adjacent pulses (a chip sampled twice) count once,
+		missing pulses are bridged by rounding each interval to a whole
+		number of symbols, and the offset is the slope of a least-squares
+		fit of the pulse times against their nominal times.
+
+	>>> tx = ppm_mod_vals([0]*2000, 16, 1).reshape(-1, 1)
+	>>> rx = resample_clock(tx, freq_offset_ppm=1000)[:,0] == 1
+	>>> round(estimate_freq_error(rx, 16))
+	999
+	"""
+	pulse_detected = np.asarray(pulse_detected, dtype=bool)
+	rising = np.flatnonzero(pulse_detected & ~np.concatenate(([False], pulse_detected[:-1])))
+	if len(rising) < 2:
+		return np.nan
+	symbols = np.maximum(np.round(np.diff(rising)/symbol_chips), 1)
+	nominal = symbol_chips*np.concatenate(([0], np.cumsum(symbols)))
+	slope = np.polyfit(nominal, rising, 1)[0]
+	return (slope - 1)*1e6
+
+def sim_freq_recovery(num_symbols, symbol_chips=16, bits_per_chip=1, freq_offset_ppm=0,
+				jitter_rms=0, preamble_val=0, pulse_threshold=None, rng=None):
+	"""
+	Inputs:
+		num_symbols: Integer. Number of preamble symbols sent.
+		symbol_chips: Integer. Chips per symbol.
+		bits_per_chip: Integer. Bits per chip.
+		freq_offset_ppm, jitter_rms: See resample_clock.
+		preamble_val: Integer. Symbol repeated by the TX.
+		pulse_threshold: Integer. See pulse_chips.
+		rng: np.random.Generator. Source of randomness (phase and jitter).
+	Outputs:
+		Returns a dictionary with the 'estimate_ppm' from estimate_freq_error
+		and the freq_stats of the RX chip stream ('stats'). With jitter, RX
+		samples near a chip edge can miss the pulse entirely, which is what
+		pushes the intervals past a symbol.
+
+	>>> r = sim_freq_recovery(2000, freq_offset_ppm=-100, jitter_rms=.05,
+	...		rng=np.random.default_rng(0))
+	>>> round(r['estimate_ppm']), r['stats']['max_interpulse']
+	(-100, 64)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	tx = ppm_mod_vals(np.full(num_symbols, preamble_val), symbol_chips,
+		bits_per_chip).reshape(-1, bits_per_chip)
+	rx = resample_clock(tx, freq_offset_ppm, jitter_rms, phase=rng.random(),
+		rng=rng).ravel()
+	pulse_detected = pulse_chips(rx, bits_per_chip, pulse_threshold)
+	return dict(estimate_ppm=estimate_freq_error(pulse_detected, symbol_chips),
+		stats=freq_stats(rx, bits_per_chip, symbol_chips, pulse_threshold))
+
+if __name__ == "__main__":
+	for ppm in [-1000, -100, 0, 100, 1000]:
+		r = sim_freq_recovery(100000, freq_offset_ppm=ppm, jitter_rms=.1)
+		print(ppm, r['estimate_ppm'], r['stats']['max_interpulse'])
@@ -0,0 +1,545 @@
+# Created 2026/10/17
+
+# Bit-accurate reference model of ppm16_demod.v (with ppm16_correlator.v) so
+# regressions can be checked without the HDL simulator. The FSM is stepped a
+# symbol at a time rather than a clock at a time: the correlator is evaluated
+# for every cycle up front as one array operation, scanning jumps straight to
+# the next preamble match, and the per-cycle scan chain (*_SC) signals are
+# filled back in afterwards only if they're asked for.
+#
+# Quirks of the HDL which are modeled on purpose:
+#	- Invalid correlator input is forced to all zeros, which the comparator
+#		tree decodes as symbol 7 with a peak of 0.
+#	- The threshold is only applied in S_SCAN. Every other state compares
+#		against 0, so S_PREAMBLE_MATCH1 accepts any preamble-valued symbol.
+#	- preamble2_symbol_count is never reset. It starts out as X, which the
+#		first S_PREAMBLE_MATCH2 symbol turns into 6 (SFD0 can't be accepted on
+#		that symbol); after that it saturates at 6. X is reported as -1.
+#	- packet_data_length_symbols loads corr_symbol into the nibble picked by
+#		primary_header2_symbol_count on every clock, so nibble 0 is clobbered
+#		by the invalid-input symbol (7) in S_DATA_FIELD. The header nibbles
+#		also go in LSB first, and the length is compared in symbols.
+#	- S_DATA_FIELD drops to S_IDLE, which stops shifting, so only the first
+#		packet after rx_start is received.
+#	- In the chip-parallel build the testbench hands over
+#		row[(c+1)*CHIP_BITS-1 -: CHIP_BITS], so the later bit of each chip
+#		is its MSB. The SERIAL build shifts bits into the LSB, so the earlier
+#		bit is the MSB.
+
+import numpy as np
+import doctest
+import re
+from numpy.lib.stride_tricks import sliding_window_view
+from ppm_capture import read_b_chunks
+
+# FSM states, same encoding as ppm16_demod.v
+S_IDLE = 0
+S_SCAN = 1
+S_PREAMBLE_MATCH1 = 2
+S_PREAMBLE_MATCH2 = 3
+S_SFD_MATCH = 4
+S_PRIMARY_HEADER1 = 5
+S_PRIMARY_HEADER2 = 6
+S_DATA_FIELD = 7
+
+# Chips going into the correlator and symbols per header section
+HDL_CHIPS = 16
+PREAMBLE2_MAX = 6
+PRIMARY_HEADER1_SYMBOLS = 8
+PRIMARY_HEADER2_SYMBOLS = 4
+
+# Symbol the comparator tree gives for all-zero (invalid) input
+INVALID_SYMBOL = 7
+
+# Testbench timing: first clock edge where data is fed in, and clock period
+TB_FIRST_EDGE = 6500
+TB_CLK_PERIOD = 1000
+
+# Windows evaluated per correlator call, to bound memory use
+MODEL_CHUNK_CYCLES = 1 << 18
+
+def ppm16_correlate(chips_in, threshold=0):
+	"""
+	Inputs:
+		chips_in: (n, 16) integer array. Row i holds the chips_in[15:0] port
+			of ppm16_correlator for one evaluation (column j is chips_in[j]).
+		threshold: Integer or array. corr_threshold.
+	Outputs:
+		Returns (symbol, peak_value, threshold_unmet) arrays, matching the
+		comparator tree: ties within each half of the chips go to the higher
+		index, and ties between the halves go to the lower half.
+
+	>>> chips = np.zeros((3, 16), dtype=np.uint8)
+	>>> chips[1, [2, 5]] = 1
+	>>> chips[2, [5, 12]] = 1
+	>>> symbol, peak, unmet = ppm16_correlate(chips, threshold=1)
+	>>> symbol.tolist(), peak.tolist(), unmet.tolist()
+	([7, 5, 5], [0, 1, 1], [True, False, False])
+	"""
+	chips_in = np.asarray(chips_in)
+	half = HDL_CHIPS // 2
+	lower = chips_in[:, :half]
+	upper = chips_in[:, half:]
+	# Highest index of the maximum within each half
+	idx_lower = half - 1 - np.argmax(lower[:, ::-1], axis=1)
+	idx_upper = HDL_CHIPS - 1 - np.argmax(upper[:, ::-1], axis=1)
+	peak_lower = lower.max(axis=1)
+	peak_upper = upper.max(axis=1)
+	upper_wins = peak_lower < peak_upper
+	symbol = np.where(upper_wins, idx_upper, idx_lower)
+	peak_value = np.where(upper_wins, peak_upper, peak_lower)
+	return symbol, peak_value, peak_value < threshold
+
+def hdl_inputs(bits, bits_per_chip, serial=False):
+	"""
+	Inputs:
+		bits: Array of received bits in the order received (e.g. from
+			ppm_capture.read_b_chunks).
+		bits_per_chip: Integer. CHIP_BITS.
+		serial: Boolean. True for the SERIAL build of ppm16_demod.
+	Outputs:
+		Returns the value on din for every clock cycle the testbench feeds:
+		the bits themselves for SERIAL, otherwise one chip per cycle with the
+		later bit as the MSB. A trailing partial chip is dropped.
+	"""
+	bits = np.asarray(bits, dtype=np.int64).ravel()
+	if serial:
+		return bits
+	num_chips = len(bits) // bits_per_chip
+	chips = bits[:num_chips*bits_per_chip].reshape(num_chips, bits_per_chip)
+	return chips @ (1 << np.arange(bits_per_chip))
+
+def _shifted_chips(din, bits_per_chip, serial, start, stop):
+	"""
+	Inputs:
+		din: Array of din values, one per cycle.
+		bits_per_chip, serial: See hdl_inputs.
+		start, stop: Integers. Range of cycles.
+	Outputs:
+		Returns a (stop-start, 16) array of the shifted chips (chips_in of
+		the correlator) during each cycle, before that cycle's din is shifted
+		in. Column 0 is the most recent chip.
+	"""
+	stride = bits_per_chip if serial else 1
+	span = HDL_CHIPS*stride
+	lo = max(0, start-span)
+	units = np.zeros(span + stop - start, dtype=np.int64)
+	units[span-(start-lo):span+min(stop, len(din))-start] = din[lo:stop]
+	if serial:
+		# Chip value starting at every bit, earliest bit as the MSB
+		windows = sliding_window_view(units, bits_per_chip)
+		units = windows @ (1 << np.arange(bits_per_chip-1, -1, -1))
+	windows = sliding_window_view(units, (HDL_CHIPS-1)*stride+1)[:stop-start]
+	return windows[:, ::stride][:, ::-1]
+
+def _correlate_cycles(din, bits_per_chip, serial, num_cycles):
+	"""
+	Outputs:
+		Returns (symbol, peak_value) of the correlator with valid input for
+		cycles 0 to num_cycles, inclusive, evaluated in chunks.
+	"""
+	symbol = np.empty(num_cycles+1, dtype=np.int64)
+	peak_value = np.empty(num_cycles+1, dtype=np.int64)
+	for start in range(0, num_cycles+1, MODEL_CHUNK_CYCLES):
+		stop = min(start+MODEL_CHUNK_CYCLES, num_cycles+1)
+		chips_in = _shifted_chips(din, bits_per_chip, serial, start, stop)
+		symbol[start:stop], peak_value[start:stop], _ = ppm16_correlate(chips_in)
+	return symbol, peak_value
+
+def ppm16_demod_model(bits, bits_per_chip, threshold_ext=None, serial=False,
+				preamble_val=0, sfd0_val=7, sfd1_val=10, preamble2_init=None,
+				trace=False):
+	"""
+	Inputs:
+		bits: Array of received bits in the order received.
+		bits_per_chip: Integer. CHIP_BITS.
+		threshold_ext: Integer. corr_threshold_ext. Defaults to what
+			tb_ppm16_demod.v uses, 1 followed by CHIP_BITS-1 zeros.
+		serial: Boolean. True to model the SERIAL build (one bit per clock).
+		preamble_val, sfd0_val, sfd1_val: Integers. `PREAMBLE_SYMBOL,
+			`SFD0 and `SFD1 from chips.vh.
+		preamble2_init: Integer or None. preamble2_symbol_count coming out
+			of reset. None is X, which is what a fresh simulation has.
+		trace: Boolean. If True, also return every scan chain signal for
+			every cycle.
+	Outputs:
+		Returns a dictionary with
+			'num_cycles': cycles fed in, starting from the clock edge where
+				the FSM enters S_SCAN.
+			'dout_cycles', 'dout': cycles where dout_valid is high and the
+				symbols on dout.
+			'packet_detected': cycles where packet_detected is high.
+			'state', 'preamble2_symbol_count': registers after the last cycle.
+			'trace': (if asked for) dictionary of per-cycle arrays named after
+				the DEMOD_*_SC ports, plus 'din'.
+
+	>>> from ppm_base import ppm_mod_vals
+	>>> header = [0]*8 + [0, 0, 0, 0]
+	>>> packet = ppm_mod_vals([0]*8 + [7, 10] + header + [9, 4, 1, 2, 3, 4, 5, 6], 16, 2)
+	>>> zeros = np.zeros(6, dtype=np.uint8)
+	>>> result = ppm16_demod_model(np.concatenate([zeros, packet, zeros]), 2)
+	>>> result['dout'].tolist(), result['packet_detected'].tolist()
+	([9, 4, 1, 2, 3, 4, 5, 6], [356])
+	>>> result['state'] == S_IDLE, result['preamble2_symbol_count']
+	(True, 6)
+	"""
+	if threshold_ext is None:
+		threshold_ext = 1 << (bits_per_chip-1)
+	din = hdl_inputs(bits, bits_per_chip, serial)
+	num_cycles = len(din)
+	symbol_cycles = HDL_CHIPS*(bits_per_chip if serial else 1)
+
+	symbol_all, peak_all = _correlate_cycles(din, bits_per_chip, serial, num_cycles)
+	scan_match = np.flatnonzero((symbol_all[:num_cycles] == preamble_val)
+							& (peak_all[:num_cycles] >= threshold_ext))
+
+	# Registers which only change on symbol boundaries. Every state other
+	# than S_SCAN and S_IDLE starts on a symbol boundary.
+	state = S_SCAN
+	preamble2 = -1 if preamble2_init is None else preamble2_init
+	primary_header1 = 0
+	primary_header2 = 0
+	data_field = 0
+	data_length = 0
+
+	# (start cycle, state, preamble2, primary_header1, primary_header2,
+	# data_field) for every stretch of cycles with fixed registers
+	segments = []
+	dout_cycles = []
+	packet_detected = []
+
+	cycle = 0
+	while cycle < num_cycles:
+		segments.append((cycle, state, preamble2, primary_header1,
+			primary_header2, data_field))
+		if state == S_IDLE:
+			break
+		if state == S_SCAN:
+			match_idx = np.searchsorted(scan_match, cycle)
+			if match_idx == len(scan_match):
+				break
+			cycle = int(scan_match[match_idx]) + 1
+			state = S_PREAMBLE_MATCH1
+			continue
+
+		# One symbol, decided on its last cycle
+		if state == S_DATA_FIELD and data_field == 0:
+			packet_detected.append(cycle)
+		boundary = cycle + symbol_cycles - 1
+		if boundary >= num_cycles:
+			break
+		corr_symbol = symbol_all[boundary]
+		cycle = boundary + 1
+
+		if state == S_PREAMBLE_MATCH1:
+			state = S_PREAMBLE_MATCH2 if corr_symbol == preamble_val else S_SCAN
+		elif state == S_PREAMBLE_MATCH2:
+			max_preamble2 = preamble2 == PREAMBLE2_MAX
+			if preamble2 == -1 or max_preamble2:
+				preamble2 = PREAMBLE2_MAX
+			else:
+				preamble2 = preamble2 + 1
+			if corr_symbol == preamble_val:
+				state = S_PREAMBLE_MATCH2
+			elif max_preamble2 and corr_symbol == sfd0_val:
+				state = S_SFD_MATCH
+			else:
+				state = S_SCAN
+		elif state == S_SFD_MATCH:
+			state = S_PRIMARY_HEADER1 if corr_symbol == sfd1_val else S_SCAN
+		elif state == S_PRIMARY_HEADER1:
+			if primary_header1 == PRIMARY_HEADER1_SYMBOLS-1:
+				primary_header1 = 0
+				state = S_PRIMARY_HEADER2
+			else:
+				primary_header1 = primary_header1 + 1
+		elif state == S_PRIMARY_HEADER2:
+			data_length = data_length | (int(corr_symbol) << 4*primary_header2)
+			if primary_header2 == PRIMARY_HEADER2_SYMBOLS-1:
+				primary_header2 = 0
+				state = S_DATA_FIELD
+			else:
+				primary_header2 = primary_header2 + 1
+		elif state == S_DATA_FIELD:
+			dout_cycles.append(boundary)
+			# Nibble 0 was overwritten with the previous (invalid) cycle's symbol
+			if data_field == (data_length & 0xFFF0) | INVALID_SYMBOL:
+				data_field = 0
+				state = S_IDLE
+			else:
+				data_field = data_field + 1
+
+	dout_cycles = np.asarray(dout_cycles, dtype=np.int64)
+	result = dict(num_cycles=num_cycles, dout_cycles=dout_cycles,
+		dout=symbol_all[dout_cycles],
+		packet_detected=np.asarray(packet_detected, dtype=np.int64),
+		state=state, preamble2_symbol_count=preamble2)
+	if trace:
+		result['trace'] = _trace(din, bits_per_chip, serial, threshold_ext,
+			segments, state, symbol_all, peak_all)
+	return result
+
+def _trace(din, bits_per_chip, serial, threshold_ext, segments, final_state,
+		symbol_all, peak_all):
+	"""
+	Outputs:
+		Returns the per-cycle scan chain signals rebuilt from the segments
+		ppm16_demod_model walked through.
+	"""
+	num_cycles = len(din)
+	cycles = np.arange(num_cycles)
+	symbol_cycles = HDL_CHIPS*(bits_per_chip if serial else 1)
+	starts = np.asarray([s[0] for s in segments] + [num_cycles], dtype=np.int64)
+	lengths = np.diff(starts)
+	seg = lambda k: np.repeat(np.asarray([s[k] for s in segments], dtype=np.int64), lengths)
+
+	state = seg(1)
+	counting = (state != S_SCAN) & (state != S_IDLE)
+	phase = np.where(counting, cycles - np.repeat(starts[:-1], lengths), 0)
+	if serial:
+		chip_bit_count = phase % bits_per_chip
+		symbol_chip_count = phase // bits_per_chip
+	else:
+		chip_bit_count = np.zeros(num_cycles, dtype=np.int64)
+		symbol_chip_count = phase
+	boundary = counting & (phase == symbol_cycles-1)
+
+	corr_input_valid = (state == S_SCAN) | boundary
+	corr_threshold = np.where(state == S_SCAN, threshold_ext, 0)
+	corr_symbol = np.where(corr_input_valid, symbol_all[:num_cycles], INVALID_SYMBOL)
+	corr_peak_value = np.where(corr_input_valid, peak_all[:num_cycles], 0)
+
+	# Each nibble holds the symbol from the last cycle which selected it
+	primary_header2 = seg(4)
+	data_length = np.zeros(num_cycles, dtype=np.int64)
+	for k in range(PRIMARY_HEADER2_SYMBOLS):
+		last = np.maximum.accumulate(np.where(primary_header2 == k, cycles, -1))
+		last = np.concatenate(([-1], last[:-1]))
+		data_length |= np.where(last >= 0, corr_symbol[np.maximum(last, 0)], 0) << 4*k
+
+	# Shifting stops for good once the FSM is in S_IDLE
+	idle = np.flatnonzero(state == S_IDLE)
+	frozen = cycles if len(idle) == 0 else np.minimum(cycles, idle[0])
+	shifted_chips = _shifted_chips(din, bits_per_chip, serial, 0, num_cycles)[frozen]
+
+	preamble2 = seg(2)
+	data_field = seg(5)
+	primary_header1 = seg(3)
+	return dict(din=din, state=state,
+		next_state=np.append(state[1:], final_state),
+		shifted_chips=shifted_chips,
+		corr_input_valid=corr_input_valid, corr_threshold=corr_threshold,
+		corr_symbol=corr_symbol, corr_peak_value=corr_peak_value,
+		corr_threshold_unmet=corr_peak_value < corr_threshold,
+		shift_new_chip=state != S_IDLE,
+		chip_bit_count=chip_bit_count, symbol_chip_count=symbol_chip_count,
+		preamble2_symbol_count=preamble2,
+		primary_header1_symbol_count=primary_header1,
+		primary_header2_symbol_count=primary_header2,
+		data_field_symbol_count=data_field,
+		max_chip_bit_count=chip_bit_count == bits_per_chip-1 if serial else
+			np.ones(num_cycles, dtype=bool),
+		max_symbol_chip_count=symbol_chip_count == HDL_CHIPS-1,
+		max_preamble2_symbol_count=preamble2 == PREAMBLE2_MAX,
+		max_primary_header1_symbol_count=primary_header1 == PRIMARY_HEADER1_SYMBOLS-1,
+		max_primary_header2_symbol_count=primary_header2 == PRIMARY_HEADER2_SYMBOLS-1,
+		max_data_field_symbol_count=data_field == data_length,
+		increment_chip_bit_count=counting & serial,
+		increment_symbol_chip_count=counting,
+		increment_preamble2_symbol_count=state == S_PREAMBLE_MATCH2,
+		increment_primary_header1_symbol_count=state == S_PRIMARY_HEADER1,
+		increment_primary_header2_symbol_count=state == S_PRIMARY_HEADER2,
+		increment_data_field_symbol_count=state == S_DATA_FIELD,
+		packet_data_length_symbols=data_length,
+		packet_detected=(state == S_DATA_FIELD) & (phase == 0) & (data_field == 0),
+		dout_valid=(state == S_DATA_FIELD) & boundary)
+
+def tb_result_text(result, first_edge=TB_FIRST_EDGE, clk_period=TB_CLK_PERIOD):
+	"""
+	Inputs:
+		result: Dictionary from ppm16_demod_model.
+		first_edge: Integer. $time (ps) of the clock edge where the FSM enters
+			S_SCAN. tb_ppm16_demod.v gets there 7 edges after it starts a file.
+		clk_period: Integer. CLK_PERIOD in ps.
+	Outputs:
+		Returns what tb_ppm16_demod.v writes to the *_result.txt file for the
+		same input: a "PACKET DETECTED" line when packet_detected rises and
+		the bits of dout for every valid cycle.
+
+	>>> result = dict(packet_detected=np.array([3]), dout_cycles=np.array([18, 34]),
+	...		dout=np.array([9, 4]))
+	>>> tb_result_text(result)
+	'PACKET DETECTED AT TIME                 9500 us\\n10010100'
+	"""
+	events = [(int(c), "PACKET DETECTED AT TIME {0:20d} us\n".format(
+				first_edge + int(c)*clk_period)) for c in result['packet_detected']]
+	events = events + [(int(c)+1, "{0:04b}".format(int(s)))
+				for c, s in zip(result['dout_cycles'], result['dout'])]
+	# Ties go to the packet line, since it's written in the active region
+	return ''.join([text for _, text in sorted(events, key=lambda e: e[0])])
+
+def parse_tb_result(text):
+	"""
+	Inputs:
+		text: String. Contents of a *_result.txt file from tb_ppm16_demod.v.
+	Outputs:
+		Returns (packet_times, dout) where packet_times is a list of the
+		integer $time values of the "PACKET DETECTED" lines and dout is the
+		list of symbols written after them.
+
+	>>> parse_tb_result('PACKET DETECTED AT TIME   9500 us\\n10010100')
+	([9500], [9, 4])
+	"""
+	packet_times = [int(t) for t in re.findall(r"PACKET DETECTED AT TIME\s+(\d+)", text)]
+	dout_bits = re.sub(r"PACKET DETECTED AT TIME\s+\d+\s*us", "", text)
+	dout_bits = re.sub(r"\s", "", dout_bits)
+	dout = [int(dout_bits[i:i+4], 2) for i in range(0, len(dout_bits) - len(dout_bits) % 4, 4)]
+	return packet_times, dout
+
+def diff_tb_result(result, text, first_edge=TB_FIRST_EDGE, clk_period=TB_CLK_PERIOD):
+	"""
+	Inputs:
+		result: Dictionary from ppm16_demod_model.
+		text: String. Contents of the matching *_result.txt.
+		first_edge, clk_period: See tb_result_text.
+	Outputs:
+		Returns a list of strings describing every difference between the
+		model and the HDL dump. Empty if they agree.
+	"""
+	expected_times, expected_dout = parse_tb_result(tb_result_text(result,
+		first_edge, clk_period))
+	got_times, got_dout = parse_tb_result(text)
+	diffs = []
+	if expected_times != got_times:
+		diffs.append("packet_detected: model {0}, HDL {1}".format(expected_times, got_times))
+	for i in range(max(len(expected_dout), len(got_dout))):
+		model = expected_dout[i] if i < len(expected_dout) else None
+		hdl = got_dout[i] if i < len(got_dout) else None
+		if model != hdl:
+			diffs.append("dout[{0}]: model {1}, HDL {2}".format(i, model, hdl))
+	return diffs
+
+def ppm_freq_recovery_model(bits, bits_per_chip, pulse_threshold=None,
+				symbol_chips=16):
+	"""
+	Inputs:
+		bits: Array of received bits in the order received.
+		bits_per_chip: Integer. CHIP_BITS.
+		pulse_threshold: Integer. Defaults to what tb_ppm_freq_recovery.v
+			uses, 1 followed by CHIP_BITS-1 zeros.
+		symbol_chips: Integer. SYMBOL_CHIPS (a power of two).
+	Outputs:
+		Returns a dictionary of per-cycle arrays for ppm_freq_recovery.v with
+		freq_ok low from cycle 0 (the clock edge where the testbench starts
+		feeding chips): 'din', 'pulse_detected', 'symbol_cycle_count',
+		'interpulse_cycles' and 'intrasymbol_pulses' (the registered outputs,
+		-1 while still X).
+	Notes:
+		Cycle 0 is spent in S_IDLE, so the first pulse from cycle 1 on moves
+		S_SCAN to S_PULSE1 and every pulse after that registers the number
+		of cycles since the previous one (not counting either end, saturating).
+		intrasymbol_pulses registers the pulses counted over each nominal
+		symbol (saturating at 3) when the symbol counter wraps.
+
+	>>> bits = np.zeros(40, dtype=np.uint8)
+	>>> bits[[1, 4, 9, 20]] = 1
+	>>> result = ppm_freq_recovery_model(bits, 1)
+	>>> result['interpulse_cycles'][[5, 10, 21]].tolist()
+	[2, 4, 10]
+	>>> result['intrasymbol_pulses'][[16, 17, 33]].tolist()
+	[0, 3, 1]
+	"""
+	if pulse_threshold is None:
+		pulse_threshold = 1 << (bits_per_chip-1)
+	din = hdl_inputs(bits, bits_per_chip)
+	num_cycles = len(din)
+	cycles = np.arange(num_cycles)
+	max_interpulse = (1 << (int(np.ceil(np.log2(symbol_chips)))+1)) - 1
+	pulse_detected = din >= pulse_threshold
+
+	# Interpulse counts register on every pulse after the one which left
+	# S_SCAN, and show up the cycle after
+	pulses = np.flatnonzero(pulse_detected[1:]) + 1
+	gaps = np.minimum(np.diff(pulses) - 1, max_interpulse)
+	last = np.searchsorted(pulses[1:] + 1, cycles, side='right') - 1
+	interpulse_cycles = np.where(last >= 0, gaps[np.maximum(last, 0)] if len(gaps) else -1, -1)
+
+	# The symbol counter holds in S_IDLE for cycle 0, then free-runs
+	symbol_cycle_count = np.maximum(cycles - 1, 0) % symbol_chips
+	wraps = np.flatnonzero(symbol_cycle_count == symbol_chips-1)
+	wraps = wraps[wraps > 0]
+	pulse_total = np.concatenate(([0], np.cumsum(pulse_detected)))
+	counts = np.minimum(pulse_total[wraps+1] - pulse_total[wraps+1-symbol_chips], 3)
+	last = np.searchsorted(wraps + 1, cycles, side='right') - 1
+	intrasymbol_pulses = np.where(last >= 0, counts[np.maximum(last, 0)] if len(counts) else 0, 0)
+
+	return dict(din=din, pulse_detected=pulse_detected,
+		symbol_cycle_count=symbol_cycle_count,
+		interpulse_cycles=interpulse_cycles, intrasymbol_pulses=intrasymbol_pulses,
+		max_interpulse=max_interpulse)
+
+def tb_freq_result_text(result):
+	"""
+	Inputs:
+		result: Dictionary from ppm_freq_recovery_model.
+	Outputs:
+		Returns (interpulse_text, intrasymbol_text), what
+		tb_ppm_freq_recovery.v writes to *_interpulseCycles.txt (the
+		registered count whenever pulse_detected toggles) and
+		*_intrasymbolPulses.txt (every new registered pulse count, starting
+		with the 0 from reset).
+	"""
+	width = len(str(result['max_interpulse']))
+	fmt = lambda v: ('x' if v < 0 else str(int(v))).rjust(width)
+	pulse_detected = np.concatenate(([False], result['pulse_detected']))
+	interpulse = np.concatenate(([-1], result['interpulse_cycles']))
+	toggles = np.flatnonzero(pulse_detected[1:] != pulse_detected[:-1])
+	interpulse_text = ''.join([fmt(v) for v in interpulse[toggles]])
+
+	intrasymbol = np.concatenate(([0], result['intrasymbol_pulses']))
+	changes = np.flatnonzero(intrasymbol[1:] != intrasymbol[:-1]) + 1
+	intrasymbol_text = ''.join(['0'] + [str(int(v)) for v in intrasymbol[changes]])
+	return interpulse_text, intrasymbol_text
+
+def diff_tb_freq_result(result, interpulse_text, intrasymbol_text):
+	"""
+	Inputs:
+		result: Dictionary from ppm_freq_recovery_model.
+		interpulse_text, intrasymbol_text: Contents of the testbench's
+			*_interpulseCycles.txt and *_intrasymbolPulses.txt.
+	Outputs:
+		Returns a list of strings describing the differences, ignoring X
+		values (which depend on event ordering at time 0). Empty if the model
+		and the HDL agree.
+	"""
+	expected = tb_freq_result_text(result)
+	width = len(str(result['max_interpulse']))
+	diffs = []
+	for name, model, hdl, w in (('interpulse_cycles', expected[0], interpulse_text, width),
+			('intrasymbol_pulses', expected[1], intrasymbol_text, 1)):
+		tokens = lambda text: [t.strip() for t in
+			[text[i:i+w] for i in range(0, len(text.rstrip('\n')), w)] if t.strip() != 'x']
+		model, hdl = tokens(model), tokens(hdl)
+		if model != hdl:
+			diffs.append("{0}: model {1}, HDL {2}".format(name, model, hdl))
+	return diffs
+
+def model_b_file(inputFile, bits_per_chip, **kwargs):
+	"""
+	Inputs:
+		inputFile: String. Path to the .b file the testbench reads with
+			$readmemb.
+		bits_per_chip: Integer. CHIP_BITS.
+		kwargs: Passed along to ppm16_demod_model.
+	Outputs:
+		Returns the ppm16_demod_model result for the file.
+	"""
+	chunks = list(read_b_chunks(inputFile))
+	bits = np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=np.uint8)
+	return ppm16_demod_model(bits, bits_per_chip, **kwargs)
+
+if __name__ == "__main__":
+	# Check the model against a testbench dump of the spot-check file
+	inputFile = "../verilog/demod.b"
+	result = model_b_file(inputFile, 2)
+	print(tb_result_text(result))
@@ -0,0 +1,227 @@
+# Created 2026/10/17
+
+# Opt-in instrumentation for the PPM chain. Hot-path functions in ppm_base,
+# ppm_capture, ppm_rx and ppm_filegen bump named counters and are wrapped in
+# timers, but all of it is a single dictionary lookup until
+# instrument_enable() is called. Summaries go out as JSON or CSV, and
+# profile_call writes cProfile dumps for pstats/snakeviz.
+
+import doctest
+import cProfile
+import csv
+import functools
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Global instrumentation state. Counters map name -> total, timers map
+# name -> [calls, seconds]. Timers are inclusive, so nested stages (e.g.
+# rx_ppm_packets pulling from read_b_chunks) both include the inner time.
+INSTRUMENT = dict(enabled=False, counters=dict(), timers=dict(), lock=threading.Lock())
+
+def instrument_enable(enabled=True):
+	"""
+	Inputs:
+		enabled: Boolean. Turns instrumentation on or off. Counts and times
+			collected so far are kept; see instrument_reset.
+	Outputs:
+		No return value.
+	"""
+	INSTRUMENT['enabled'] = enabled
+
+def instrument_reset():
+	"""
+	Outputs:
+		No return value. Clears every counter and timer.
+	"""
+	with INSTRUMENT['lock']:
+		INSTRUMENT['counters'].clear()
+		INSTRUMENT['timers'].clear()
+
+def count(name, n=1):
+	"""
+	Inputs:
+		name: String. Counter to add to.
+		n: Integer. Amount to add.
+	Outputs:
+		No return value. Does nothing unless instrumentation is enabled;
+		callers computing 'n' should check INSTRUMENT['enabled'] first when
+		that isn't free.
+	"""
+	if not INSTRUMENT['enabled']:
+		return
+	with INSTRUMENT['lock']:
+		INSTRUMENT['counters'][name] = INSTRUMENT['counters'].get(name, 0) + int(n)
+
+def _add_time(name, seconds, calls=1):
+	"""
+	Outputs:
+		No return value. Adds to a timer.
+	"""
+	with INSTRUMENT['lock']:
+		timer = INSTRUMENT['timers'].setdefault(name, [0, 0.0])
+		timer[0] = timer[0] + calls
+		timer[1] = timer[1] + seconds
+
+@contextmanager
+def timer(name):
+	"""
+	Inputs:
+		name: String. Timer to add the time spent in the 'with' block to.
+	Outputs:
+		Context manager. Does nothing unless instrumentation is enabled.
+	"""
+	if not INSTRUMENT['enabled']:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		_add_time(name, time.perf_counter() - start)
+
+def _timed_gen(name, gen):
+	"""
+	Outputs:
+		Generator passing along everything from 'gen', timing only the time
+		spent inside it (not in whoever is consuming it).
+	"""
+	_add_time(name, 0.0)
+	try:
+		while True:
+			start = time.perf_counter()
+			try:
+				item = next(gen)
+			except StopIteration:
+				return
+			finally:
+				_add_time(name, time.perf_counter() - start, calls=0)
+			yield item
+	finally:
+		gen.close()
+
+def timed(name=None):
+	"""
+	Inputs:
+		name: String or None. Timer name, the function's name if None.
+	Outputs:
+		Returns a decorator which times every call of a function (or every
+		step of a generator function) while instrumentation is enabled.
+		When it isn't, the only cost is one dictionary lookup per call.
+
+	>>> @timed()
+	... def double(x):
+	...     return 2*x
+	>>> instrument_reset(); instrument_enable()
+	>>> double(2), double(3)
+	(4, 6)
+	>>> instrument_enable(False)
+	>>> double(4), instrument_summary()['timers']['double']['calls']
+	(8, 2)
+	"""
+	def decorator(func):
+		timer_name = func.__name__ if name is None else name
+		is_gen = inspect.isgeneratorfunction(func)
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not INSTRUMENT['enabled']:
+				return func(*args, **kwargs)
+			if is_gen:
+				return _timed_gen(timer_name, func(*args, **kwargs))
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				_add_time(timer_name, time.perf_counter() - start)
+		return wrapper
+	return decorator
+
+def instrument_summary():
+	"""
+	Outputs:
+		Returns {'counters': {name: total}, 'timers': {name: {'calls',
+		'seconds'}}}, a snapshot of everything collected so far.
+
+	>>> instrument_reset(); instrument_enable()
+	>>> count('demo.bits', 8); count('demo.bits', 4)
+	>>> instrument_enable(False); count('demo.bits', 100)
+	>>> instrument_summary()['counters']
+	{'demo.bits': 12}
+	"""
+	with INSTRUMENT['lock']:
+		return dict(counters=dict(INSTRUMENT['counters']),
+			timers=dict([(name, dict(calls=calls, seconds=seconds))
+				for name, (calls, seconds) in INSTRUMENT['timers'].items()]))
+
+def write_summary(outputFile, summary=None):
+	"""
+	Inputs:
+		outputFile: String. Path ending in .csv for a CSV file (columns kind,
+			name, calls, value), anything else gets JSON.
+		summary: Dictionary from instrument_summary, or None for the current
+			one.
+	Outputs:
+		No return value. Writes the summary out.
+	"""
+	if summary is None:
+		summary = instrument_summary()
+	if not outputFile.endswith('.csv'):
+		with open(outputFile, 'w') as f:
+			json.dump(summary, f, indent=1, sort_keys=True)
+		return
+	with open(outputFile, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['kind', 'name', 'calls', 'value'])
+		for name, total in sorted(summary['counters'].items()):
+			writer.writerow(['counter', name, '', total])
+		for name, t in sorted(summary['timers'].items()):
+			writer.writerow(['timer', name, t['calls'], t['seconds']])
+
+def profile_call(outputFile, func, *args, **kwargs):
+	"""
+	Inputs:
+		outputFile: String or None. Path for the cProfile dump (readable with
+			pstats.Stats or snakeviz). None skips the dump.
+		func: Function to run.
+		args, kwargs: Passed along to func. Generators are run to the end.
+	Outputs:
+		Returns (result, profiler) where result is what func returned (as a
+		list, for a generator) and profiler is the cProfile.Profile.
+	"""
+	profiler = cProfile.Profile()
+	profiler.enable()
+	try:
+		result = func(*args, **kwargs)
+		if inspect.isgenerator(result):
+			result = list(result)
+	finally:
+		profiler.disable()
+	if outputFile is not None:
+		profiler.dump_stats(outputFile)
+	return result, profiler
+
+if __name__ == "__main__":
+	# Where the time goes when receiving a generated capture
+	import os
+	import pstats
+	import tempfile
+	import numpy as np
+	from ppm_filegen import gen_rx_rand_data
+	from ppm_rx import rx_ppm_packets
+	# The chain imports this file as ppm_instrument, not __main__
+	from ppm_instrument import instrument_enable, instrument_summary, write_summary
+	tmpDir = tempfile.mkdtemp()
+	inputFile = os.path.join(tmpDir, 'instrument.b')
+
+	instrument_enable()
+	np.random.seed(0)
+	gen_rx_rand_data(inputFile, 4000, 16, 16, 2, p_datalen=[0]*12+[1,0,0,0])
+	_, profiler = profile_call(os.path.join(tmpDir, 'rx.prof'), rx_ppm_packets,
+		inputFile, 16, 2, threshold_ext=3)
+	instrument_enable(False)
+
+	print(json.dumps(instrument_summary(), indent=1, sort_keys=True))
+	write_summary(os.path.join(tmpDir, 'instrument.csv'))
+	pstats.Stats(profiler).sort_stats('cumulative').print_stats(10)
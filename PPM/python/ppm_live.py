@@ -0,0 +1,496 @@
+# Created 2026/10/17
+
+# Live ingestion of a SPAD capture that is still being written. A reader
+# thread (or asyncio task) pulls received bits from a pipe, socket, growing
+# file or simulated source into a fixed-size ring buffer, and the receiver
+# (ppm_rx.rx_ppm_packets) drains it in batches so packets come out while the
+# capture is still running. The ring keeps counters of how often the reader
+# had to wait or drop data, i.e. whether decoding keeps up.
+
+import numpy as np
+import doctest
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from ppm_capture import CAPTURE_MAGIC, CAPTURE_HEADER_SIZE, ARRAY_CHUNK_BITS, \
+	read_capture_header
+from ppm_rx import rx_ppm_packets
+
+# Default ring size in received bits
+LIVE_RING_BITS = 1 << 22
+
+# Longest the receiver waits for a full batch before working on what it has
+LIVE_MAX_LATENCY = 0.05
+
+# Bytes read from a pipe, socket or file at a time
+LIVE_CHUNK_BYTES = 1 << 16
+
+# What the reader does when the ring is full: wait for the receiver to catch
+# up, or throw the incoming chunk away
+LIVE_POLICIES = ['block', 'drop']
+
+# Longest the receiver waits for the reader to finish once it stops. A
+# reader blocked on an idle pipe or socket can't be interrupted, so it's
+# left behind (it's a daemon) and exits on its own at the next chunk or
+# end of stream.
+LIVE_JOIN_TIMEOUT = 1.0
+
+def ring_buffer(capacity_bits=LIVE_RING_BITS, policy='block', stats=None):
+	"""
+	Inputs:
+		capacity_bits: Integer. Number of received bits the ring holds.
+		policy: One of LIVE_POLICIES. What ring_put does when a chunk doesn't
+			fit.
+		stats: Dictionary or None. Filled in with the ring's counters (see
+			Outputs) so they can be watched while it runs.
+	Outputs:
+		Returns the ring as a dictionary, for use with ring_put, ring_get and
+		ring_close. Its 'stats' are:
+		'chunks_in', 'bits_in': Chunks/bits written into the ring.
+		'chunks_dropped', 'bits_dropped': Chunks/bits thrown away because the
+			ring was full ('drop' policy).
+		'producer_waits', 'producer_wait_time': Number of times and total
+			seconds the reader was held up by a full ring ('block' policy).
+		'batches', 'bits_out': Batches/bits handed to the receiver.
+		'fill', 'max_fill': Bits currently in the ring and the high-water mark.
+		'max_lag': Longest time in seconds a bit sat in the ring.
+	Raises:
+		ValueError for an unknown policy.
+	"""
+	if policy not in LIVE_POLICIES:
+		raise ValueError("Unknown policy {0}, use one of {1}".format(policy, LIVE_POLICIES))
+	if stats is None:
+		stats = dict()
+	stats.update(chunks_in=0, bits_in=0, chunks_dropped=0, bits_dropped=0,
+		producer_waits=0, producer_wait_time=0.0, batches=0, bits_out=0,
+		fill=0, max_fill=0, max_lag=0.0)
+	return dict(buf=np.zeros(capacity_bits, dtype=np.uint8), policy=policy,
+		head=0, tail=0, closed=False, error=None, cond=threading.Condition(),
+		put_times=deque(), stats=stats)
+
+def ring_put(ring, chunk, timeout=None):
+	"""
+	Inputs:
+		ring: Dictionary from ring_buffer.
+		chunk: Array of received bits.
+		timeout: Float or None. Longest to wait for room under the 'block'
+			policy before dropping the chunk anyway. None waits forever.
+	Outputs:
+		Returns True if the chunk went in, False if it was dropped or the
+		ring has been closed.
+	Raises:
+		ValueError if the chunk is bigger than the whole ring.
+	"""
+	chunk = np.asarray(chunk, dtype=np.uint8).ravel()
+	capacity = len(ring['buf'])
+	if len(chunk) > capacity:
+		raise ValueError("{0}-bit chunk won't fit in a {1}-bit ring".format(len(chunk), capacity))
+	stats = ring['stats']
+	with ring['cond']:
+		if ring['head'] - ring['tail'] + len(chunk) > capacity and not ring['closed']:
+			if ring['policy'] == 'block':
+				stats['producer_waits'] = stats['producer_waits'] + 1
+				start = time.perf_counter()
+				ring['cond'].wait_for(lambda: ring['closed'] or
+					ring['head'] - ring['tail'] + len(chunk) <= capacity, timeout)
+				stats['producer_wait_time'] = stats['producer_wait_time'] + \
+					time.perf_counter() - start
+			if not ring['closed'] and ring['head'] - ring['tail'] + len(chunk) > capacity:
+				stats['chunks_dropped'] = stats['chunks_dropped'] + 1
+				stats['bits_dropped'] = stats['bits_dropped'] + len(chunk)
+				return False
+		if ring['closed']:
+			return False
+
+		# Write with wraparound
+		pos = ring['head'] % capacity
+		first = min(len(chunk), capacity - pos)
+		ring['buf'][pos:pos+first] = chunk[:first]
+		ring['buf'][:len(chunk)-first] = chunk[first:]
+		ring['head'] = ring['head'] + len(chunk)
+		ring['put_times'].append((ring['head'], time.perf_counter()))
+
+		stats['chunks_in'] = stats['chunks_in'] + 1
+		stats['bits_in'] = stats['bits_in'] + len(chunk)
+		stats['fill'] = ring['head'] - ring['tail']
+		stats['max_fill'] = max(stats['max_fill'], stats['fill'])
+		ring['cond'].notify_all()
+	return True
+
+def ring_get(ring, max_bits=ARRAY_CHUNK_BITS, max_latency=LIVE_MAX_LATENCY):
+	"""
+	Inputs:
+		ring: Dictionary from ring_buffer.
+		max_bits: Integer. Most bits to return.
+		max_latency: Float. Longest to wait for 'max_bits' to be available
+			before returning whatever is there.
+	Outputs:
+		Returns a uint8 array of the oldest bits in the ring (possibly empty
+		if nothing arrived in time), or None once the ring is closed and
+		empty.
+	"""
+	capacity = len(ring['buf'])
+	stats = ring['stats']
+	with ring['cond']:
+		ring['cond'].wait_for(lambda: ring['closed'] or
+			ring['head'] - ring['tail'] >= max_bits, max_latency)
+		num_bits = min(max_bits, ring['head'] - ring['tail'])
+		if num_bits == 0:
+			return None if ring['closed'] else np.zeros(0, dtype=np.uint8)
+
+		pos = ring['tail'] % capacity
+		first = min(num_bits, capacity - pos)
+		bits = np.concatenate((ring['buf'][pos:pos+first], ring['buf'][:num_bits-first]))
+		ring['tail'] = ring['tail'] + num_bits
+
+		# Lag of the oldest chunk touched by this batch
+		now = time.perf_counter()
+		if len(ring['put_times']) > 0:
+			stats['max_lag'] = max(stats['max_lag'], now - ring['put_times'][0][1])
+		while len(ring['put_times']) > 0 and ring['put_times'][0][0] <= ring['tail']:
+			ring['put_times'].popleft()
+
+		stats['batches'] = stats['batches'] + 1
+		stats['bits_out'] = stats['bits_out'] + num_bits
+		stats['fill'] = ring['head'] - ring['tail']
+		ring['cond'].notify_all()
+	return bits
+
+def ring_close(ring, error=None):
+	"""
+	Inputs:
+		ring: Dictionary from ring_buffer.
+		error: Exception or None. Raised on the receiver's side once the ring
+			has been drained (e.g. the reader failed).
+	Outputs:
+		No return value. Nothing more can be put in the ring, and ring_get
+		returns None once it's empty.
+	"""
+	with ring['cond']:
+		ring['closed'] = True
+		if error is not None and ring['error'] is None:
+			ring['error'] = error
+		ring['cond'].notify_all()
+
+def _bytes_to_bits(blocks, fmt='packed', bitorder='big'):
+	"""
+	Inputs:
+		blocks: Iterable of bytes as they come in.
+		fmt: 'packed' for 8 bits per byte (as in a packed capture) or 'b' for
+			.b text rows (earliest bit of each row on the right).
+		bitorder: 'big' or 'little'. Bit order within each packed byte.
+	Outputs:
+		Generator of uint8 arrays of received bits. Partial .b rows are held
+		back until their newline arrives.
+	"""
+	leftover = b''
+	for block in blocks:
+		if fmt == 'packed':
+			yield np.unpackbits(np.frombuffer(block, dtype=np.uint8), bitorder=bitorder)
+			continue
+		lines = (leftover + block).split(b'\n')
+		leftover = lines.pop()
+		rows = b''.join([line.rstrip(b'\r')[::-1] for line in lines])
+		if len(rows) > 0:
+			yield np.frombuffer(rows, dtype=np.uint8) - ord('0')
+
+def read_stream_bits(f, fmt='packed', bitorder='big', chunk_bytes=LIVE_CHUNK_BYTES):
+	"""
+	Inputs:
+		f: Binary file-like object, e.g. sys.stdin.buffer, a pipe opened with
+			open(..., 'rb') or socket.makefile('rb').
+		fmt, bitorder: See _bytes_to_bits.
+		chunk_bytes: Integer. Most bytes read at a time.
+	Outputs:
+		Generator of uint8 arrays of received bits until end of stream. Uses
+		read1 where available so a slow writer doesn't hold up a chunk.
+
+	>>> import io
+	>>> [b.tolist() for b in read_stream_bits(io.BytesIO(b'0011\\n10'), fmt='b')]
+	[[1, 1, 0, 0]]
+	"""
+	read = getattr(f, 'read1', f.read)
+	yield from _bytes_to_bits(iter(lambda: read(chunk_bytes), b''), fmt, bitorder)
+
+def follow_file(inputFile, fmt=None, poll_interval=0.01, idle_timeout=1.0,
+				chunk_bytes=LIVE_CHUNK_BYTES, stop=None):
+	"""
+	Inputs:
+		inputFile: String. Path to a file that is still being written.
+		fmt: 'packed', 'b' or None to go by whether the file starts with the
+			packed capture magic (see ppm_capture).
+		poll_interval: Float. Seconds to sleep when there is nothing new.
+		idle_timeout: Float. Give up after this many seconds without new data.
+		chunk_bytes: Integer. Most bytes read at a time.
+		stop: threading.Event or None. Stops following once set.
+	Outputs:
+		Generator of uint8 arrays of received bits as they are appended, like
+		tail -f. Packed captures are read a whole byte at a time.
+	"""
+	def wait_for(f, num_bytes):
+		# Blocks until the file has num_bytes past the current position
+		start = f.tell()
+		waited = 0
+		while os.fstat(f.fileno()).st_size - start < num_bytes:
+			if waited >= idle_timeout or (stop is not None and stop.is_set()):
+				return False
+			time.sleep(poll_interval)
+			waited = waited + poll_interval
+		return True
+
+	with open(inputFile, 'rb') as f:
+		bitorder = 'big'
+		if fmt in (None, 'packed'):
+			if not wait_for(f, CAPTURE_HEADER_SIZE) and fmt is None:
+				fmt = 'b'
+			elif f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC:
+				header = read_capture_header(inputFile)
+				bitorder = header['bitorder']
+				f.seek(header['header_size'])
+				fmt = 'packed'
+			else:
+				f.seek(0)
+				fmt = 'b' if fmt is None else fmt
+
+		def blocks():
+			while True:
+				block = f.read(chunk_bytes)
+				if len(block) > 0:
+					yield block
+				elif not wait_for(f, 1):
+					return
+		yield from _bytes_to_bits(blocks(), fmt, bitorder)
+
+def sim_live_source(bits, chunk_bits=4096, bits_per_sec=None):
+	"""
+	Inputs:
+		bits: Array of received bits to play back.
+		chunk_bits: Integer. Bits per chunk.
+		bits_per_sec: Float or None. Paces the chunks to this rate, None for
+			as fast as possible.
+	Outputs:
+		Generator of uint8 arrays of bits, standing in for a live capture.
+	"""
+	bits = np.asarray(bits, dtype=np.uint8).ravel()
+	start = time.perf_counter()
+	for i in range(0, len(bits), chunk_bits):
+		if bits_per_sec is not None:
+			delay = start + i/bits_per_sec - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+		yield bits[i:i+chunk_bits]
+
+def _ingest(ring, source):
+	"""
+	Outputs:
+		No return value. Reader thread body: copies chunks from 'source' into
+		the ring until the source ends or the ring is closed.
+	"""
+	try:
+		for chunk in source:
+			if ring['closed']:
+				break
+			if len(chunk) > 0:
+				ring_put(ring, chunk)
+	except Exception as e:
+		ring_close(ring, e)
+	ring_close(ring)
+
+def _ring_chunks(ring, batch_bits, max_latency):
+	"""
+	Outputs:
+		Generator of batches drained from the ring until it's closed and
+		empty, re-raising any error from the reader.
+	"""
+	while True:
+		bits = ring_get(ring, batch_bits, max_latency)
+		if bits is None:
+			if ring['error'] is not None:
+				raise ring['error']
+			return
+		if len(bits) > 0:
+			yield bits
+
+def live_rx_packets(source, chips_per_symbol, bits_per_chip, capacity_bits=LIVE_RING_BITS,
+				policy='block', batch_bits=ARRAY_CHUNK_BITS, max_latency=LIVE_MAX_LATENCY,
+				stats=None, **kwargs):
+	"""
+	Inputs:
+		source: Iterable of arrays of received bits, e.g. read_stream_bits,
+			follow_file or sim_live_source. Read on its own thread.
+		chips_per_symbol: Integer. Number of chips per symbol.
+		bits_per_chip: Integer. Number of bits per chip.
+		capacity_bits, policy, stats: See ring_buffer.
+		batch_bits: Integer. Most bits handed to the receiver at once.
+		max_latency: Float. Longest the receiver waits to fill a batch.
+		kwargs: Passed along to ppm_rx.rx_ppm_packets (sync symbol values,
+			threshold_ext).
+	Outputs:
+		Generator which yields (packet_start, header_bits, data_bits) as in
+		rx_ppm_packets, while the source is still being read. packet_start
+		counts only bits that made it into the ring. Closing the generator
+		closes the ring and waits up to LIVE_JOIN_TIMEOUT for the reader,
+		which stops at its next chunk.
+	Raises:
+		Whatever the reader thread raised, once the bits before it have been
+		decoded.
+
+	>>> from ppm_base import ppm_mod_bits
+	>>> header = [0,0,0] + [1]*13 + [0,1]+[0]*14 + [0]*15+[1]
+	>>> packet = ppm_mod_bits([0]*32 + [0,1,1,1] + [1,0,1,0] + header + [1,0,1,1,0,0,1,0], 16, 1)
+	>>> stream = np.concatenate([np.zeros(37, dtype=np.uint8), packet]*3)
+	>>> stats = dict()
+	>>> for start, _, data_bits in live_rx_packets(sim_live_source(stream, 100), 16, 1,
+	...         capacity_bits=1000, batch_bits=256, threshold_ext=1, stats=stats):
+	...     print(start, data_bits.tolist())
+	37 [1, 0, 1, 1, 0, 0, 1, 0]
+	458 [1, 0, 1, 1, 0, 0, 1, 0]
+	879 [1, 0, 1, 1, 0, 0, 1, 0]
+	>>> stats['bits_in'] == stats['bits_out'] == len(stream), stats['chunks_dropped']
+	(True, 0)
+
+	Closing early doesn't hang on a pipe whose writer has gone quiet:
+
+	>>> r, w = os.pipe()
+	>>> _ = os.write(w, np.packbits(stream).tobytes())
+	>>> packets = live_rx_packets(read_stream_bits(os.fdopen(r, 'rb')), 16, 1,
+	...         batch_bits=256, threshold_ext=1)
+	>>> next(packets)[0]
+	37
+	>>> start = time.perf_counter(); packets.close()
+	>>> time.perf_counter() - start < LIVE_JOIN_TIMEOUT + 0.5
+	True
+	>>> os.close(w)
+	"""
+	ring = ring_buffer(capacity_bits, policy, stats)
+	reader = threading.Thread(target=_ingest, args=(ring, source), daemon=True)
+	reader.start()
+	try:
+		yield from rx_ppm_packets(_ring_chunks(ring, batch_bits, max_latency),
+			chips_per_symbol, bits_per_chip, **kwargs)
+	finally:
+		ring_close(ring)
+		reader.join(LIVE_JOIN_TIMEOUT)
+
+def live_rx(source, chips_per_symbol, bits_per_chip, callback, **kwargs):
+	"""
+	Inputs:
+		source, chips_per_symbol, bits_per_chip: See live_rx_packets.
+		callback: Function called as callback(packet_start, header_bits,
+			data_bits) for every packet.
+		kwargs: Passed along to live_rx_packets.
+	Outputs:
+		Returns the ring's stats (see ring_buffer) once the source ends.
+	"""
+	stats = kwargs.pop('stats', None)
+	stats = dict() if stats is None else stats
+	for packet in live_rx_packets(source, chips_per_symbol, bits_per_chip,
+			stats=stats, **kwargs):
+		callback(*packet)
+	return stats
+
+async def _aingest(ring, source):
+	"""
+	Outputs:
+		No return value. Asyncio counterpart of _ingest for an async
+		iterable source. Blocking puts are handed off to a thread.
+	"""
+	loop = asyncio.get_running_loop()
+	try:
+		async for chunk in source:
+			if ring['closed']:
+				break
+			if len(chunk) > 0:
+				await loop.run_in_executor(None, ring_put, ring, chunk)
+	except Exception as e:
+		ring_close(ring, e)
+	ring_close(ring)
+
+async def alive_rx_packets(source, chips_per_symbol, bits_per_chip,
+				capacity_bits=LIVE_RING_BITS, policy='block', batch_bits=ARRAY_CHUNK_BITS,
+				max_latency=LIVE_MAX_LATENCY, stats=None, **kwargs):
+	"""
+	Inputs:
+		source: Async iterable of arrays of received bits (read by an asyncio
+			task), or an ordinary iterable (read on a daemon thread).
+		Everything else: See live_rx_packets.
+	Outputs:
+		Async generator of (packet_start, header_bits, data_bits). The
+		receiver runs on a worker thread so the event loop is never held up
+		by demodulation. Closing it waits up to LIVE_JOIN_TIMEOUT for the
+		reader, then cancels an asyncio reader or leaves a thread behind.
+
+	>>> from ppm_base import ppm_mod_bits
+	>>> header = [0,0,0] + [1]*13 + [0,1]+[0]*14 + [0]*15+[1]
+	>>> packet = ppm_mod_bits([0]*32 + [0,1,1,1] + [1,0,1,0] + header + [1,1,0,0,0,0,1,0], 16, 1)
+	>>> async def chunks():
+	...     for chunk in sim_live_source(np.concatenate([np.zeros(5, dtype=np.uint8), packet]), 64):
+	...         yield chunk
+	>>> async def main():
+	...     return [(start, data_bits.tolist()) async for start, _, data_bits in
+	...         alive_rx_packets(chunks(), 16, 1, threshold_ext=1)]
+	>>> asyncio.run(main())
+	[(5, [1, 1, 0, 0, 0, 0, 1, 0])]
+	>>> r, w = os.pipe()
+	>>> _ = os.write(w, np.packbits(np.concatenate([np.zeros(5, dtype=np.uint8), packet])).tobytes())
+	>>> async def first():
+	...     packets = alive_rx_packets(read_stream_bits(os.fdopen(r, 'rb')), 16, 1,
+	...         batch_bits=256, threshold_ext=1)
+	...     packet = await packets.__anext__()
+	...     await packets.aclose()
+	...     return packet[0]
+	>>> start = time.perf_counter(); asyncio.run(first())
+	5
+	>>> time.perf_counter() - start < LIVE_JOIN_TIMEOUT + 0.5
+	True
+	>>> os.close(w)
+	"""
+	loop = asyncio.get_running_loop()
+	ring = ring_buffer(capacity_bits, policy, stats)
+	reader = None
+	thread = None
+	if hasattr(source, '__aiter__'):
+		reader = asyncio.ensure_future(_aingest(ring, source))
+	else:
+		# Not the loop's executor, which asyncio.run would wait on forever
+		# if the source is stuck
+		thread = threading.Thread(target=_ingest, args=(ring, source), daemon=True)
+		thread.start()
+
+	packets = rx_ppm_packets(_ring_chunks(ring, batch_bits, max_latency),
+		chips_per_symbol, bits_per_chip, **kwargs)
+	done = object()
+	try:
+		while True:
+			packet = await loop.run_in_executor(None, next, packets, done)
+			if packet is done:
+				break
+			yield packet
+	finally:
+		ring_close(ring)
+		if thread is not None:
+			await loop.run_in_executor(None, thread.join, LIVE_JOIN_TIMEOUT)
+		else:
+			await asyncio.wait([reader], timeout=LIVE_JOIN_TIMEOUT)
+			if not reader.done():
+				reader.cancel()
+
+if __name__ == "__main__":
+	# Decode a simulated capture while it "arrives" at 2 Mb/s, with a small
+	# ring to show the backpressure counters
+	from ppm_filegen import gen_rx_rand_data
+	import tempfile
+	inputFile = os.path.join(tempfile.mkdtemp(), 'live.b')
+	np.random.seed(0)
+	loc, _ = gen_rx_rand_data(inputFile, 20000, 16, 16, 2)
+	bits = np.concatenate([chunk for chunk in read_stream_bits(open(inputFile, 'rb'), fmt='b')])
+
+	for policy in LIVE_POLICIES:
+		start = time.perf_counter()
+		def show(packet_start, header_bits, data_bits):
+			print("{0:.3f}s packet at {1}".format(time.perf_counter()-start, packet_start))
+		stats = live_rx(sim_live_source(bits, 8192, bits_per_sec=2e6), 16, 2, show,
+			capacity_bits=1 << 15, policy=policy, batch_bits=1 << 14)
+		print(policy, "expected packet at", loc, stats)
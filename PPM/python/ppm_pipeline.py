@@ -0,0 +1,339 @@
+# Created 2026/10/17
+
+# End-to-end TX -> channel -> RX chain run in memory. A pipeline is a list of
+# (name, stage) pairs, where each stage takes the dictionary of buffers built
+# up so far and returns it with its own outputs added. Any stage can be
+# swapped out by name, e.g. the framing/modulation/channel stages for one
+# which reads a real capture.
+
+import numpy as np
+import doctest
+import time
+from math import ceil
+from ppm_base import ppm_mod_bits, ppm_correlate_bits, ppm_vals_to_bits
+from ppm_sim import sim_packet_bits, channel_bits
+from ppm_soft import ppm_soft_bits
+from ppm_frame import deframe_packets
+from ppm_sync import ppm_find_packets
+from ppm_capture import iter_bit_chunks
+from ppm_rx import PRIMARY_HEADER_BITS, DATALEN_BITS
+
+def stage_frame(chips_per_symbol, num_packets, p_datalen=[0]*15+[1],
+				preamble_val=None, sfd0_val=None, sfd1_val=None, rng=None):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		num_packets: Integer. Number of packets to frame.
+		p_datalen, preamble_val, sfd0_val, sfd1_val: See sim_packet_bits.
+		rng: np.random.Generator. Source of the random packet data.
+	Outputs:
+		Returns a stage which adds 'packets' (one row of unmodulated bits per
+		packet, laid out like gen_rx_rand_data) and 'data_start'.
+	"""
+	def frame(buffers):
+		packets, data_start = sim_packet_bits(num_packets, chips_per_symbol,
+			p_datalen=p_datalen, preamble_val=preamble_val, sfd0_val=sfd0_val,
+			sfd1_val=sfd1_val, rng=rng)
+		buffers.update(packets=packets, data_start=data_start)
+		return buffers
+	return frame
+
+def stage_modulate(chips_per_symbol, bits_per_chip, gap_symbols=4):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		gap_symbols: Integer. Symbols' worth of silence before each packet.
+	Outputs:
+		Returns a stage which PPM modulates 'packets' into one stream of bits,
+		'tx_bits', in the order they're sent.
+	"""
+	def modulate(buffers):
+		packets = buffers['packets']
+		mod_bits = ppm_mod_bits(packets, chips_per_symbol, bits_per_chip)
+		mod_bits = mod_bits.reshape(packets.shape[0], -1)
+		gap = np.zeros((packets.shape[0], gap_symbols*chips_per_symbol*bits_per_chip),
+				dtype=np.uint8)
+		buffers['tx_bits'] = np.hstack((gap, mod_bits)).ravel()
+		return buffers
+	return modulate
+
+def stage_channel(bits_per_chip, sigma_bg=0, photons_signal=None, photons_bg=0,
+				rng=None):
+	"""
+	Inputs:
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		sigma_bg, photons_signal, photons_bg: See ppm_sim.sim_channel.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a stage which passes 'tx_bits' through the channel and adds
+		the result as 'rx_bits'.
+	"""
+	def channel(buffers):
+		buffers['rx_bits'] = channel_bits(buffers['tx_bits'], bits_per_chip,
+			sigma_bg=sigma_bg, photons_signal=photons_signal,
+			photons_bg=photons_bg, rng=rng)
+		return buffers
+	return channel
+
+def stage_capture(source, chunk_rows=4096):
+	"""
+	Inputs:
+		source: String path to a .b file or packed capture, or anything else
+			ppm_rx.rx_ppm_packets accepts.
+		chunk_rows: Integer. Rows per chunk when reading a .b file.
+	Outputs:
+		Returns a stage which loads the received bits into 'rx_bits'. Use it
+		in place of the framing, modulation and channel stages.
+	"""
+	def capture(buffers):
+		chunks = list(iter_bit_chunks(source, chunk_rows))
+		if len(chunks) == 0:
+			buffers['rx_bits'] = np.zeros(0, dtype=np.uint8)
+		else:
+			buffers['rx_bits'] = np.concatenate(chunks)
+		return buffers
+	return capture
+
+def stage_sync(chips_per_symbol, bits_per_chip, **kwargs):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		kwargs: Passed along to ppm_sync.ppm_find_packets (sync symbol values,
+			threshold_ext, min_score).
+	Outputs:
+		Returns a stage which finds the packets in 'rx_bits' and adds their
+		first preamble bit indices as 'packet_starts'.
+	"""
+	def sync(buffers):
+		packet_starts, _ = ppm_find_packets(buffers['rx_bits'], chips_per_symbol,
+								bits_per_chip, **kwargs)
+		buffers['packet_starts'] = packet_starts
+		return buffers
+	return sync
+
+def stage_demod(chips_per_symbol, bits_per_chip, threshold=0):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		threshold: Integer. Correlator threshold.
+	Outputs:
+		Returns a stage which demodulates every whole symbol from each packet
+		start up to the next one (or the end of 'rx_bits') and adds the list
+		of symbol arrays as 'rx_symbols'.
+	"""
+	bits_per_symbol = chips_per_symbol*bits_per_chip
+	def demod(buffers):
+		rx_bits = buffers['rx_bits']
+		starts = buffers['packet_starts']
+		ends = list(starts[1:]) + [len(rx_bits)]
+		rx_symbols = []
+		for start, end in zip(starts, ends):
+			end = start + bits_per_symbol*((end-start) // bits_per_symbol)
+			corr_symbol, _, _ = ppm_correlate_bits(rx_bits[start:end],
+				chips_per_symbol, bits_per_chip, threshold=threshold)
+			rx_symbols.append(corr_symbol)
+		buffers['rx_symbols'] = rx_symbols
+		return buffers
+	return demod
+
+def stage_soft_demod(chips_per_symbol, bits_per_chip, photons_signal, photons_bg):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		photons_signal, photons_bg: Float. Mean signal and background photons
+			per chip assumed by the Poisson model (see ppm_soft).
+	Outputs:
+		Returns a stage which adds 'rx_llrs', a list with the per-bit
+		log-likelihood ratios (ppm_soft_bits) of every whole symbol from each
+		packet start up to the next one. Meant to go after (or replace) the
+		'demod' stage in front of a decoder.
+	"""
+	bits_per_symbol = chips_per_symbol*bits_per_chip
+	def soft_demod(buffers):
+		rx_bits = buffers['rx_bits']
+		starts = buffers['packet_starts']
+		ends = list(starts[1:]) + [len(rx_bits)]
+		rx_llrs = []
+		for start, end in zip(starts, ends):
+			end = start + bits_per_symbol*((end-start) // bits_per_symbol)
+			rx_llrs.append(ppm_soft_bits(rx_bits[start:end], chips_per_symbol,
+				bits_per_chip, photons_signal, photons_bg))
+		buffers['rx_llrs'] = rx_llrs
+		return buffers
+	return soft_demod
+
+def stage_deframe(chips_per_symbol, preamble_symbols=8):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		preamble_symbols: Integer. Number of preamble symbols before SFD0.
+	Outputs:
+		Returns a stage which strips the sync symbols off each entry of
+		'rx_symbols', reads the data length from the primary header and adds
+		'rx_packets', a list of (packet_start, header_bits, data_bits). Packets
+		cut short by the end of the capture are dropped.
+	"""
+	demod_bits_per_symbol = int(ceil(np.log2(chips_per_symbol)))
+	symbols_per_octet = int(ceil(8/demod_bits_per_symbol))
+	sync_bits = (preamble_symbols+2)*demod_bits_per_symbol
+	def deframe(buffers):
+		rx_packets = []
+		for start, symbols in zip(buffers['packet_starts'], buffers['rx_symbols']):
+			packet = ppm_vals_to_bits(symbols, demod_bits_per_symbol)[sync_bits:]
+			if len(packet) < PRIMARY_HEADER_BITS:
+				continue
+			datalen = packet[PRIMARY_HEADER_BITS-DATALEN_BITS:PRIMARY_HEADER_BITS]
+			data_field_octets = int(datalen @ (1 << np.arange(DATALEN_BITS-1, -1, -1)))
+			packet_bits = PRIMARY_HEADER_BITS + data_field_octets \
+				* symbols_per_octet * demod_bits_per_symbol
+			if len(packet) < packet_bits:
+				continue
+			rx_packets.append((int(start), packet[:PRIMARY_HEADER_BITS],
+				packet[PRIMARY_HEADER_BITS:packet_bits]))
+		buffers['rx_packets'] = rx_packets
+		return buffers
+	return deframe
+
+def stage_parse(chips_per_symbol, crc=True):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		crc: Boolean. Whether the data fields end in a CRC (see ppm_frame).
+	Outputs:
+		Returns a stage which unpacks every header in 'rx_packets' and checks
+		the CRCs in one batch, adding 'rx_headers' (ppm_frame.unpack_headers
+		records), 'rx_payloads' (list of octet arrays) and 'rx_crc_ok'.
+	"""
+	def parse(buffers):
+		rx_packets = buffers['rx_packets']
+		header_bits = np.asarray([p[1] for p in rx_packets], dtype=np.uint8).reshape(
+			-1, PRIMARY_HEADER_BITS)
+		headers, payloads, crc_ok = deframe_packets(header_bits,
+			[p[2] for p in rx_packets], chips_per_symbol, crc)
+		buffers.update(rx_headers=headers, rx_payloads=payloads, rx_crc_ok=crc_ok)
+		return buffers
+	return parse
+
+def sim_pipeline(chips_per_symbol, bits_per_chip, num_packets, p_datalen=[0]*15+[1],
+				sigma_bg=0, photons_signal=None, photons_bg=0, threshold_ext=0,
+				preamble_val=None, sfd0_val=None, sfd1_val=None, rng=None):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		num_packets: Integer. Number of packets to send.
+		p_datalen: List of 1 and 0. (# of octets) in the data length field.
+		sigma_bg, photons_signal, photons_bg: See ppm_sim.sim_channel.
+		threshold_ext: Integer. Threshold for the preamble during sync.
+		preamble_val, sfd0_val, sfd1_val: Integers or None. Sync symbol values,
+			see ppm_base.sync_vals.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns the list of (name, stage) for a full simulated link: 'frame',
+		'modulate', 'channel', 'sync', 'demod' and 'deframe'.
+	"""
+	sync_vals = dict(preamble_val=preamble_val, sfd0_val=sfd0_val, sfd1_val=sfd1_val)
+	return [
+		('frame', stage_frame(chips_per_symbol, num_packets, p_datalen=p_datalen,
+			rng=rng, **sync_vals)),
+		('modulate', stage_modulate(chips_per_symbol, bits_per_chip)),
+		('channel', stage_channel(bits_per_chip, sigma_bg=sigma_bg,
+			photons_signal=photons_signal, photons_bg=photons_bg, rng=rng)),
+		('sync', stage_sync(chips_per_symbol, bits_per_chip,
+			threshold_ext=threshold_ext, **sync_vals)),
+		('demod', stage_demod(chips_per_symbol, bits_per_chip)),
+		('deframe', stage_deframe(chips_per_symbol))]
+
+def capture_pipeline(source, chips_per_symbol, bits_per_chip, threshold_ext=0,
+				preamble_val=None, sfd0_val=None, sfd1_val=None):
+	"""
+	Inputs:
+		source: Received capture, see stage_capture.
+		chips_per_symbol, bits_per_chip, threshold_ext, preamble_val, sfd0_val,
+			sfd1_val: See sim_pipeline.
+	Outputs:
+		Returns the list of (name, stage) for receiving a real capture:
+		'capture', 'sync', 'demod' and 'deframe'.
+	"""
+	sync_vals = dict(preamble_val=preamble_val, sfd0_val=sfd0_val, sfd1_val=sfd1_val)
+	return [
+		('capture', stage_capture(source)),
+		('sync', stage_sync(chips_per_symbol, bits_per_chip,
+			threshold_ext=threshold_ext, **sync_vals)),
+		('demod', stage_demod(chips_per_symbol, bits_per_chip)),
+		('deframe', stage_deframe(chips_per_symbol))]
+
+def replace_stage(stages, name, stage, before=False):
+	"""
+	Inputs:
+		stages: List of (name, stage).
+		name: String. Name of the stage to swap out.
+		stage: Function taking and returning the dictionary of buffers.
+		before: Boolean. If True, insert 'stage' ahead of 'name' rather than
+			replacing it.
+	Outputs:
+		Returns a new list of stages. The inserted stage takes its name from
+		the function.
+	Raises:
+		KeyError if there's no stage called 'name'.
+
+	>>> [n for n, _ in replace_stage([('a', None), ('b', None)], 'b', len)]
+	['a', 'b']
+	>>> [n for n, _ in replace_stage([('a', None), ('b', None)], 'b', len, before=True)]
+	['a', 'len', 'b']
+	"""
+	names = [n for n, _ in stages]
+	if name not in names:
+		raise KeyError(name)
+	i = names.index(name)
+	if before:
+		return stages[:i] + [(stage.__name__, stage)] + stages[i:]
+	return stages[:i] + [(name, stage)] + stages[i+1:]
+
+def run_pipeline(stages, buffers=None):
+	"""
+	Inputs:
+		stages: List of (name, stage) where each stage takes the dictionary of
+			buffers and returns it with its outputs added.
+		buffers: Dictionary or None. Starting buffers, e.g. 'rx_bits' when
+			the pipeline starts at sync.
+	Outputs:
+		Returns (buffers, timings) where timings is a list of (name, seconds)
+		spent in each stage, in order.
+
+	>>> rng = np.random.default_rng(0)
+	>>> buffers, timings = run_pipeline(sim_pipeline(16, 2, 3, rng=rng))
+	>>> [n for n, _ in timings]
+	['frame', 'modulate', 'channel', 'sync', 'demod', 'deframe']
+	>>> tx_data = buffers['packets'][:, buffers['data_start']:]
+	>>> [(data_bits == tx_data[i, :len(data_bits)]).all() for i, (_, _, data_bits) in enumerate(buffers['rx_packets'])]
+	[True, True, True]
+	"""
+	if buffers is None:
+		buffers = dict()
+	timings = []
+	for name, stage in stages:
+		t_start = time.perf_counter()
+		buffers = stage(buffers)
+		timings.append((name, time.perf_counter()-t_start))
+	return buffers, timings
+
+if __name__ == "__main__":
+	rng = np.random.default_rng(0)
+	buffers, timings = run_pipeline(sim_pipeline(16, 2, 1000, sigma_bg=0.2,
+		threshold_ext=1, rng=rng))
+	print("{0} of 1000 packets received".format(len(buffers['rx_packets'])))
+	for name, seconds in timings:
+		print("{0:10s} {1:.4f} s".format(name, seconds))
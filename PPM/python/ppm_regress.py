@@ -0,0 +1,486 @@
+# Created 2026/10/17
+
+# Golden vectors and a parallel runner for the Verilog testbench suites.
+# Stimulus files are generated across all cores with a recorded seed and the
+# expected packet next to each one. The suite is then split into shards, each
+# shard gets its own copy of the HDL (the testbenches use absolute paths) and
+# runs in its own simulator process, and every result file is checked against
+# ppm_hdl_model and the golden data. Without a simulator on the PATH only the
+# model is checked against the golden data.
+
+import numpy as np
+import doctest
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from ppm_base import bits_to_ints
+from ppm_capture import read_b_chunks
+from ppm_filegen import gen_rx_rand_data, gen_rx_rand_pulses
+from ppm_hdl_model import ppm16_demod_model, diff_tb_result, parse_tb_result, \
+	ppm_freq_recovery_model, diff_tb_freq_result, tb_result_text, HDL_CHIPS, S_IDLE, \
+	S_SCAN, TB_FIRST_EDGE, TB_CLK_PERIOD
+
+# Where the testbenches expect to find everything
+HDL_ROOT = "/tools/B/lydialee/camera/spad-comms/PPM/verilog/"
+VERILOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'verilog')
+DEMOD_SOURCES = ['definitions.vh', 'chips.vh', 'ppm16_correlator.v', 'ppm16_demod.v',
+	'tb_ppm16_demod.v']
+FREQ_SOURCES = ['definitions.vh', 'chips.vh', 'ppm_freq_recovery.v',
+	'tb_ppm_freq_recovery.v']
+SIMULATORS = ['iverilog', 'verilator']
+
+# Symbols between the first preamble symbol and the data field (preamble,
+# SFD0, SFD1, 12 header symbols), and the extra cycle before packet_detected
+# shows up
+PACKET_OVERHEAD_SYMBOLS = 22
+# Clock edges between the last chip of one suite file and the reset for the
+# next, where din holds the last chip
+TB_HOLD_CYCLES = 4
+# Clock edges from the start of one suite file to the first chip fed in
+# (startup, reset and rx_start)
+TB_SETUP_CYCLES = 7
+
+def _bits_from_b(inputFile):
+	"""
+	Inputs:
+		inputFile: String. Path to a .b file.
+	Outputs:
+		Returns all of its bits in the order received.
+	"""
+	chunks = list(read_b_chunks(inputFile))
+	return np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=np.uint8)
+
+def _gen_demod_vector(outputDir, i, seed, specs):
+	"""
+	Inputs:
+		outputDir: String. Directory to write to.
+		i: Integer. Index of the file.
+		seed: Integer. Seed for the global NumPy RNG used by ppm_filegen.
+		specs: Dictionary of arguments for gen_rx_rand_data.
+	Outputs:
+		Returns the golden data, which is also written to
+		demod{i}_expected.json next to demod{i}.b.
+	"""
+	np.random.seed(seed)
+	loc, p_data = gen_rx_rand_data(os.path.join(outputDir, "demod{0}.b".format(i)), **specs)
+	expected = dict(seed=int(seed), packet_start=int(loc),
+		payload=[int(b) for b in p_data], bits_per_chip=specs['bits_per_chip'],
+		num_rows=specs['num_rows'], chips_per_row=specs['chips_per_row'])
+	with open(os.path.join(outputDir, "demod{0}_expected.json".format(i)), 'w') as f:
+		json.dump(expected, f)
+	return expected
+
+def _gen_freq_vector(outputDir, i, seed, specs):
+	"""
+	Inputs:
+		outputDir, i, seed: See _gen_demod_vector.
+		specs: Dictionary of arguments for gen_rx_rand_pulses.
+	Outputs:
+		Returns the golden data (just the seed and specs), which is also
+		written to freq_rand{i}_expected.json next to freq_rand{i}.b.
+	"""
+	np.random.seed(seed)
+	gen_rx_rand_pulses(os.path.join(outputDir, "freq_rand{0}.b".format(i)), **specs)
+	expected = dict(seed=int(seed), **specs)
+	with open(os.path.join(outputDir, "freq_rand{0}_expected.json".format(i)), 'w') as f:
+		json.dump(expected, f)
+	return expected
+
+def _gen_vectors(gen_func, outputDir, num_files, seed, max_workers, specs):
+	"""
+	Outputs:
+		Returns the list of golden data from gen_func for files 0 to
+		num_files-1, generated in parallel. File i is always seeded from the
+		i-th child of np.random.SeedSequence(seed), so the vectors don't
+		depend on the number of workers.
+	"""
+	os.makedirs(outputDir, exist_ok=True)
+	seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_files)]
+	with ProcessPoolExecutor(max_workers=max_workers) as executor:
+		futures = [executor.submit(gen_func, outputDir, i, seeds[i], specs)
+					for i in range(num_files)]
+		return [future.result() for future in futures]
+
+def gen_golden_vectors(outputDir, num_files, seed=0, max_workers=None, **kwargs):
+	"""
+	Inputs:
+		outputDir: String. Directory to write demod{i}.b and
+			demod{i}_expected.json to (e.g. ../verilog/binary).
+		num_files: Integer. Number of files, i.e. SUITECHECK_ITERATIONS.
+		seed: Integer. Root seed for the suite.
+		max_workers: Integer or None. Number of worker processes (defaults to
+			the number of cores).
+		kwargs: Arguments for gen_rx_rand_data. Defaults to what the old
+			__main__ in ppm_filegen.py used: 40 rows of 16 2-bit chips, 16-PPM
+			and 2 octets of data.
+	Outputs:
+		Returns the list of golden data, one dictionary per file with 'seed',
+		'packet_start' (bit index), 'payload' (data field bits),
+		'bits_per_chip', 'num_rows' and 'chips_per_row'.
+
+	>>> d = tempfile.mkdtemp()
+	>>> golden = gen_golden_vectors(d, 2, seed=3, max_workers=1)
+	>>> golden == gen_golden_vectors(d, 2, seed=3, max_workers=2)
+	True
+	>>> sorted(os.listdir(d))
+	['demod0.b', 'demod0_expected.json', 'demod1.b', 'demod1_expected.json']
+	"""
+	specs = dict(num_rows=40, chips_per_row=16, chips_per_symbol=16, bits_per_chip=2,
+		p_datalen=[0]*15 + [1], mode='rand')
+	specs.update(kwargs)
+	return _gen_vectors(_gen_demod_vector, outputDir, num_files, seed, max_workers, specs)
+
+def gen_freq_vectors(outputDir, num_files, seed=0, max_workers=None, **kwargs):
+	"""
+	Inputs:
+		outputDir: String. Directory to write freq_rand{i}.b and
+			freq_rand{i}_expected.json to.
+		num_files, seed, max_workers: See gen_golden_vectors.
+		kwargs: Arguments for gen_rx_rand_pulses. Defaults to 40 rows of 16
+			1-bit chips with a pulse probability of 0.1.
+	Outputs:
+		Returns the list of golden data, one dictionary per file.
+	"""
+	specs = dict(num_rows=40, chips_per_row=16, bits_per_chip=1, p=0.1)
+	specs.update(kwargs)
+	return _gen_vectors(_gen_freq_vector, outputDir, num_files, seed, max_workers, specs)
+
+def check_golden(result, expected, chips_per_symbol=HDL_CHIPS):
+	"""
+	Inputs:
+		result: Dictionary from ppm16_demod_model, or parsed from a testbench
+			dump (needs 'packet_detected' cycles and 'dout').
+		expected: Golden data for the file, see gen_golden_vectors.
+		chips_per_symbol: Integer. Chips per symbol.
+	Outputs:
+		Returns a list of strings describing how the demodulator output
+		differs from what was transmitted: the payload symbols have to lead
+		dout and, when the packet starts on a chip boundary, packet_detected
+		has to rise the cycle after the data field starts. Empty if it matches.
+
+	>>> check_golden(dict(packet_detected=[356], dout=[9, 4, 1]),
+	...		dict(packet_start=6, payload=[1,0,0,1, 0,1,0,0], bits_per_chip=2))
+	[]
+	>>> check_golden(dict(packet_detected=[], dout=[9]),
+	...		dict(packet_start=6, payload=[1,0,0,1, 0,1,0,0], bits_per_chip=2))
+	['packet_detected: expected [356], got []', 'payload: expected [9, 4], got [9]']
+	"""
+	diffs = []
+	bits_per_chip = expected['bits_per_chip']
+	bits_per_value = int(np.log2(chips_per_symbol))
+	if expected['packet_start'] % bits_per_chip == 0:
+		start = [expected['packet_start']//bits_per_chip
+			+ PACKET_OVERHEAD_SYMBOLS*chips_per_symbol + 1]
+		got = [int(c) for c in result['packet_detected']]
+		if got != start:
+			diffs.append("packet_detected: expected {0}, got {1}".format(start, got))
+	payload = bits_to_ints(expected['payload'], bits_per_value).tolist()
+	dout = [int(s) for s in result['dout'][:len(payload)]]
+	if dout != payload:
+		diffs.append("payload: expected {0}, got {1}".format(payload, dout))
+	return diffs
+
+def find_simulator(simulator='auto'):
+	"""
+	Inputs:
+		simulator: String. 'iverilog', 'verilator', 'auto' (the first of
+			SIMULATORS on the PATH) or 'none'.
+	Outputs:
+		Returns the simulator to use, or None if there isn't one.
+	"""
+	if simulator == 'none':
+		return None
+	if simulator == 'auto':
+		for s in SIMULATORS:
+			if shutil.which(s) is not None:
+				return s
+		return None
+	if shutil.which(simulator) is None:
+		raise ValueError("{0} is not on the PATH".format(simulator))
+	return simulator
+
+def _prepare_shard(shardDir, sources, verilogDir=VERILOG_DIR):
+	"""
+	Inputs:
+		shardDir: String. Working directory for the shard.
+		sources: List of HDL file names to copy in.
+		verilogDir: String. Directory to copy them from.
+	Outputs:
+		No return value. Copies the sources with the absolute HDL_ROOT paths
+		(includes and testbench file names) pointed at the shard, so shards
+		don't step on each other's results.
+	"""
+	os.makedirs(os.path.join(shardDir, 'binary'), exist_ok=True)
+	root = os.path.abspath(shardDir) + os.sep
+	for name in sources:
+		with open(os.path.join(verilogDir, name), 'r') as f:
+			text = f.read()
+		with open(os.path.join(shardDir, name), 'w') as f:
+			f.write(text.replace(HDL_ROOT, root))
+
+def _sim_commands(simulator, top, sources, params):
+	"""
+	Inputs:
+		simulator: String. 'iverilog' or 'verilator'.
+		top: String. Testbench module.
+		sources: List of HDL file names.
+		params: Dictionary of testbench parameter overrides.
+	Outputs:
+		Returns the list of commands which build and run the testbench.
+	"""
+	files = [name for name in sources if name.endswith('.v')]
+	if simulator == 'iverilog':
+		overrides = ["-P{0}.{1}={2}".format(top, k, v) for k, v in params.items()]
+		return [['iverilog', '-g2012', '-o', 'sim.vvp', '-s', top] + overrides + files,
+			['vvp', '-n', 'sim.vvp']]
+	overrides = ["-G{0}={1}".format(k, v) for k, v in params.items()]
+	return [['verilator', '--binary', '-Wno-fatal', '-Mdir', 'obj', '--top-module', top]
+		+ overrides + files, [os.path.join('obj', 'V'+top)]]
+
+def _run_shard(simulator, shardDir, top, sources, params, timeout):
+	"""
+	Outputs:
+		No return value. Builds and runs the testbench in 'shardDir'.
+	Raises:
+		RuntimeError with the simulator output if a command fails.
+	"""
+	for cmd in _sim_commands(simulator, top, sources, params):
+		proc = subprocess.run(cmd, cwd=shardDir, stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT, timeout=timeout)
+		if proc.returncode != 0:
+			raise RuntimeError("{0} failed in {1}:\n{2}".format(' '.join(cmd), shardDir,
+				proc.stdout.decode(errors='replace')))
+
+def _shards(num_files, num_shards):
+	"""
+	Outputs:
+		Returns the file indices split into at most 'num_shards' contiguous
+		non-empty runs.
+	"""
+	return [s.tolist() for s in np.array_split(np.arange(num_files),
+		max(1, min(num_shards, num_files))) if len(s) > 0]
+
+def _tb_first_edge(k, bits_per_chip, num_rows, chips_per_row):
+	"""
+	Outputs:
+		Returns the $time of the clock edge where tb_ppm16_demod.v starts
+		feeding file k of a suite run. $time isn't reset between files, so
+		each one starts TB_SETUP_CYCLES plus one cycle per bit after the last.
+
+	>>> _tb_first_edge(0, 2, 40, 16), _tb_first_edge(2, 2, 40, 16)
+	(6500, 2580500)
+	"""
+	return TB_FIRST_EDGE + k*(TB_SETUP_CYCLES + num_rows*chips_per_row*bits_per_chip)*TB_CLK_PERIOD
+
+def _check_demod_shard(vectorDir, shard, resultDir, bits_per_chip, num_rows, chips_per_row):
+	"""
+	Inputs:
+		vectorDir: String. Directory with the golden vectors.
+		shard: List of file indices, run back to back in one simulation.
+		resultDir: String or None. Directory with demod{k}_result.txt for the
+			k-th file of the shard, or None to check the model alone.
+		bits_per_chip, num_rows, chips_per_row: Testbench parameters.
+	Outputs:
+		Returns a list with one report per file (see run_demod_suite).
+
+	>>> d = tempfile.mkdtemp()
+	>>> _ = gen_golden_vectors(d, 2, seed=1, max_workers=1, mode='zero')
+	>>> for k in range(2):
+	...		result = ppm16_demod_model(_bits_from_b(os.path.join(d, "demod{0}.b".format(k))), 2)
+	...		with open(os.path.join(d, "demod{0}_result.txt".format(k)), 'w') as f:
+	...			_ = f.write(tb_result_text(result, _tb_first_edge(k, 2, 40, 16)))
+	>>> [(r['hdl'], r['golden']) for r in _check_demod_shard(d, [0, 1], d, 2, 40, 16)]
+	[([], []), ([], [])]
+	"""
+	reports = []
+	# preamble2_symbol_count is never reset, so it carries over from file to
+	# file within one simulation
+	preamble2 = None
+	for k, i in enumerate(shard):
+		bits = _bits_from_b(os.path.join(vectorDir, "demod{0}.b".format(i)))
+		with open(os.path.join(vectorDir, "demod{0}_expected.json".format(i)), 'r') as f:
+			expected = json.load(f)
+		result = ppm16_demod_model(bits, bits_per_chip, preamble2_init=preamble2)
+		report = dict(file=i, model=check_golden(result, expected), hdl=None, golden=None)
+		if resultDir is not None:
+			with open(os.path.join(resultDir, "demod{0}_result.txt".format(k)), 'r') as f:
+				text = f.read()
+			first_edge = _tb_first_edge(k, bits_per_chip, num_rows, chips_per_row)
+			packet_times, dout = parse_tb_result(text)
+			report['hdl'] = diff_tb_result(result, text, first_edge=first_edge)
+			report['golden'] = check_golden(dict(dout=dout,
+				packet_detected=[(t - first_edge)//TB_CLK_PERIOD
+				for t in packet_times]), expected)
+		reports.append(report)
+
+		# The FSM keeps running on the last chip until the next reset
+		if result['state'] in (S_IDLE, S_SCAN):
+			preamble2 = result['preamble2_symbol_count']
+		else:
+			held = np.tile(bits[len(bits)-bits_per_chip:], TB_HOLD_CYCLES)
+			preamble2 = ppm16_demod_model(np.concatenate((bits, held)), bits_per_chip,
+				preamble2_init=preamble2)['preamble2_symbol_count']
+		if preamble2 == -1:
+			preamble2 = None
+	return reports
+
+def _demod_shard(vectorDir, shard, workDir, simulator, bits_per_chip, num_rows,
+				chips_per_row, timeout):
+	"""
+	Inputs:
+		vectorDir: String. Directory with the golden vectors.
+		shard: List of file indices, run back to back in one simulation.
+		workDir: String. Working directory for the shard.
+		simulator: String or None. None checks the model alone.
+		bits_per_chip, num_rows, chips_per_row: Testbench parameters.
+		timeout: Float or None. Seconds allowed per simulator command.
+	Outputs:
+		Returns a list with one report per file (see run_demod_suite).
+	"""
+	if simulator is None:
+		return _check_demod_shard(vectorDir, shard, None, bits_per_chip, num_rows,
+			chips_per_row)
+	_prepare_shard(workDir, DEMOD_SOURCES)
+	for k, i in enumerate(shard):
+		shutil.copyfile(os.path.join(vectorDir, "demod{0}.b".format(i)),
+			os.path.join(workDir, 'binary', "demod{0}.b".format(k)))
+	_run_shard(simulator, workDir, 'tb_ppm16_demod', DEMOD_SOURCES,
+		dict(CHIP_BITS=bits_per_chip, NUM_ROWS=num_rows, CHIPS_PER_ROW=chips_per_row,
+			MODE=1, SUITECHECK_ITERATIONS=len(shard)), timeout)
+	return _check_demod_shard(vectorDir, shard, os.path.join(workDir, 'binary'),
+		bits_per_chip, num_rows, chips_per_row)
+
+def _freq_shard(vectorDir, i, workDir, simulator, bits_per_chip, num_rows,
+				chips_per_row, timeout):
+	"""
+	Inputs:
+		i: Integer. Index of the file (tb_ppm_freq_recovery.v runs one file).
+		Everything else: See _demod_shard.
+	Outputs:
+		Returns the report for the file (see run_freq_suite).
+	"""
+	bits = _bits_from_b(os.path.join(vectorDir, "freq_rand{0}.b".format(i)))
+	result = ppm_freq_recovery_model(bits, bits_per_chip)
+	report = dict(file=i, num_pulses=int(result['pulse_detected'].sum()), hdl=None)
+	if simulator is None:
+		return report
+	_prepare_shard(workDir, FREQ_SOURCES)
+	shutil.copyfile(os.path.join(vectorDir, "freq_rand{0}.b".format(i)),
+		os.path.join(workDir, 'binary', 'freq_rand.b'))
+	_run_shard(simulator, workDir, 'tb_ppm_freq_recovery', FREQ_SOURCES,
+		dict(CHIP_BITS=bits_per_chip, NUM_ROWS=num_rows, CHIPS_PER_ROW=chips_per_row),
+		timeout)
+	texts = []
+	for suffix in ('_interpulseCycles.txt', '_intrasymbolPulses.txt'):
+		with open(os.path.join(workDir, 'binary', 'freq_rand'+suffix), 'r') as f:
+			texts.append(f.read())
+	report['hdl'] = diff_tb_freq_result(result, *texts)
+	return report
+
+def _run_suite(shard_func, vectorDir, shards, simulator, workDir, keep, timeout,
+				max_workers, params):
+	"""
+	Outputs:
+		Returns the flattened list of reports from running shard_func on
+		every shard, at most 'max_workers' (None for the number of cores) at
+		a time. Each shard is its own simulator process, so threads are
+		enough to keep the cores busy.
+	"""
+	if max_workers is None:
+		max_workers = os.cpu_count() or 1
+	simulator = find_simulator(simulator)
+	cleanup = workDir is None and not keep
+	if workDir is None:
+		workDir = tempfile.mkdtemp(prefix='ppm_regress_')
+	try:
+		with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+			futures = [executor.submit(shard_func, vectorDir, shard,
+					os.path.join(workDir, "shard{0}".format(s)), simulator, *params, timeout)
+				for s, shard in enumerate(shards)]
+			reports = []
+			for future in futures:
+				r = future.result()
+				reports = reports + (r if isinstance(r, list) else [r])
+		return reports
+	finally:
+		if cleanup:
+			shutil.rmtree(workDir, ignore_errors=True)
+
+def run_demod_suite(vectorDir, num_files, bits_per_chip=2, num_rows=40, chips_per_row=16,
+				num_shards=None, simulator='auto', workDir=None, keep=False, timeout=None,
+				max_workers=None):
+	"""
+	Inputs:
+		vectorDir: String. Directory with demod{i}.b and demod{i}_expected.json
+			from gen_golden_vectors.
+		num_files: Integer. Number of files in the suite.
+		bits_per_chip, num_rows, chips_per_row: Testbench parameters
+			(CHIP_BITS, NUM_ROWS, CHIPS_PER_ROW). Chip-parallel build only.
+		num_shards: Integer or None. Number of simulations run at once
+			(defaults to the number of cores).
+		simulator: String. See find_simulator.
+		workDir: String or None. Where the shards are built. Defaults to a
+			temporary directory which is removed afterwards unless 'keep'.
+		keep: Boolean. Keep the shard directories (and result files).
+		timeout: Float or None. Seconds allowed per simulator command.
+		max_workers: Integer or None. Most simulations running at once
+			(defaults to the number of cores).
+	Outputs:
+		Returns a list with one report per file, in order: 'file', 'model'
+		(model vs. golden), 'hdl' (HDL vs. model) and 'golden' (HDL vs.
+		golden). Each check is a list of differences, empty when it passes,
+		and the HDL checks are None without a simulator.
+	Raises:
+		RuntimeError if a simulation fails.
+
+	>>> d = tempfile.mkdtemp()
+	>>> _ = gen_golden_vectors(d, 3, seed=1, max_workers=1, mode='zero')
+	>>> [r['model'] for r in run_demod_suite(d, 3, num_shards=2, simulator='none')]
+	[[], [], []]
+	"""
+	if num_shards is None:
+		num_shards = os.cpu_count() or 1
+	return _run_suite(_demod_shard, vectorDir, _shards(num_files, num_shards), simulator,
+		workDir, keep, timeout, max_workers, (bits_per_chip, num_rows, chips_per_row))
+
+def run_freq_suite(vectorDir, num_files, bits_per_chip=1, num_rows=40, chips_per_row=16,
+				simulator='auto', workDir=None, keep=False, timeout=None, max_workers=None):
+	"""
+	Inputs:
+		vectorDir: String. Directory with freq_rand{i}.b from gen_freq_vectors.
+		num_files: Integer. Number of files. tb_ppm_freq_recovery.v only
+			reads one, so every file is its own shard.
+		Everything else: See run_demod_suite.
+	Outputs:
+		Returns a list with one report per file, in order: 'file',
+		'num_pulses' and 'hdl' (HDL vs. model, None without a simulator).
+	"""
+	return _run_suite(_freq_shard, vectorDir, list(range(num_files)), simulator,
+		workDir, keep, timeout, max_workers, (bits_per_chip, num_rows, chips_per_row))
+
+def summarize(reports):
+	"""
+	Inputs:
+		reports: List of reports from run_demod_suite or run_freq_suite.
+	Outputs:
+		Returns a dictionary counting the files which fail each check.
+	"""
+	summary = dict(files=len(reports))
+	for check in ('model', 'hdl', 'golden'):
+		ran = [r[check] for r in reports if r.get(check) is not None]
+		if len(ran) > 0:
+			summary[check+'_failures'] = sum([len(d) > 0 for d in ran])
+	return summary
+
+if __name__ == "__main__":
+	vectorDir = os.path.join(VERILOG_DIR, 'binary')
+	gen_golden_vectors(vectorDir, 200, seed=0)
+	reports = run_demod_suite(vectorDir, 200)
+	print(summarize(reports))
+	for r in reports:
+		for check in ('hdl', 'golden'):
+			if r[check]:
+				print(r['file'], check, r[check])
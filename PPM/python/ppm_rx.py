@@ -1,142 +1,264 @@
 # Lydia Lee
 # Created 2019/07/01
 
-# import numpy as np
+# Receiver side of the PPM link. Reads received captures in chunks and
+# walks the same packet FSM as ppm16_demod.v to pull out packets.
+
+import numpy as np
 # import scipy as sp
 # import matplotlib.pyplot as plt
 import doctest
 from math import ceil
-# from ppm_base import ppm_demod_bits_vals
+from ppm_base import ppm_correlate_bits, ppm_correlate_offsets, ppm_vals_to_bits, \
+	sync_vals
+from ppm_capture import iter_bit_chunks
+from ppm_instrument import count, timed
 
-def rx_ppm_packet_vals(inputFile, chips_per_symbol, bits_per_chip,
-				preamble_val=0, sfd0_val=7, sfd1_val=10,
-				threshold_ext=0):
+# Packet layout after SFD1 (see gen_rx_rand_data): version, ID, sequence
+# control and data length, where the data length is the last field
+PRIMARY_HEADER_BITS = 3 + 13 + 16 + 16
+DATALEN_BITS = 16
+
+# Symbols correlated at once while matching the preamble and SFDs (a full
+# preamble plus both SFDs). The FSM still steps one symbol at a time, so
+# this only changes speed, not output.
+SYNC_LOOKAHEAD_SYMBOLS = 10
+
+# FSM states
+S_SCAN = 0
+S_PREAMBLE_MATCH1 = 1
+S_PREAMBLE_MATCH2 = 2
+S_SFD_MATCH = 3
+S_PRIMARY_HEADER = 4
+S_DATA_FIELD = 5
+
+@timed()
+def rx_ppm_packets(source, chips_per_symbol, bits_per_chip,
+				preamble_val=None, sfd0_val=None, sfd1_val=None,
+				threshold_ext=0, chunk_rows=4096, sync_lookahead=SYNC_LOOKAHEAD_SYMBOLS):
 	"""
 	Inputs:
-		inputFile: String. Path to the binary file with the received data. 
-			The LSB should be in the 0th element of a symbol.
+		source: String path to a .b file or packed capture (see ppm_capture), a
+			NumPy array of received bits, or an iterable of NumPy arrays of
+			received bits (in the order received).
 		chips_per_symbol: Integer. Number of chips per symbol in the encoding
 			scheme.
 		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
-		preamble_val: Integer. The symbol converted to decimal associated with 
+		preamble_val: Integer. The symbol converted to decimal associated with
 			the preamble.
-		sfd0_val: Integer. The symbol converted to decimal associated with first 
+		sfd0_val: Integer. The symbol converted to decimal associated with first
 			start symbol.
-		sfd1_val: Integer. The symbol converted to decimal associated with the 
+		sfd1_val: Integer. The symbol converted to decimal associated with the
 			second start symbol.
+			Any of the three left as None defaults to what fits the order, see
+			ppm_base.sync_vals.
 		threshold_ext: Integer. External threshold for determining if the correlator
 			output is more than just noise. Only used when looking for the start
 			of a packet.
+		chunk_rows: Integer. Rows per chunk when 'source' is a file.
+		sync_lookahead: Integer. Symbols correlated per call while matching
+			the preamble and SFDs, see SYNC_LOOKAHEAD_SYMBOLS.
 	Outputs:
-		Assumes only one packet sent! Returns the demodulated packet (list of bits) 
-		where the most recently-received element goes at the end of the list.
+		Generator which yields (packet_start, header_bits, data_bits) for every
+		packet as soon as its last symbol has been received. packet_start is
+		the bit index of the preamble symbol the receiver locked onto, and
+		header_bits/data_bits are uint8 arrays of demodulated bits. The FSM
+		state is kept across chunk boundaries, and only the unconsumed tail
+		of a chunk plus the packet being received are held in memory.
+	Raises:
+		ValueError if a sync symbol value doesn't fit in chips_per_symbol.
 	Notes:
-		WORK IN PROGRESS. Don't use!
+		Like ppm16_demod.v, a failed match drops back to scanning from the
+		current position rather than backing up.
+
+	>>> from ppm_base import ppm_mod_bits
+	>>> header = [0,0,0] + [1]*13 + [0,1]+[0]*14 + [0]*15+[1]
+	>>> data = [1,0,1,1,0,0,1,0]
+	>>> packet = ppm_mod_bits([0]*32 + [0,1,1,1] + [1,0,1,0] + header + data, 16, 1)
+	>>> zeros = np.zeros(37, dtype=np.uint8)
+	>>> stream = np.concatenate([zeros, packet, zeros, packet, zeros])
+	>>> chunks = (stream[i:i+100] for i in range(0, len(stream), 100))
+	>>> for start, header_bits, data_bits in rx_ppm_packets(chunks, 16, 1, threshold_ext=1):
+	...     print(start, data_bits.tolist())
+	37 [1, 0, 1, 1, 0, 0, 1, 0]
+	458 [1, 0, 1, 1, 0, 0, 1, 0]
+
+	Correlating the sync lookahead together gives the same packets as one
+	symbol at a time, noise and chunking included:
+
+	>>> from ppm_sim import sim_packet_bits, channel_bits
+	>>> rng = np.random.default_rng(1)
+	>>> packets, _ = sim_packet_bits(40, 64, rng=rng)
+	>>> rx = channel_bits(ppm_mod_bits(packets.ravel(), 64, 3), 3, sigma_bg=0.25, rng=rng)
+	>>> rx_all = lambda n: [(s, h.tolist(), d.tolist()) for s, h, d in rx_ppm_packets(
+	...		(rx[i:i+777] for i in range(0, len(rx), 777)), 64, 3, threshold_ext=1,
+	...		sync_lookahead=n)]
+	>>> found = rx_all(SYNC_LOOKAHEAD_SYMBOLS)
+	>>> len(found), found == rx_all(1)
+	(15, True)
 	"""
+	preamble_val, sfd0_val, sfd1_val = sync_vals(chips_per_symbol, preamble_val, sfd0_val,
+		sfd1_val)
 	# Useful constants
 	bits_per_symbol = bits_per_chip*chips_per_symbol
 	demod_bits_per_symbol = int(ceil(np.log2(chips_per_symbol)))
+	symbols_per_octet = int(ceil(8/demod_bits_per_symbol))
+
+	state = S_SCAN
+	packet_start = 0
+	packet_bits = []
+	packet_bits_needed = PRIMARY_HEADER_BITS
+
+	# Unconsumed received bits and the absolute index of buf[0]
+	buf = np.zeros(0, dtype=np.uint8)
+	buf_start = 0
 	
-	# Yup, it's an FSMlightroom
-	s_scan = 0
-	s_preamblematch1 = 1
-	s_preamblematch2 = 2
-	s_sfdmatch = 3
-	s_primaryheader1 = 4
-	s_datafield = 5
-	state = s_scan
-	
-	# Counters
-	bit_count = 0
-	primary_header_symbol_count = 0
-	data_field_symbol_count = 0
-	
-	# Keeping track of the data
-	corr_input = [0]*bits_per_symbol
-	corr_idx = 0
-	primary_header_val = []
-	data_field = []
-	
-	with open(inputFile, 'r') as f:
-		for i, line in enumerate(f):
-			line_rev = line[::-1].replace('\n', '')
-			for c in line_rev:
-				corr_input = corr_input[:len(corr_input)-1] + [c]
-				# Scanning for the preamble
-				if state == s_scan:
-					corr_output_vals, threshold_met = ppm_demod_bit_vals(corr_input,
-							chips_per_symbol, bits_per_chip, threshold=threshold_ext)
-					if corr_output_vals[0] == preamble_val and threshold_met[0]:
-						state = s_preamblematch1
-				# First instance of preamble symbol found, read in
-				# another symbol, and then look for second instance 
-				# of preamble symbol
-				elif state == s_preamblematch1:
-					if bit_count < bits_per_symbol:
-						bit_count = bit_count + 1
-					else:
-						corr_output_vals, threshold_met = ppm_demod_bit_vals(
-							corr_input, chips_per_symbol, bits_per_chip, 
-							threshold=threshold_ext)
-						bit_count = 0
-						if corr_output_vals[0] == preamble_val:
-							state = s_preamblematch2
-						else:
-							state = scan
-				# Second instance of preamble symbol found, read in another
-				# symbol, look for SFD0
-				elif state == s_preamblematch2:
-					if bit_count < bits_per_symbol:
-						bit_count = bit_count + 1
-					else:
-						corr_output_vals, threshold_met = ppm_demod_bit_vals(
-							corr_input, chips_per_symbol, bits_per_chip, 
-							threshold=threshold_ext)
-						bit_count = 0
-						if corr_output_vals[0] == sfd0_val:
-							state = s_sfdmatch
-						elif corr_output_vals[0] != preamble_val:
-							state = s_scan
-				# SFD0 found, read in another symbol, look for SFD1
-				elif state == s_sfdmatch:
-					if bit_count < bits_per_symbol:
-						bit_count = bit_count + 1
+	# Absolute indices of preamble matches from the last scan, and the 
+	# index up to which windows have been checked
+	scan_matches = np.zeros(0, dtype=np.int64)
+	scanned_to = 0
+
+	for chunk in iter_bit_chunks(source, chunk_rows):
+		count('rx_ppm_packets.bits', len(chunk))
+		buf = np.concatenate((buf, chunk))
+		idx = 0
+		while True:
+			# Scanning for the preamble: correlate every bit offset in the
+			# buffer at once and jump to the first match
+			if state == S_SCAN:
+				if buf_start + idx >= scanned_to:
+					num_windows = len(buf) - idx - bits_per_symbol + 1
+					if num_windows <= 0:
+						break
+					corr_symbol, _, corr_threshold_unmet = ppm_correlate_offsets(
+						buf[idx:], chips_per_symbol, bits_per_chip, 
+						threshold=threshold_ext)
+					scan_matches = buf_start + idx + np.flatnonzero(
+						(corr_symbol == preamble_val) & ~corr_threshold_unmet)
+					scanned_to = buf_start + idx + num_windows
+				# Matches from an earlier scan are reused after a failed lock
+				match_idx = np.searchsorted(scan_matches, buf_start + idx)
+				if match_idx == len(scan_matches):
+					idx = scanned_to - buf_start
+					break
+				packet_start = int(scan_matches[match_idx])
+				idx = packet_start - buf_start + bits_per_symbol
+				state = S_PREAMBLE_MATCH1
+				count('rx_ppm_packets.sync_attempts')
+				continue
+
+			# Reading in the primary header and data field as many symbols
+			# at a time as the buffer allows
+			if state in (S_PRIMARY_HEADER, S_DATA_FIELD):
+				bits_have = sum([len(b) for b in packet_bits])
+				num_symbols = min(int(ceil((packet_bits_needed-bits_have)/demod_bits_per_symbol)),
+								(len(buf)-idx) // bits_per_symbol)
+				if num_symbols > 0:
+					corr_symbol, _, _ = ppm_correlate_bits(
+						buf[idx:idx+num_symbols*bits_per_symbol],
+						chips_per_symbol, bits_per_chip)
+					packet_bits.append(ppm_vals_to_bits(corr_symbol, demod_bits_per_symbol))
+					idx = idx + num_symbols*bits_per_symbol
+					bits_have = bits_have + num_symbols*demod_bits_per_symbol
+				if bits_have < packet_bits_needed:
+					break
+
+				packet = np.concatenate(packet_bits)
+				# Header complete, figure out how long the data field is
+				if state == S_PRIMARY_HEADER:
+					datalen = packet[PRIMARY_HEADER_BITS-DATALEN_BITS:PRIMARY_HEADER_BITS]
+					data_field_octets = int(datalen @ (1 << np.arange(DATALEN_BITS-1, -1, -1)))
+					packet_bits_needed = PRIMARY_HEADER_BITS + data_field_octets \
+						* symbols_per_octet * demod_bits_per_symbol
+					packet_bits = [packet]
+					state = S_DATA_FIELD
+				if state == S_DATA_FIELD and len(packet) >= packet_bits_needed:
+					count('rx_ppm_packets.packets_found')
+					yield (packet_start, packet[:PRIMARY_HEADER_BITS],
+						packet[PRIMARY_HEADER_BITS:packet_bits_needed])
+					state = S_SCAN
+				continue
+
+			# Preamble and SFD matching walk the FSM a symbol at a time, but
+			# the symbols ahead are correlated in one go
+			num_symbols = min(sync_lookahead, (len(buf)-idx) // bits_per_symbol)
+			if num_symbols == 0:
+				break
+			corr_symbols, _, corr_threshold_unmet = ppm_correlate_bits(
+				buf[idx:idx+num_symbols*bits_per_symbol], chips_per_symbol,
+				bits_per_chip, threshold=threshold_ext)
+			for corr_symbol, unmet in zip(corr_symbols.tolist(), corr_threshold_unmet.tolist()):
+				idx = idx + bits_per_symbol
+
+				# First instance of preamble symbol found, look for a second
+				if state == S_PREAMBLE_MATCH1:
+					if corr_symbol == preamble_val and not unmet:
+						state = S_PREAMBLE_MATCH2
 					else:
-						corr_output_vals, threshold_met = ppm_demod_bit_vals(
-							corr_input, chips_per_symbol, bits_per_chip, 
-							threshold=threshold_ext)
-						bit_count = 0
-						if corr_output_vals[0] == sfd1_val:
-							state = s_primaryheader1
-						else:
-							state = s_scan
-				# SFD1 found, reading in primary header data
-				# Accumulate the number of 
-				elif state == s_primaryheader:
-					if bit_count < bits_per_symbol:
-						bit_count = bit_count + 1
+						state = S_SCAN
+				# Sit in the preamble until SFD0 shows up
+				elif state == S_PREAMBLE_MATCH2:
+					if corr_symbol == sfd0_val:
+						state = S_SFD_MATCH
+					elif corr_symbol != preamble_val:
+						state = S_SCAN
+				# SFD0 found, look for SFD1
+				elif state == S_SFD_MATCH:
+					if corr_symbol == sfd1_val:
+						packet_bits = []
+						packet_bits_needed = PRIMARY_HEADER_BITS
+						state = S_PRIMARY_HEADER
 					else:
-						corr_output_vals, threshold_met = ppm_demod_bit_vals(
-							corr_input, chips_per_symbol, bits_per_chip, 
-							threshold=threshold_ext)
-						bit_count = 0
-						if primary_header_symbol_count == 12:
-							primary_header_symbol_count = 0
-							data_field_octets = sum(np.asarray(primary_header[])* \
-								np.asarray([2**i for i in corr_output_vals]))
-							data_field_symbols = int(ceil(data_field_octets/ \
-								demod_bits_per_symbol))
-							state = s_datafield
-						else:
-							primary_header = primary_header + corr_output_vals
-							primary_header_symbol_count = \
-								primary_header_symbol_count + 1
-				# Reading in 
-				elif state == s_datafield:
+						state = S_SCAN
 				else:
-					raise ValueError("")
-					
+					raise ValueError("Unknown state {0}".format(state))
+				if state == S_SCAN:
+					count('rx_ppm_packets.sync_failures')
+				if state in (S_SCAN, S_PRIMARY_HEADER):
+					break
+
+		# Keep only what hasn't been consumed yet
+		buf = buf[idx:]
+		buf_start = buf_start + idx
+
+	# Locked on but the stream ended before the packet did
+	if state in (S_PRIMARY_HEADER, S_DATA_FIELD):
+		count('rx_ppm_packets.packets_truncated')
+
+def rx_ppm_packet_vals(inputFile, chips_per_symbol, bits_per_chip,
+				preamble_val=None, sfd0_val=None, sfd1_val=None,
+				threshold_ext=0):
+	"""
+	Inputs:
+		inputFile: String. Path to the binary file with the received data.
+			The LSB should be in the 0th element of a symbol.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		preamble_val: Integer. The symbol converted to decimal associated with
+			the preamble.
+		sfd0_val: Integer. The symbol converted to decimal associated with first
+			start symbol.
+		sfd1_val: Integer. The symbol converted to decimal associated with the
+			second start symbol.
+			Any of the three left as None defaults to what fits the order, see
+			ppm_base.sync_vals.
+		threshold_ext: Integer. External threshold for determining if the correlator
+			output is more than just noise. Only used when looking for the start
+			of a packet.
+	Outputs:
+		Returns the first demodulated packet (list of bits, primary header
+		followed by the data field) where the most recently-received element
+		goes at the end of the list, or None if no packet was found. Use
+		rx_ppm_packets to get every packet in the file.
+	"""
+	for _, header_bits, data_bits in rx_ppm_packets(inputFile, chips_per_symbol,
+			bits_per_chip, preamble_val=preamble_val, sfd0_val=sfd0_val,
+			sfd1_val=sfd1_val, threshold_ext=threshold_ext):
+		return list(header_bits) + list(data_bits)
+	return None
+
 if __name__ == "__main__":
 	inputFile = "../verilog/bleh.b"
-	with open(inputFile, 'r') as f:
-		ppm_demod_bits_vals = 
+	for packet_start, header_bits, data_bits in rx_ppm_packets(inputFile, 16, 2):
+		print(packet_start, ''.join(map(str, header_bits)), ''.join(map(str, data_bits)))
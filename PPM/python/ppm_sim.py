@@ -0,0 +1,263 @@
+# Created 2026/10/17
+
+# In-memory Monte Carlo estimation of bit and packet error rates. Packets
+# are built with the same layout as gen_rx_rand_data, pushed through the
+# same channel model (plus optional SPAD photon counting) and demodulated
+# with ppm_base, all as batched arrays.
+
+import numpy as np
+import doctest
+from itertools import product
+from math import sqrt
+from ppm_base import ppm_mod_bits, ppm_correlate_bits, ppm_vals_to_bits, sync_vals
+from ppm_filegen import packet_data_bits, gen_packet_bits
+from ppm_soft import ppm_soft_bits, llr_to_bits
+
+def wilson_interval(errors, trials, z=1.96):
+	"""
+	Inputs:
+		errors: Integer. Number of errors observed.
+		trials: Integer. Number of trials.
+		z: Float. Standard normal quantile for the confidence level (1.96 is
+			95%).
+	Outputs:
+		Returns (low, high), the Wilson score confidence interval for the
+		error rate. Stays sensible when no errors are observed.
+
+	>>> low, high = wilson_interval(0, 1000)
+	>>> low, round(high, 5)
+	(0.0, 0.00383)
+	"""
+	if trials == 0:
+		return (0.0, 1.0)
+	p = errors/trials
+	denom = 1 + z**2/trials
+	center = (p + z**2/(2*trials))/denom
+	half = z*sqrt(p*(1-p)/trials + z**2/(4*trials**2))/denom
+	return (max(0.0, center-half), min(1.0, center+half))
+
+def sim_packet_bits(num_packets, chips_per_symbol, p_datalen=[0]*15+[1],
+				preamble_val=None, sfd0_val=None, sfd1_val=None, rng=None):
+	"""
+	Inputs:
+		num_packets: Integer. Number of packets to generate.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		p_datalen: List of 1 and 0. (# of octets) in the data length field.
+			Packet data is randomized.
+		preamble_val: Integer. Preamble symbol value.
+		sfd0_val: Integer. First start symbol value.
+		sfd1_val: Integer. Second start symbol value.
+			Any of the three left as None defaults to what fits the order, see
+			ppm_base.sync_vals.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns (packets, data_start) where packets is a (num_packets, bits)
+		uint8 array of unmodulated packet bits laid out like gen_rx_rand_data
+		and data_start is the index of the first data field bit. The preamble
+		and SFD bits are derived from the symbol values so any PPM order
+		works. Packets are zero-padded to a whole number of symbols.
+	Raises:
+		ValueError if a sync symbol value doesn't fit in chips_per_symbol.
+
+	>>> packets, data_start = sim_packet_bits(1, 4, rng=np.random.default_rng(0))
+	>>> packets[0, 16:20].tolist(), data_start
+	([1, 1, 1, 0], 68)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	preamble_val, sfd0_val, sfd1_val = sync_vals(chips_per_symbol, preamble_val, sfd0_val,
+		sfd1_val)
+	demod_bits_per_symbol = int(np.log2(chips_per_symbol))
+	to_bits = lambda v: ppm_vals_to_bits([v], demod_bits_per_symbol).tolist()
+
+	p_data = rng.integers(0, 2, size=(num_packets,
+				packet_data_bits(chips_per_symbol, p_datalen)), dtype=np.uint8)
+	packets = gen_packet_bits(p_data, preamble=to_bits(preamble_val),
+				sfd0=to_bits(sfd0_val), sfd1=to_bits(sfd1_val), p_datalen=p_datalen)
+	data_start = packets.shape[1] - p_data.shape[1]
+
+	pad = -packets.shape[1] % demod_bits_per_symbol
+	if pad != 0:
+		packets = np.pad(packets, ((0,0), (0,pad)))
+	return packets, data_start
+
+def sim_channel(packets, chips_per_symbol, bits_per_chip, sigma_tx=0, sigma_bg=0,
+				photons_signal=None, photons_bg=0, rng=None):
+	"""
+	Inputs:
+		packets: (num_packets, bits) array of unmodulated packet bits.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		sigma_tx: Float. Standard deviation of the noise added to the packet
+			bits before modulation. Truncated back to bits like
+			gen_rx_rand_data does.
+		sigma_bg: Float. Standard deviation (in bits) of the noise added to
+			every received bit, rounded and clipped like gen_rx_rand_data.
+		photons_signal: Float or None. If given, each chip is instead received
+			as a SPAD count: Poisson with mean photons_signal (pulse chips) plus
+			photons_bg, saturated at 2**bits_per_chip-1 and written out MSB
+			first. sigma_bg is still applied on top.
+		photons_bg: Float. Mean background photons per chip.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a (num_packets, received bits) uint8 array of what the
+		receiver sees for each packet.
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	num_packets = packets.shape[0]
+
+	# TX noise on the unmodulated bits
+	if sigma_tx != 0:
+		noisy = np.trunc(packets + rng.normal(0, sigma_tx, size=packets.shape))
+		packets = np.clip(noisy, 0, 1).astype(np.uint8)
+	rx_bits = ppm_mod_bits(packets, chips_per_symbol, bits_per_chip)
+	rx_bits = rx_bits.reshape(num_packets, -1)
+	return channel_bits(rx_bits, bits_per_chip, sigma_bg=sigma_bg,
+				photons_signal=photons_signal, photons_bg=photons_bg, rng=rng)
+
+def channel_bits(rx_bits, bits_per_chip, sigma_bg=0, photons_signal=None,
+				photons_bg=0, rng=None):
+	"""
+	Inputs:
+		rx_bits: Array of modulated bits whose last axis is a whole number of
+			chips, e.g. one packet per row or one long stream.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		sigma_bg, photons_signal, photons_bg: See sim_channel. photons_signal
+			can also be an array with one mean per chip, e.g. scaled by a
+			fading gain (see ppm_fading).
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a uint8 array shaped like 'rx_bits' with the receive side of
+		the channel (photon counting, then background noise) applied.
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	rx_bits = np.asarray(rx_bits, dtype=np.uint8)
+	shape = rx_bits.shape
+
+	# Photon counting: every chip becomes a saturating count
+	if photons_signal is not None:
+		pulses = rx_bits.reshape(-1, bits_per_chip)[:,0]
+		counts = rng.poisson(photons_signal*pulses + photons_bg)
+		counts = np.minimum(counts, 2**bits_per_chip - 1)
+		rx_bits = ppm_vals_to_bits(counts, bits_per_chip).reshape(shape)
+
+	# Background noise on every received bit
+	if sigma_bg != 0:
+		noisy = np.round(rx_bits + rng.normal(0, sigma_bg, size=shape))
+		rx_bits = np.clip(noisy, 0, 1).astype(np.uint8)
+	return rx_bits
+
+def sim_ber_per(num_packets, chips_per_symbol, bits_per_chip, p_datalen=[0]*15+[1],
+				sigma_tx=0, sigma_bg=0, photons_signal=None, photons_bg=0,
+				threshold=0, soft=False, batch_packets=4096, z=1.96, rng=None):
+	"""
+	Inputs:
+		num_packets: Integer. Total number of packets to simulate.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		p_datalen: List of 1 and 0. (# of octets) in the data length field.
+		sigma_tx, sigma_bg, photons_signal, photons_bg: See sim_channel.
+		threshold: Integer. Correlator threshold. A symbol whose peak doesn't
+			meet it counts as erased (always wrong).
+		soft: Boolean. If True, decide each bit from its Poisson
+			log-likelihood ratio (ppm_soft_bits) instead of taking the
+			correlator's symbol. Needs photons_signal, and ignores threshold.
+		batch_packets: Integer. Number of packets processed per batch. Bounds
+			memory use.
+		z: Float. Normal quantile for the confidence intervals.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a dictionary with the error counts ('bit_errors', 'bits',
+		'packet_errors', 'packets'), the bit error rate over the data field
+		('ber', 'ber_low', 'ber_high') and the packet error rate ('per',
+		'per_low', 'per_high'). A packet is in error if any of its symbols,
+		sync symbols included, was demodulated wrongly. Symbol timing is
+		assumed known.
+
+	>>> result = sim_ber_per(100, 16, 2, rng=np.random.default_rng(0))
+	>>> result['bit_errors'], result['bits'], result['per']
+	(0, 800, 0.0)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	if soft and photons_signal is None:
+		raise ValueError("Soft decisions need the photon counting channel")
+	demod_bits_per_symbol = int(np.log2(chips_per_symbol))
+
+	bit_errors = 0
+	bits = 0
+	packet_errors = 0
+	for batch_start in range(0, num_packets, batch_packets):
+		batch = min(batch_packets, num_packets - batch_start)
+		packets, data_start = sim_packet_bits(batch, chips_per_symbol,
+								p_datalen=p_datalen, rng=rng)
+		rx_bits = sim_channel(packets, chips_per_symbol, bits_per_chip,
+					sigma_tx=sigma_tx, sigma_bg=sigma_bg,
+					photons_signal=photons_signal, photons_bg=photons_bg, rng=rng)
+
+		# Demodulate the whole batch at once
+		if soft:
+			llr = ppm_soft_bits(rx_bits, chips_per_symbol, bits_per_chip,
+				photons_signal, photons_bg)
+			wrong = llr_to_bits(llr).reshape(batch, -1) != packets
+		else:
+			corr_symbol, _, corr_threshold_unmet = ppm_correlate_bits(rx_bits,
+				chips_per_symbol, bits_per_chip, threshold=threshold)
+			rx_packets = ppm_vals_to_bits(corr_symbol, demod_bits_per_symbol)
+			rx_packets = rx_packets.reshape(batch, -1)
+			erased = np.repeat(corr_threshold_unmet, demod_bits_per_symbol).reshape(batch, -1)
+			wrong = (rx_packets != packets) | erased
+
+		bit_errors = bit_errors + int(wrong[:, data_start:].sum())
+		bits = bits + wrong[:, data_start:].size
+		packet_errors = packet_errors + int(wrong.any(axis=1).sum())
+
+	ber_low, ber_high = wilson_interval(bit_errors, bits, z)
+	per_low, per_high = wilson_interval(packet_errors, num_packets, z)
+	return dict(bit_errors=bit_errors, bits=bits,
+		packet_errors=packet_errors, packets=num_packets,
+		ber=bit_errors/bits if bits else 0.0, ber_low=ber_low, ber_high=ber_high,
+		per=packet_errors/num_packets if num_packets else 0.0,
+		per_low=per_low, per_high=per_high)
+
+def sim_sweep(param_grid, num_packets, seed=None, **kwargs):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping sim_ber_per argument names (e.g.
+			'chips_per_symbol', 'bits_per_chip', 'sigma_bg', 'photons_signal')
+			to lists of values. Every combination is simulated.
+		num_packets: Integer. Packets per grid point.
+		seed: Integer or None. Seed for reproducible sweeps.
+		kwargs: Passed along to every sim_ber_per call.
+	Outputs:
+		Returns a list of dictionaries, one per grid point, holding the
+		parameters followed by the sim_ber_per results. These make a BER/PER
+		curve when sorted along the noise axis.
+
+	>>> rows = sim_sweep(dict(chips_per_symbol=[4, 16], bits_per_chip=[1],
+	...		sigma_bg=[0]), 10, seed=1)
+	>>> [(r['chips_per_symbol'], r['ber']) for r in rows]
+	[(4, 0.0), (16, 0.0)]
+	"""
+	rng = np.random.default_rng(seed)
+	names = list(param_grid.keys())
+	rows = []
+	for values in product(*[param_grid[n] for n in names]):
+		params = dict(zip(names, values))
+		result = sim_ber_per(num_packets=num_packets, rng=rng, **params, **kwargs)
+		rows.append(dict(params, **result))
+	return rows
+
+if __name__ == "__main__":
+	# BER/PER versus background noise for a few PPM orders
+	rows = sim_sweep(dict(chips_per_symbol=[4, 16, 64], bits_per_chip=[1, 2],
+		sigma_bg=[0.1, 0.2, 0.3]), 10000, seed=0)
+	for r in rows:
+		print("{chips_per_symbol:4d}-PPM {bits_per_chip} b/chip sigma_bg={sigma_bg:.2f}"
+			"  BER={ber:.3e} [{ber_low:.3e}, {ber_high:.3e}]"
+			"  PER={per:.3e} [{per_low:.3e}, {per_high:.3e}]".format(**r))
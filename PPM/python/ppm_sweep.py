@@ -0,0 +1,283 @@
+# Created 2026/10/17
+
+# Runs parameter studies (PPM order, bits per chip, thresholds, noise) across
+# all cores. Every trial gets its own random stream spawned from a single
+# seed, results are appended to a CSV as they finish, and a sweep which was
+# interrupted picks up where it left off.
+
+import numpy as np
+import csv
+import doctest
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import product
+from ppm_sim import sim_ber_per, wilson_interval
+
+def sweep_tasks(param_grid, trials_per_point=1):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping argument names to lists of values.
+		trials_per_point: Integer. Number of independent trials per
+			combination of parameters.
+	Outputs:
+		Returns a list of (task, trial, params) tuples in a fixed order, where
+		task is the index used to spawn the trial's random stream.
+
+	>>> sweep_tasks(dict(a=[1, 2], b=['x']), 2)[-1]
+	(3, 1, {'a': 2, 'b': 'x'})
+	"""
+	names = list(param_grid.keys())
+	tasks = []
+	for values in product(*[param_grid[n] for n in names]):
+		for trial in range(trials_per_point):
+			tasks.append((len(tasks), trial, dict(zip(names, values))))
+	return tasks
+
+def _run_trial(trial_func, task, trial, params, seed, seed_seq, kwargs, kwargs_hash):
+	"""
+	Inputs:
+		trial_func: Module-level function taking rng= plus keyword arguments
+			and returning a dictionary of results.
+		task, trial, params: See sweep_tasks.
+		seed: Integer. Root seed of the sweep, recorded in the row.
+		seed_seq: np.random.SeedSequence for this trial.
+		kwargs: Dictionary of extra arguments shared by every trial.
+		kwargs_hash: String. _kwargs_hash(kwargs), recorded in the row.
+	Outputs:
+		Returns the row for the results table.
+	"""
+	rng = np.random.default_rng(seed_seq)
+	result = trial_func(rng=rng, **params, **kwargs)
+	row = dict(task=task, trial=trial, seed=seed, kwargs_hash=kwargs_hash)
+	row.update(params)
+	row.update(result)
+	return row
+
+def _parse_value(x):
+	"""
+	Inputs:
+		x: String read back from the results CSV.
+	Outputs:
+		Returns x as an int, float, bool or None where possible.
+
+	>>> [_parse_value(x) for x in ['3', '0.5', 'True', '', 'abc']]
+	[3, 0.5, True, None, 'abc']
+	"""
+	if x == '':
+		return None
+	if x in ('True', 'False'):
+		return x == 'True'
+	for cast in (int, float):
+		try:
+			return cast(x)
+		except ValueError:
+			pass
+	return x
+
+def _kwargs_hash(kwargs):
+	"""
+	Inputs:
+		kwargs: Dictionary of extra arguments shared by every trial.
+	Outputs:
+		Returns a short hex digest of kwargs which doesn't depend on their
+		order, as it reads back from the results CSV.
+
+	>>> _kwargs_hash(dict(a=1, b=[2])) == _kwargs_hash(dict(b=[2], a=1))
+	True
+	"""
+	text = json.dumps(kwargs, sort_keys=True, default=str)
+	return _parse_value(hashlib.sha1(text.encode()).hexdigest()[:16])
+
+def _task_key(task, trial, seed, kwargs_hash, params):
+	"""
+	Outputs:
+		Returns a hashable key identifying one trial of one sweep, so rows
+		read back from a results file only count for the sweep that wrote
+		them.
+	"""
+	return (task, trial, seed, kwargs_hash) + tuple(sorted(params.items()))
+
+def read_sweep_results(results_file):
+	"""
+	Inputs:
+		results_file: String. Path to a CSV written by run_sweep.
+	Outputs:
+		Returns the rows as a list of dictionaries with numbers parsed, or
+		an empty list if the file doesn't exist.
+	"""
+	if not os.path.exists(results_file):
+		return []
+	with open(results_file, 'r', newline='') as f:
+		return [{k: _parse_value(v) for k, v in row.items()}
+				for row in csv.DictReader(f)]
+
+def run_sweep(param_grid, trial_func=sim_ber_per, trials_per_point=1, seed=0,
+			results_file=None, max_workers=None, **kwargs):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping trial_func argument names to lists of
+			values, e.g. chips_per_symbol, bits_per_chip, threshold, sigma_bg.
+		trial_func: Module-level (picklable) function which takes an 'rng'
+			keyword plus the parameters and returns a dictionary of results.
+			Defaults to ppm_sim.sim_ber_per.
+		trials_per_point: Integer. Number of independent trials for each
+			combination of parameters.
+		seed: Integer. Root seed. Trial i always draws from the i-th child
+			of np.random.SeedSequence(seed), so results don't depend on the
+			number of workers or on the order in which trials finish.
+		results_file: String or None. CSV to append each row to as soon as
+			its trial finishes. Trials already in the file are skipped, which
+			is how an interrupted sweep is resumed. A row only counts if its
+			task, trial, seed, parameters and kwargs all match this sweep.
+		max_workers: Integer or None. Number of worker processes (defaults to
+			the number of cores).
+		kwargs: Passed to every trial, e.g. num_packets.
+	Outputs:
+		Returns the list of result rows (including ones from a resumed file),
+		sorted by task. Each row holds 'task', 'trial', 'seed', 'kwargs_hash'
+		(see _kwargs_hash), the parameters and the trial's results.
+	Raises:
+		ValueError if results_file holds rows from a different sweep (another
+		param_grid, trials_per_point, seed or kwargs).
+
+	>>> import tempfile
+	>>> results_file = os.path.join(tempfile.mkdtemp(), 'sweep.csv')
+	>>> rows = run_sweep(dict(chips_per_symbol=[4, 16]), results_file=results_file,
+	...		max_workers=1, bits_per_chip=2, num_packets=2)
+	>>> len(run_sweep(dict(chips_per_symbol=[4, 16]), results_file=results_file,
+	...		max_workers=1, bits_per_chip=2, num_packets=2))
+	2
+	>>> run_sweep(dict(chips_per_symbol=[64, 256]), results_file=results_file, # doctest: +ELLIPSIS
+	...		max_workers=1, bits_per_chip=2, num_packets=2)
+	Traceback (most recent call last):
+	...
+	ValueError: 2 rows in ... don't belong to this sweep (different param_grid, trials_per_point, seed or kwargs)
+	>>> run_sweep(dict(chips_per_symbol=[4, 16]), results_file=results_file, # doctest: +ELLIPSIS
+	...		max_workers=1, bits_per_chip=2, num_packets=50)
+	Traceback (most recent call last):
+	...
+	ValueError: 2 rows in ... don't belong to this sweep (different param_grid, trials_per_point, seed or kwargs)
+	"""
+	tasks = sweep_tasks(param_grid, trials_per_point)
+	seed_seqs = np.random.SeedSequence(seed).spawn(len(tasks))
+	kwargs_hash = _kwargs_hash(kwargs)
+
+	# Picking up from a partly finished sweep
+	rows = []
+	if results_file is not None:
+		rows = read_sweep_results(results_file)
+	keys = set([_task_key(task, trial, seed, kwargs_hash, params)
+		for task, trial, params in tasks])
+	done = set()
+	for row in rows:
+		params = dict([(name, row.get(name)) for name in param_grid.keys()])
+		done.add(_task_key(row['task'], row['trial'], row.get('seed'), row.get('kwargs_hash'),
+			params))
+	if not done <= keys:
+		raise ValueError("{0} rows in {1} don't belong to this sweep (different "
+			"param_grid, trials_per_point, seed or kwargs)".format(len(done - keys),
+			results_file))
+	todo = [t for t in tasks if _task_key(t[0], t[1], seed, kwargs_hash, t[2]) not in done]
+
+	writer = None
+	out = None
+	if results_file is not None:
+		fieldnames = None
+		if len(rows) > 0:
+			with open(results_file, 'r', newline='') as f:
+				fieldnames = next(csv.reader(f))
+		out = open(results_file, 'a', newline='')
+
+	if max_workers is None:
+		max_workers = os.cpu_count() or 1
+
+	try:
+		with ProcessPoolExecutor(max_workers=max_workers) as executor:
+			# Keep a bounded number of trials in flight so huge grids don't
+			# queue everything up front
+			max_in_flight = 4*max_workers
+			pending = set()
+			todo_iter = iter(todo)
+			while True:
+				for task, trial, params in todo_iter:
+					pending.add(executor.submit(_run_trial, trial_func, task,
+						trial, params, seed, seed_seqs[task], kwargs, kwargs_hash))
+					if len(pending) >= max_in_flight:
+						break
+				if len(pending) == 0:
+					break
+				finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in finished:
+					row = future.result()
+					rows.append(row)
+					if out is None:
+						continue
+					if writer is None:
+						if fieldnames is None:
+							fieldnames = list(row.keys())
+							writer = csv.DictWriter(out, fieldnames=fieldnames,
+										extrasaction='ignore')
+							writer.writeheader()
+						else:
+							writer = csv.DictWriter(out, fieldnames=fieldnames,
+										extrasaction='ignore')
+					writer.writerow(row)
+					out.flush()
+	finally:
+		if out is not None:
+			out.close()
+
+	return sorted(rows, key=lambda row: row['task'])
+
+def aggregate_sweep(rows, param_names, z=1.96):
+	"""
+	Inputs:
+		rows: List of result rows from run_sweep with sim_ber_per trials.
+		param_names: List of strings. Parameters to group the trials by.
+		z: Float. Normal quantile for the confidence intervals.
+	Outputs:
+		Returns one dictionary per parameter combination with the error
+		counts summed over its trials and the BER/PER (with confidence
+		intervals) recomputed from the totals.
+
+	>>> rows = [dict(task=0, trial=0, M=16, bit_errors=1, bits=100, packet_errors=1, packets=10),
+	...		dict(task=1, trial=1, M=16, bit_errors=3, bits=100, packet_errors=2, packets=10)]
+	>>> agg = aggregate_sweep(rows, ['M'])
+	>>> agg[0]['ber'], agg[0]['per'], agg[0]['trials']
+	(0.02, 0.15, 2)
+	"""
+	totals = {}
+	for row in rows:
+		key = tuple([row[n] for n in param_names])
+		if key not in totals:
+			totals[key] = dict(bit_errors=0, bits=0, packet_errors=0, packets=0, trials=0)
+		for count in ('bit_errors', 'bits', 'packet_errors', 'packets'):
+			totals[key][count] = totals[key][count] + row[count]
+		totals[key]['trials'] = totals[key]['trials'] + 1
+
+	table = []
+	for key in sorted(totals.keys()):
+		t = totals[key]
+		ber_low, ber_high = wilson_interval(t['bit_errors'], t['bits'], z)
+		per_low, per_high = wilson_interval(t['packet_errors'], t['packets'], z)
+		entry = dict(zip(param_names, key))
+		entry.update(t)
+		entry.update(ber=t['bit_errors']/t['bits'] if t['bits'] else 0.0,
+			ber_low=ber_low, ber_high=ber_high,
+			per=t['packet_errors']/t['packets'] if t['packets'] else 0.0,
+			per_low=per_low, per_high=per_high)
+		table.append(entry)
+	return table
+
+if __name__ == "__main__":
+	param_grid = dict(
+		chips_per_symbol = [4, 16, 64, 256],
+		bits_per_chip = [1, 2, 3],
+		threshold = [0, 1],
+		sigma_bg = [0.1, 0.2, 0.3])
+	rows = run_sweep(param_grid, trials_per_point=8, seed=0,
+		results_file="sweep_results.csv", num_packets=2000)
+	for entry in aggregate_sweep(rows, list(param_grid.keys())):
+		print(entry)
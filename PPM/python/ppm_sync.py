@@ -0,0 +1,147 @@
+# Created 2026/10/17
+
+# Packet acquisition. Searches every bit alignment of a capture at once
+# for the preamble/SFD0/SFD1 sequence so a capture can be indexed before
+# (or instead of) running it through the full receiver FSM.
+
+import numpy as np
+import doctest
+from ppm_base import ppm_correlate_offsets, sync_vals
+from ppm_capture import iter_bit_chunks
+
+def ppm_sync_scores(mod_bits, chips_per_symbol, bits_per_chip,
+				preamble_val=None, sfd0_val=None, sfd1_val=None, preamble_symbols=8,
+				threshold_ext=0):
+	"""
+	Inputs:
+		mod_bits: Collection of received bits in the order received.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		preamble_val: Integer. The symbol converted to decimal associated with
+			the preamble.
+		sfd0_val: Integer. The symbol converted to decimal associated with first
+			start symbol.
+		sfd1_val: Integer. The symbol converted to decimal associated with the
+			second start symbol.
+			Any of the three left as None defaults to what fits the order, see
+			ppm_base.sync_vals.
+		preamble_symbols: Integer. Number of preamble symbols expected right
+			before SFD0.
+		threshold_ext: Integer. Minimum peak value for a preamble symbol to
+			count as a match.
+	Outputs:
+		Returns an integer array where entry t is the number of symbols in
+		the sync sequence ([preamble_val]*preamble_symbols + [sfd0_val, sfd1_val])
+		that match when the sequence starts at bit t. Only offsets where the
+		whole sequence fits in 'mod_bits' are scored.
+	Raises:
+		ValueError if a sync symbol value doesn't fit in chips_per_symbol.
+
+	>>> from ppm_base import ppm_mod_vals
+	>>> mod_bits = np.concatenate([np.zeros(3, dtype=np.uint8), ppm_mod_vals([0,0,7,10], 16, 1)])
+	>>> scores = ppm_sync_scores(mod_bits, 16, 1, preamble_symbols=2, threshold_ext=1)
+	>>> len(scores), int(np.argmax(scores)), int(scores.max())
+	(4, 3, 4)
+	"""
+	preamble_val, sfd0_val, sfd1_val = sync_vals(chips_per_symbol, preamble_val, sfd0_val,
+		sfd1_val)
+	bits_per_symbol = chips_per_symbol*bits_per_chip
+	pattern = [preamble_val]*preamble_symbols + [sfd0_val, sfd1_val]
+
+	corr_symbol, _, corr_threshold_unmet = ppm_correlate_offsets(mod_bits,
+		chips_per_symbol, bits_per_chip, threshold=threshold_ext)
+	num_starts = len(corr_symbol) - (len(pattern)-1)*bits_per_symbol
+	if num_starts <= 0:
+		return np.zeros(0, dtype=np.int64)
+
+	# Every alignment is scored in the same pass by striding through the
+	# per-offset correlator output one symbol at a time
+	scores = np.zeros(num_starts, dtype=np.int64)
+	for m, val in enumerate(pattern):
+		window = slice(m*bits_per_symbol, m*bits_per_symbol+num_starts)
+		match = corr_symbol[window] == val
+		if m < preamble_symbols:
+			match &= ~corr_threshold_unmet[window]
+		scores += match
+	return scores
+
+def ppm_index_packets(source, chips_per_symbol, bits_per_chip,
+				preamble_val=None, sfd0_val=None, sfd1_val=None, preamble_symbols=8,
+				threshold_ext=0, min_score=None, chunk_rows=4096):
+	"""
+	Inputs:
+		source: String path to a .b file or packed capture, a NumPy array of
+			received bits, or an iterable of NumPy arrays of received bits (in
+			the order received).
+		chips_per_symbol, bits_per_chip, preamble_val, sfd0_val, sfd1_val,
+			preamble_symbols, threshold_ext: See ppm_sync_scores.
+		min_score: Integer. Minimum number of matching sync symbols for a
+			candidate. Defaults to all of them (preamble_symbols+2).
+		chunk_rows: Integer. Rows per chunk when 'source' is a file.
+	Outputs:
+		Generator which yields (packet_start, score) for every candidate, in
+		order. packet_start is the bit index of the first of the
+		'preamble_symbols' preamble symbols. Candidates less than a symbol
+		apart (e.g. off by a bit within a multi-bit chip) are merged and the
+		best-scoring (earliest on ties) is kept. Memory is bounded by the
+		chunk size.
+
+	>>> from ppm_base import ppm_mod_vals
+	>>> sync = ppm_mod_vals([0]*8 + [7, 10], 16, 2)
+	>>> noise = np.zeros(50, dtype=np.uint8)
+	>>> mod_bits = np.concatenate([noise, sync, noise, sync])
+	>>> [(int(s), int(c)) for s, c in ppm_index_packets(mod_bits, 16, 2, threshold_ext=2)]
+	[(50, 10), (420, 10)]
+	"""
+	bits_per_symbol = chips_per_symbol*bits_per_chip
+	if min_score is None:
+		min_score = preamble_symbols+2
+
+	buf = np.zeros(0, dtype=np.uint8)
+	buf_start = 0
+	best = None
+	for chunk in iter_bit_chunks(source, chunk_rows):
+		buf = np.concatenate((buf, chunk))
+		scores = ppm_sync_scores(buf, chips_per_symbol, bits_per_chip,
+			preamble_val=preamble_val, sfd0_val=sfd0_val, sfd1_val=sfd1_val,
+			preamble_symbols=preamble_symbols, threshold_ext=threshold_ext)
+
+		# Merge neighbouring candidates, holding the last one back in case
+		# its cluster continues into the next chunk
+		for start in np.flatnonzero(scores >= min_score):
+			candidate = (buf_start+int(start), int(scores[start]))
+			if best is None:
+				best = candidate
+				last = candidate[0]
+				continue
+			if candidate[0] - last >= bits_per_symbol:
+				yield best
+				best = candidate
+			elif candidate[1] > best[1]:
+				best = candidate
+			last = candidate[0]
+
+		# Keep the bits which couldn't start a full sync sequence yet
+		consumed = len(scores)
+		buf = buf[consumed:]
+		buf_start = buf_start + consumed
+	if best is not None:
+		yield best
+
+def ppm_find_packets(mod_bits, chips_per_symbol, bits_per_chip, **kwargs):
+	"""
+	Inputs:
+		mod_bits: NumPy array of received bits in the order received.
+		chips_per_symbol: Integer. Number of chips per symbol in the encoding
+			scheme.
+		bits_per_chip: Integer. Number of bits per chip in the encoding scheme.
+		kwargs: Passed along to ppm_index_packets.
+	Outputs:
+		Returns (packet_starts, scores) as NumPy arrays. See ppm_index_packets.
+	"""
+	found = list(ppm_index_packets(np.asarray(mod_bits, dtype=np.uint8),
+					chips_per_symbol, bits_per_chip, **kwargs))
+	packet_starts = np.asarray([f[0] for f in found], dtype=np.int64)
+	scores = np.asarray([f[1] for f in found], dtype=np.int64)
+	return packet_starts, scores
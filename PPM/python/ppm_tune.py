@@ -0,0 +1,220 @@
+# Created 2026/10/17
+
+# Picks the receiver operating point (PPM order, bits per chip and the sync
+# threshold threshold_ext/corr_threshold) for a given received signal and
+# background photon rate. Every candidate is simulated end to end through
+# the photon-counting channel and ppm_rx in batches of packets, and dropped
+# as soon as its goodput is clearly below the best one found so far.
+
+import numpy as np
+import doctest
+import os
+import sys
+from itertools import product
+from ppm_base import ppm_mod_bits
+from ppm_filegen import packet_data_bits
+from ppm_rx import rx_ppm_packets, PRIMARY_HEADER_BITS
+from ppm_sim import sim_packet_bits, channel_bits, wilson_interval
+
+# const.py lives at the top of the repo, link_base.py next to this folder
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.append(_ROOT)
+sys.path.append(os.path.join(_ROOT, 'link', 'python'))
+from const import calc_E_photon
+from link_base import calc_rx_power
+
+# Default search space. Orders are limited to ones whose bits per symbol
+# divide the 48-bit primary header, so the data field starts on a symbol.
+TUNE_CHIPS_PER_SYMBOL = [4, 16, 64, 256]
+TUNE_BITS_PER_CHIP = [1, 2, 3, 4]
+
+# Configurations within this fraction of the best goodput count as a tie,
+# which goes to the fewest bits per chip (narrowest CHIP_BITS datapath)
+TUNE_TIE_TOLERANCE = 0.02
+
+def photon_rates(P_RX, P_bg, lamb):
+	"""
+	Inputs:
+		P_RX: Float. Signal power reaching the detector in watts, e.g. from
+			link_base.calc_rx_power.
+		P_bg: Float. Background power reaching the detector in watts.
+		lamb: Float. Wavelength in meters.
+	Outputs:
+		Returns (photons_per_sec, bg_photons_per_sec).
+
+	>>> [round(r/1e6, 2) for r in photon_rates(1e-12, 1e-13, 1550e-9)]
+	[7.83, 0.78]
+	"""
+	E_photon = calc_E_photon(lamb)
+	return P_RX/E_photon, P_bg/E_photon
+
+def _sim_batch(num_packets, chips_per_symbol, bits_per_chip, threshold, photons_signal,
+			photons_bg, p_datalen, gap_symbols, rng):
+	"""
+	Outputs:
+		Returns (good_packets, received_bits) for a stream of 'num_packets'
+		packets separated by 'gap_symbols' empty symbols, sent through the
+		photon-counting channel and received with rx_ppm_packets. A packet
+		is good if a packet was found at its start and its header and data
+		came out right.
+	"""
+	packets, data_start = sim_packet_bits(num_packets, chips_per_symbol,
+		p_datalen=p_datalen, rng=rng)
+	mod_bits = ppm_mod_bits(packets, chips_per_symbol, bits_per_chip).reshape(num_packets, -1)
+	gap_bits = gap_symbols*chips_per_symbol*bits_per_chip
+	stream = np.zeros((num_packets, gap_bits + mod_bits.shape[1]), dtype=np.uint8)
+	stream[:, gap_bits:] = mod_bits
+	rx_bits = channel_bits(stream.ravel(), bits_per_chip, photons_signal=photons_signal,
+		photons_bg=photons_bg, rng=rng)
+
+	# Packets are matched up by which slot the receiver locked on in
+	num_data_bits = packet_data_bits(chips_per_symbol, p_datalen)
+	header_start = data_start - PRIMARY_HEADER_BITS
+	good = np.zeros(num_packets, dtype=bool)
+	for start, header_bits, data_bits in rx_ppm_packets(rx_bits, chips_per_symbol,
+			bits_per_chip, threshold_ext=threshold):
+		n = start // stream.shape[1]
+		good[n] = np.array_equal(header_bits, packets[n, header_start:data_start]) and \
+			np.array_equal(data_bits, packets[n, data_start:data_start+num_data_bits])
+	return int(good.sum()), len(rx_bits)
+
+def eval_operating_point(chips_per_symbol, bits_per_chip, threshold, photons_per_sec,
+				bg_photons_per_sec, chip_rate, p_datalen=[0]*11+[1,0,0,0,0],
+				gap_symbols=4, batch_packets=64, max_packets=1024, min_goodput=0.0,
+				z=1.96, rng=None):
+	"""
+	Inputs:
+		chips_per_symbol: Integer. PPM order.
+		bits_per_chip: Integer. Bits per chip (CHIP_BITS), so SPAD counts
+			saturate at 2**bits_per_chip-1.
+		threshold: Integer. threshold_ext for rx_ppm_packets, i.e. the
+			correlator threshold used while looking for a preamble.
+		photons_per_sec: Float. Average received signal photon rate. The
+			transmitter is average-power limited, so each pulse carries
+			photons_per_sec*chips_per_symbol/chip_rate photons.
+		bg_photons_per_sec: Float. Background photon rate.
+		chip_rate: Float. Chips per second.
+		p_datalen: List of 1 and 0. Data length field (octets per packet).
+		gap_symbols: Integer. Empty symbols between packets.
+		batch_packets: Integer. Packets simulated per batch.
+		max_packets: Integer. Most packets simulated.
+		min_goodput: Float. Stop as soon as the upper confidence bound on the
+			goodput drops below this (the best lower bound found so far).
+		z: Float. Normal quantile for the confidence bounds.
+		rng: np.random.Generator. Source of randomness.
+	Outputs:
+		Returns a dictionary with the parameters, 'packets' simulated,
+		'good_packets', 'per', 'goodput' (payload bits/second delivered in
+		good packets) with 'goodput_low'/'goodput_high' bounds, and
+		'stopped_early'.
+
+	>>> r = eval_operating_point(16, 2, 1, 1e8, 1e5, 1e8, max_packets=64,
+	...		rng=np.random.default_rng(0))
+	>>> r['per'], round(r['goodput']/1e6, 2)
+	(0.0, 13.79)
+	"""
+	if rng is None:
+		rng = np.random.default_rng()
+	photons_signal = photons_per_sec*chips_per_symbol/chip_rate
+	photons_bg = bg_photons_per_sec/chip_rate
+	payload_bits = 8*int(''.join([str(b) for b in p_datalen]), 2)
+
+	packets = 0
+	good_packets = 0
+	rx_bits = 0
+	stopped_early = False
+	while packets < max_packets:
+		batch = min(batch_packets, max_packets - packets)
+		good, num_bits = _sim_batch(batch, chips_per_symbol, bits_per_chip, threshold,
+			photons_signal, photons_bg, p_datalen, gap_symbols, rng)
+		packets = packets + batch
+		good_packets = good_packets + good
+		rx_bits = rx_bits + num_bits
+
+		# Goodput scales with the fraction of good packets
+		rate = payload_bits*packets/(rx_bits/bits_per_chip/chip_rate)
+		_, success_high = wilson_interval(good_packets, packets, z)
+		if packets < max_packets and rate*success_high < min_goodput:
+			stopped_early = True
+			break
+
+	success_low, success_high = wilson_interval(good_packets, packets, z)
+	return dict(chips_per_symbol=chips_per_symbol, bits_per_chip=bits_per_chip,
+		threshold=threshold, photons_signal=photons_signal, photons_bg=photons_bg,
+		packets=packets, good_packets=good_packets, per=1 - good_packets/packets,
+		goodput=rate*good_packets/packets, goodput_low=rate*success_low,
+		goodput_high=rate*success_high, stopped_early=stopped_early)
+
+def tune_operating_point(photons_per_sec, bg_photons_per_sec, chip_rate,
+				chips_per_symbol=TUNE_CHIPS_PER_SYMBOL, bits_per_chip=TUNE_BITS_PER_CHIP,
+				thresholds=None, tie_tolerance=TUNE_TIE_TOLERANCE, seed=0, **kwargs):
+	"""
+	Inputs:
+		photons_per_sec, bg_photons_per_sec, chip_rate: See
+			eval_operating_point (photon_rates converts from watts).
+		chips_per_symbol: List of PPM orders to try.
+		bits_per_chip: List of bits per chip to try.
+		thresholds: List of threshold_ext values, or None for every value
+			from 0 to the largest count, 2**bits_per_chip-1.
+		tie_tolerance: Float. See TUNE_TIE_TOLERANCE.
+		seed: Integer. Every candidate draws from its own child of
+			np.random.SeedSequence(seed).
+		kwargs: Passed along to eval_operating_point.
+	Outputs:
+		Returns a dictionary with the recommended 'chips_per_symbol',
+		'bits_per_chip', 'threshold', 'goodput' and 'per', the Verilog
+		parameters to match ('CHIP_BITS' and 'corr_threshold'), and every
+		candidate's result under 'rows'.
+	Raises:
+		ValueError if no candidate got a single packet through.
+
+	>>> best = tune_operating_point(3e7, 1e6, 1e8, chips_per_symbol=[4, 16, 64],
+	...		bits_per_chip=[1, 2], max_packets=128)
+	>>> best['chips_per_symbol'], best['CHIP_BITS'], best['threshold']
+	(16, 2, 1)
+	>>> [r['stopped_early'] for r in best['rows'] if r['chips_per_symbol'] == 64]
+	[True, True, True, True, True, True]
+	"""
+	candidates = []
+	for cps, bpc in product(chips_per_symbol, bits_per_chip):
+		levels = range(2**bpc) if thresholds is None else \
+			[t for t in thresholds if t < 2**bpc]
+		candidates.extend([(cps, bpc, t) for t in levels])
+	seed_seqs = np.random.SeedSequence(seed).spawn(len(candidates))
+
+	rows = []
+	best_low = 0.0
+	for (cps, bpc, t), seed_seq in zip(candidates, seed_seqs):
+		row = eval_operating_point(cps, bpc, t, photons_per_sec, bg_photons_per_sec,
+			chip_rate, min_goodput=best_low, rng=np.random.default_rng(seed_seq), **kwargs)
+		rows.append(row)
+		best_low = max(best_low, row['goodput_low'])
+
+	# Fewest bits per chip among the (near) ties, then the best goodput
+	top = max([row['goodput'] for row in rows])
+	if top == 0:
+		raise ValueError("No configuration received any packets intact")
+	ties = [row for row in rows if row['goodput'] >= top*(1-tie_tolerance)]
+	best = min(ties, key=lambda row: (row['bits_per_chip'], -row['goodput']))
+	return dict(chips_per_symbol=best['chips_per_symbol'],
+		bits_per_chip=best['bits_per_chip'], threshold=best['threshold'],
+		goodput=best['goodput'], per=best['per'], CHIP_BITS=best['bits_per_chip'],
+		corr_threshold=best['threshold'], rows=rows)
+
+if __name__ == "__main__":
+	# 1 mW at 1550 nm over 1000 km with 2 cm apertures, against 0.1 pW of
+	# background, received at 100 Mchips/s
+	lamb = 1550e-9
+	A = np.pi*0.01**2
+	P_RX = float(calc_rx_power(1e-3, .5, .5, A, A, 1e6, lamb, 0.5, 0.1, 0.2))
+	photons_per_sec, bg_photons_per_sec = photon_rates(P_RX, 1e-13, lamb)
+	print("{0:.3g} signal, {1:.3g} background photons/s".format(photons_per_sec,
+		bg_photons_per_sec))
+
+	best = tune_operating_point(photons_per_sec, bg_photons_per_sec, 1e8)
+	for row in sorted(best['rows'], key=lambda row: -row['goodput'])[:10]:
+		print("{chips_per_symbol:4d}-PPM {bits_per_chip} b/chip threshold {threshold:2d}: "
+			"{goodput:12.0f} b/s PER {per:.3f} ({packets} packets)".format(**row))
+	print("Recommended: {0}-PPM, threshold_ext = {1}".format(best['chips_per_symbol'],
+		best['threshold']))
+	print("parameter CHIP_BITS = {0};".format(best['CHIP_BITS']))
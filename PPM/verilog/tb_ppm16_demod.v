@@ -176,9 +176,11 @@
 		/* -------------------------------- */
 		/* -------------------------------- */
 		initial begin
+`ifdef VCS
 		    $display("Turning on VCDPlus...");
 		    $vcdpluson();
 		    $display("VCDPlus on");
+`endif
 		    
 		    clk = 1'b0;
 		    resetn = 1'b1;
@@ -187,7 +189,9 @@
 
 		    test_false_negative();
 
+`ifdef VCS
 		    $vcdplusoff();
+`endif
 		    $finish;
 		end
 		
@@ -367,9 +371,11 @@
 		/* -------------------------------- */
 		/* -------------------------------- */
 		initial begin
+`ifdef VCS
 		    $display("Turning on VCDPlus...");
 		    $vcdpluson();
 		    $display("VCDPlus on");
+`endif
 		    
 		    clk = 1'b0;
 		    resetn = 1'b1;
@@ -378,7 +384,9 @@
 
 		    test_false_negative();
 
+`ifdef VCS
 		    $vcdplusoff();
+`endif
 		    $finish;
 		end
 		
@@ -148,9 +148,11 @@ module tb_ppm_freq_recovery();
 	/* -------------------------------- */
 	/* -------------------------------- */
 	initial begin
+`ifdef VCS
 		$display("Turning on VCDPlus...");
 	    $vcdpluson();
 	    $display("VCDPlus on");
+`endif
 	    
 	    clk = 1'b0;
 	    resetn = 1'b1;
@@ -158,7 +160,9 @@ module tb_ppm_freq_recovery();
 	    
 	    test_freq_counting();
 	    
+`ifdef VCS
 	    $vcdplusoff();
+`endif
 	    $finish;
 	end
 endmodule
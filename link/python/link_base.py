@@ -1,7 +1,26 @@
 # Lydia Lee
 # Created 2019/07/01
 
-# Contains equations for high-level link budgeting.
+# Contains equations for high-level link budgeting. Everything broadcasts,
+# so whole design-space grids (distance x wavelength x aperture x pointing
+# loss...) are evaluated in one call.
+
+import numpy as np
+import doctest
+import os
+import sys
+from itertools import product
+
+# const.py and misc.py live at the top of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from const import calc_E_photon
+from misc import Kruse_atten
+from link_capacity import calc_capacity_power
+
+# Inputs to link_budget, in the order they appear in its output
+LINK_INPUTS = ['P_TX', 'eta_TX', 'eta_RX', 'A_TX', 'A_RX', 'z', 'lamb',
+	'L_point', 'L_pol', 'L_atm', 'M', 'SNR', 'P_req']
+LINK_OUTPUTS = ['P_RX', 'photons_per_sec', 'capacity', 'margin_dB']
 
 def calc_rx_power(P_TX, eta_TX, eta_RX,
 	A_TX, A_RX, z, lamb, L_point, L_pol, L_atm):
@@ -17,16 +36,20 @@ def calc_rx_power(P_TX, eta_TX, eta_RX,
 		z: Float. Distance in meters between RX and TX.
 		lamb: Float. Wavelength in meters of the light in question.
 		L_point: Float between 0 and 1, inclsuive. Fractional pointing loss.
-		L_pol: Float between 0 and 1, inclusive. Fractional loss due to 
+		L_pol: Float between 0 and 1, inclusive. Fractional loss due to
 			polarization.
-		L_atm: Float between 0 and 1, inclsuive. Fractional loss due to 
+		L_atm: Float between 0 and 1, inclsuive. Fractional loss due to
 			atmospheric effects.
+		Any of the inputs can be arrays, as long as they broadcast together.
 	Outputs:
 		Returns the output power which reaches the receiver in watts.
+
+	>>> calc_rx_power(1, 1, 1, 1e-6, 1e-6, np.array([1e-3, 1e3]), 1e-6, 0, 0, 0).tolist()
+	[1.0, 1e-06]
 	"""
-	return min(P_TX, P_TX * (1-L_point) * (1-L_atm) * (1-L_pol) \
+	return np.minimum(P_TX, P_TX * (1-L_point) * (1-L_atm) * (1-L_pol) \
 		* eta_TX * eta_RX * (A_TX*A_RX)/(z*lamb)**2)
-		
+
 def calc_channel_capacity(P_RX, lamb, M, SNR):
 	"""
 	Inputs:
@@ -34,9 +57,124 @@ def calc_channel_capacity(P_RX, lamb, M, SNR):
 		lamb: Float. Wavelength in meters of the light in question.
 		M: Float. Peak-to-average power ratio of the signal.
 		SNR: Float. Signal-to-noise ratio of the received power.
+		Any of the inputs can be arrays, as long as they broadcast together.
+	Outputs:
+		Returns the theoretical channel capacity in bits/second, given the
+		rate of photons arriving at the receiver. See link_capacity for the
+		memoized and tabulated versions.
+	"""
+	return calc_capacity_power(P_RX, lamb, M, SNR)
+
+def link_budget(P_TX, eta_TX, eta_RX, A_TX, A_RX, z, lamb, L_point=0, L_pol=0,
+	L_atm=None, M=16, SNR=10, P_req=None):
+	"""
+	Inputs:
+		P_TX, eta_TX, eta_RX, A_TX, A_RX, z, lamb, L_point, L_pol: See
+			calc_rx_power.
+		L_atm: Float or None. Fractional atmospheric loss. If None, it's
+			taken from misc.Kruse_atten (clipped to [0, 1]).
+		M, SNR: See calc_channel_capacity.
+		P_req: Float or None. Receiver sensitivity in watts. If None, the
+			margin is left as NaN.
+		Any of the inputs can be arrays, as long as they broadcast together.
+	Outputs:
+		Returns a structured array with the broadcast shape of the inputs.
+		It holds one float64 field per input (LINK_INPUTS) plus the received
+		power 'P_RX', 'photons_per_sec', 'capacity' (bits/second) and the link
+		margin 'margin_dB' over P_req.
+
+	>>> budget = link_budget(1e-3, .5, .5, 1e-4, 1e-4, np.array([1e3, 1e4]), 1550e-9,
+	...		L_atm=0, P_req=1e-9)
+	>>> budget.shape, budget.dtype.names[-4:]
+	((2,), ('P_RX', 'photons_per_sec', 'capacity', 'margin_dB'))
+	>>> np.round(budget['margin_dB'], 2).tolist()
+	[30.17, 10.17]
+	"""
+	if L_atm is None:
+		L_atm = np.clip(Kruse_atten(z, lamb), 0, 1)
+	if P_req is None:
+		P_req = np.nan
+	inputs = [P_TX, eta_TX, eta_RX, A_TX, A_RX, z, lamb, L_point, L_pol,
+		L_atm, M, SNR, P_req]
+	inputs = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in inputs])
+
+	budget = np.empty(inputs[0].shape,
+		dtype=[(name, np.float64) for name in LINK_INPUTS+LINK_OUTPUTS])
+	for name, x in zip(LINK_INPUTS, inputs):
+		budget[name] = x
+	budget['P_RX'] = calc_rx_power(*inputs[:10])
+	budget['photons_per_sec'] = budget['P_RX']/calc_E_photon(budget['lamb'])
+	budget['capacity'] = calc_channel_capacity(budget['P_RX'], budget['lamb'],
+		budget['M'], budget['SNR'])
+	with np.errstate(divide='ignore'):
+		budget['margin_dB'] = 10*np.log10(budget['P_RX']/budget['P_req'])
+	return budget
+
+def _grid_axes(param_grid):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping link_budget argument names to lists
+			of values.
+	Outputs:
+		Returns a dictionary of the same arrays, each reshaped to lie along
+		its own axis so they broadcast into the full grid.
+	"""
+	ndim = len(param_grid)
+	axes = dict()
+	for i, (name, values) in enumerate(param_grid.items()):
+		shape = [1]*ndim
+		shape[i] = -1
+		axes[name] = np.asarray(values, dtype=float).reshape(shape)
+	return axes
+
+def link_budget_grid(param_grid, **kwargs):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping link_budget argument names to lists
+			of values. Every combination is evaluated.
+		kwargs: The remaining link_budget arguments, held fixed (or arrays
+			which broadcast against the grid).
 	Outputs:
-		Returns the theoretical channel capacity in photons/bit.
+		Returns the structured array from link_budget, with one axis per
+		entry of param_grid in the order given.
+
+	>>> grid = dict(z=np.logspace(3, 5, 100), lamb=[850e-9, 1550e-9],
+	...		A_RX=[1e-4, 1e-3], L_point=np.linspace(0, .9, 50))
+	>>> link_budget_grid(grid, P_TX=1e-3, eta_TX=.5, eta_RX=.5, A_TX=1e-4).shape
+	(100, 2, 2, 50)
 	"""
-	
-	return np.log2(np.exp(1)) * photons_per_sec/M * \
-		((1+1/SNR)*np.log(1+SNR) - (1+M/SNR)*np.log(1+SNR/M))
+	return link_budget(**_grid_axes(param_grid), **kwargs)
+
+def iter_link_budget_grid(param_grid, max_points=1 << 20, **kwargs):
+	"""
+	Inputs:
+		param_grid: Dictionary mapping link_budget argument names to lists
+			of values. Every combination is evaluated.
+		max_points: Integer. Largest number of grid points evaluated at once.
+			Bounds the memory use.
+		kwargs: The remaining link_budget arguments, held fixed.
+	Outputs:
+		Generator of flat structured arrays (see link_budget) which together
+		cover the grid in C order, i.e. the same order as
+		link_budget_grid(...).ravel(). The grid is split along its leading
+		axes, so each chunk is one call to link_budget.
+
+	>>> grid = dict(z=np.logspace(3, 5, 7), lamb=[850e-9, 1550e-9], L_point=[0, .5, .9])
+	>>> fixed = dict(P_TX=1e-3, eta_TX=.5, eta_RX=.5, A_TX=1e-4, A_RX=1e-4)
+	>>> chunks = list(iter_link_budget_grid(grid, max_points=10, **fixed))
+	>>> [len(c) for c in chunks]
+	[6, 6, 6, 6, 6, 6, 6]
+	>>> (np.concatenate(chunks)['P_RX'] == link_budget_grid(grid, **fixed)['P_RX'].ravel()).all()
+	True
+	"""
+	names = list(param_grid.keys())
+	sizes = [len(param_grid[name]) for name in names]
+
+	# Split off as many leading axes as it takes for the rest to fit
+	split = 0
+	while split < len(names) and int(np.prod(sizes[split:])) > max_points:
+		split = split + 1
+	inner = dict([(name, param_grid[name]) for name in names[split:]])
+	for outer in product(*[param_grid[name] for name in names[:split]]):
+		fixed = dict(zip(names[:split], outer))
+		yield link_budget_grid(inner, **fixed, **kwargs).ravel()
@@ -0,0 +1,238 @@
+# Created 2026/10/17
+
+# Capacity of the photon-counting (Poisson) channel used in the link budget.
+# Capacity is linear in the received photon rate, so everything hinges on
+# the photon efficiency (bits per photon) as a function of the peak-to-
+# average ratio M and the SNR. Scalar lookups are memoized and arrays are
+# evaluated directly, which NumPy does faster than any table lookup. A
+# (log M, log SNR) table, built once and saved to a cache directory, is
+# kept for off-line use (e.g. exporting the curve).
+
+import numpy as np
+import doctest
+import os
+import sys
+import tempfile
+from functools import lru_cache
+
+# const.py lives at the top of the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from const import calc_E_photon
+
+# Most scalar (M, SNR) pairs remembered by photon_efficiency
+CAPACITY_CACHE_SIZE = 4096
+
+# Default interpolation table: M from 2 to 4096 and SNR from -30 dB to
+# 40 dB, log-spaced, saved in the user's cache directory
+CAPACITY_TABLE_FILE = os.path.join(os.environ.get('XDG_CACHE_HOME',
+	os.path.join(os.path.expanduser('~'), '.cache')), 'spad-comms', 'capacity_table.npz')
+CAPACITY_TABLE_RANGE = dict(M_range=(2, 4096), SNR_range=(1e-3, 1e4), n_M=97, n_SNR=141)
+
+def _photon_efficiency(M, SNR):
+	"""
+	Outputs:
+		Returns the bits per photon for arrays of M and SNR, written with
+		log1p so it stays accurate at low SNR.
+	"""
+	M = np.asarray(M, dtype=float)
+	SNR = np.asarray(SNR, dtype=float)
+	return np.log2(np.exp(1))/M * ((1+1/SNR)*np.log1p(SNR) - (1+M/SNR)*np.log1p(SNR/M))
+
+@lru_cache(maxsize=CAPACITY_CACHE_SIZE)
+def _photon_efficiency_cached(M, SNR):
+	return float(_photon_efficiency(M, SNR))
+
+def photon_efficiency(M, SNR):
+	"""
+	Inputs:
+		M: Float. Peak-to-average power ratio of the signal (the PPM order).
+		SNR: Float. Signal-to-noise ratio of the received power.
+		Either can be an array, as long as they broadcast together.
+	Outputs:
+		Returns the channel capacity per received photon, in bits/photon.
+		Scalar calls are memoized (LRU, CAPACITY_CACHE_SIZE entries).
+
+	>>> round(photon_efficiency(16, 10), 4)
+	0.124
+	>>> photon_efficiency(np.array([4, 16]), 10).shape
+	(2,)
+	"""
+	if np.ndim(M) == 0 and np.ndim(SNR) == 0:
+		return _photon_efficiency_cached(float(M), float(SNR))
+	return _photon_efficiency(M, SNR)
+
+def calc_capacity(photons_per_sec, M, SNR):
+	"""
+	Inputs:
+		photons_per_sec: Float. Rate of signal photons arriving at the
+			receiver.
+		M, SNR: See photon_efficiency.
+		Any of the inputs can be arrays, as long as they broadcast together.
+	Outputs:
+		Returns the theoretical channel capacity in bits/second.
+
+	>>> round(float(calc_capacity(1e6, 16, 10)))
+	124014
+	"""
+	return np.asarray(photons_per_sec, dtype=float)*photon_efficiency(M, SNR)
+
+def photons_per_bit(M, SNR):
+	"""
+	Inputs:
+		M, SNR: See photon_efficiency.
+	Outputs:
+		Returns the fewest received photons needed per bit at capacity.
+	"""
+	return 1/photon_efficiency(M, SNR)
+
+def build_capacity_table(M_range, SNR_range, n_M, n_SNR):
+	"""
+	Inputs:
+		M_range: (M_min, M_max) covered by the table.
+		SNR_range: (SNR_min, SNR_max) covered by the table.
+		n_M, n_SNR: Integer. Number of log-spaced points along each axis.
+	Outputs:
+		Returns (log_M, log_SNR, log_eff) where log_eff[i, j] is the log of
+		the photon efficiency at exp(log_M[i]) and exp(log_SNR[j]).
+	"""
+	log_M = np.linspace(np.log(M_range[0]), np.log(M_range[1]), n_M)
+	log_SNR = np.linspace(np.log(SNR_range[0]), np.log(SNR_range[1]), n_SNR)
+	log_eff = np.log(_photon_efficiency(np.exp(log_M)[:, None], np.exp(log_SNR)[None, :]))
+	return log_M, log_SNR, log_eff
+
+@lru_cache(maxsize=8)
+def _capacity_table(tableFile, M_range, SNR_range, n_M, n_SNR):
+	"""
+	Outputs:
+		Returns the read-only table from build_capacity_table. It's loaded
+		from 'tableFile' if that was saved with the same parameters,
+		otherwise built and saved there (unless tableFile is None). Cached,
+		so each process touches the disk once per table.
+	"""
+	params = np.array([M_range[0], M_range[1], SNR_range[0], SNR_range[1], n_M, n_SNR],
+		dtype=float)
+	table = None
+	if tableFile is not None and os.path.exists(tableFile):
+		with np.load(tableFile) as saved:
+			if np.array_equal(saved['params'], params):
+				table = (saved['log_M'], saved['log_SNR'], saved['log_eff'])
+	if table is None:
+		table = build_capacity_table(M_range, SNR_range, n_M, n_SNR)
+		if tableFile is not None:
+			# Written to a unique file on the side and moved, so readers never
+			# see half a file and processes building it at once don't collide
+			tableDir = os.path.dirname(os.path.abspath(tableFile))
+			os.makedirs(tableDir, exist_ok=True)
+			fd, tmpFile = tempfile.mkstemp(suffix='.npz', dir=tableDir)
+			try:
+				with os.fdopen(fd, 'wb') as f:
+					np.savez(f, params=params, log_M=table[0], log_SNR=table[1],
+						log_eff=table[2])
+				os.replace(tmpFile, tableFile)
+			except BaseException:
+				os.remove(tmpFile)
+				raise
+	for x in table:
+		x.setflags(write=False)
+	return table
+
+def interp_photon_efficiency(M, SNR, tableFile=CAPACITY_TABLE_FILE, **table_kwargs):
+	"""
+	Inputs:
+		M, SNR: See photon_efficiency. Arrays broadcast together.
+		tableFile: String or None. Where the table is saved (by default
+			CAPACITY_TABLE_FILE, in the user's cache directory). None keeps it
+			in memory only.
+		table_kwargs: M_range, SNR_range, n_M, n_SNR (see
+			build_capacity_table). Default to CAPACITY_TABLE_RANGE.
+	Outputs:
+		Returns photon_efficiency(M, SNR) bilinearly interpolated in log-log
+		space from the table. Points outside the table are computed
+		directly. Meant for scalar or off-line lookups: for arrays,
+		photon_efficiency is faster and exact.
+
+	>>> M = np.array([4, 16, 100, 1024])
+	>>> exact = photon_efficiency(M, 3.0)
+	>>> approx = interp_photon_efficiency(M, 3.0, tableFile=None)
+	>>> bool(np.abs(approx/exact - 1).max() < 1e-3)
+	True
+	"""
+	kwargs = dict(CAPACITY_TABLE_RANGE, **table_kwargs)
+	log_M_axis, log_SNR_axis, log_eff = _capacity_table(tableFile,
+		tuple(kwargs['M_range']), tuple(kwargs['SNR_range']), kwargs['n_M'], kwargs['n_SNR'])
+	n_M, n_SNR = log_eff.shape
+
+	M, SNR = np.broadcast_arrays(np.asarray(M, dtype=float), np.asarray(SNR, dtype=float))
+	# Fractional index into the table along each axis
+	fi = (np.log(M) - log_M_axis[0])/(log_M_axis[1] - log_M_axis[0])
+	fj = (np.log(SNR) - log_SNR_axis[0])/(log_SNR_axis[1] - log_SNR_axis[0])
+	inside = (fi >= 0) & (fi <= n_M-1) & (fj >= 0) & (fj <= n_SNR-1)
+	i = np.clip(np.floor(fi).astype(int), 0, n_M-2)
+	j = np.clip(np.floor(fj).astype(int), 0, n_SNR-2)
+	ti = np.clip(fi - i, 0, 1)
+	tj = np.clip(fj - j, 0, 1)
+	eff = np.exp(log_eff[i, j]*(1-ti)*(1-tj) + log_eff[i+1, j]*ti*(1-tj)
+		+ log_eff[i, j+1]*(1-ti)*tj + log_eff[i+1, j+1]*ti*tj)
+
+	if not inside.all():
+		eff = np.array(eff)
+		eff[~inside] = _photon_efficiency(M[~inside], SNR[~inside])
+	return eff
+
+def capacity_gap(bits_per_sec, photons_per_sec, M, SNR):
+	"""
+	Inputs:
+		bits_per_sec: Float. Rate actually achieved (e.g. the goodput from
+			ppm_tune) or planned.
+		photons_per_sec: Float. Rate of signal photons at the receiver.
+		M, SNR: See photon_efficiency. For M-PPM, M is the order.
+		Any of the inputs can be arrays, as long as they broadcast together.
+	Outputs:
+		Returns (capacity, fraction, gap_dB): the capacity in bits/second,
+		the fraction of it the rate reaches, and how many dB more photons
+		the rate spends per bit than capacity requires.
+
+	>>> capacity, fraction, gap_dB = capacity_gap(5e4, 1e6, 16, 10)
+	>>> round(float(fraction), 3), round(float(gap_dB), 2)
+	(0.403, 3.95)
+	"""
+	capacity = calc_capacity(photons_per_sec, M, SNR)
+	fraction = np.asarray(bits_per_sec, dtype=float)/capacity
+	with np.errstate(divide='ignore'):
+		gap_dB = -10*np.log10(fraction)
+	return capacity, fraction, gap_dB
+
+def calc_capacity_power(P_RX, lamb, M, SNR):
+	"""
+	Inputs:
+		P_RX: Float. Power which reaches the receiver in watts.
+		lamb: Float. Wavelength in meters of the light in question.
+		M, SNR: See photon_efficiency.
+		Any of the inputs can be arrays, as long as they broadcast together.
+	Outputs:
+		Returns the channel capacity in bits/second for a received power,
+		same as link_base.calc_channel_capacity.
+	"""
+	return calc_capacity(P_RX/calc_E_photon(lamb), M, SNR)
+
+if __name__ == "__main__":
+	import time
+	M = np.exp(np.random.default_rng(0).uniform(np.log(2), np.log(4096), 1 << 20))
+	SNR = 10**np.random.default_rng(1).uniform(-3, 4, 1 << 20)
+	for name, func in [('exact', photon_efficiency), ('table', interp_photon_efficiency)]:
+		start = time.perf_counter()
+		eff = func(M, SNR)
+		print("{0}: {1:.3f}s for {2} points".format(name, time.perf_counter()-start, len(M)))
+	print("max relative error", np.abs(eff/photon_efficiency(M, SNR) - 1).max())
+
+	start = time.perf_counter()
+	for _ in range(100000):
+		photon_efficiency(16, 10)
+	print("memoized scalar: {0:.2f} us/call".format((time.perf_counter()-start)*10))
+
+	# How far a planned 200 kb/s sits from capacity for each order
+	for order in [4, 16, 64, 256]:
+		capacity, fraction, gap_dB = capacity_gap(2e5, 2.89e7, order, 30)
+		print("{0:4d}-PPM: capacity {1:.3g} b/s, {2:.1f} photons/bit, 200 kb/s is "
+			"{3:.1%} of capacity ({4:.2f} dB)".format(order, float(capacity),
+			photons_per_bit(order, 30), float(fraction), float(gap_dB)))
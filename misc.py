@@ -4,23 +4,25 @@
 # Miscellaneous, questionably useful equations which I've never used myself
 # but I thought I might at some point.
 
+import numpy as np
+
 def Kruse_atten(z, lamb):
 	"""
 	Inputs:
-		z: Distance in meters.
-		lamb: Wavelength in meters.
+		z: Distance in meters. Float or array.
+		lamb: Wavelength in meters. Float or array broadcastable against z.
 	Outputs:
 		Returns the fractional loss due to atmospheric effects
 		as per Kruse.
+
+	>>> float(Kruse_atten(60e3, 550e-9)) == 13/60e3
+	True
+	>>> Kruse_atten([1e3, 10e3, 60e3], 550e-9).shape
+	(3,)
 	"""
-	if z > 50e3:
-		q = 1.6
-	elif z > 6e3:
-		q = 1.3
-	else:
-		q = .585*z**(1/3)
-		
-	return 13/z*(lamb/550e-9)**(-q)
+	z = np.asarray(z, dtype=float)
+	q = np.where(z > 50e3, 1.6, np.where(z > 6e3, 1.3, .585*z**(1/3)))
+	return 13/z*(np.asarray(lamb)/550e-9)**(-q)
 
 def FSPL_atten(z, lamb):
 	"""
@@ -5,6 +5,15 @@
 # with a Gaussian beam.
 
 import numpy as np
+import doctest
+from functools import lru_cache
+
+# Quadrature nodes per dimension when integrating the beam over the aperture
+QUAD_NODES = 48
+# Beam is integrated out to this many 1/e^2 radii (exp(-2*3**2) ~ 1.5e-8)
+QUAD_RADII = 3
+# Points per chunk when integrating, to bound the memory use
+QUAD_CHUNK = 1024
 
 def intensity_position(r=1, mu=0, sigma=1):
     """
@@ -51,12 +60,14 @@ def calc_sigma(z, M=None, lamb=None, n=None, w_0=None, theta_e2=None):
         lamb: Wavelength in meters.
         n: Index of refraction.
         w_0: Beam waist radius in meters.
-        theta_e2: Half-angle of the beam divergence in radians.
+        theta_e2: Half-angle of the beam divergence in radians. If None,
+            it's calculated from the beam parameters.
+        Any of the inputs can be arrays, as long as they broadcast together.
     Outputs:
         Standard deviation of the Gaussian of intensity at a given 
         distance.
     """
-    if theta_e2 == None:
+    if theta_e2 is None:
         theta_e2 = calc_theta_e2(M, lamb, n, w_0)
     w_e2 = z*np.tan(theta_e2)
     return w_e2/2
@@ -70,5 +81,182 @@ def calc_theta_e2(M, lamb, n, w_0):
         w_0: Beam waist radius in meters.
     Outputs:
         Gives the half angle for the 1/e^2 point in beam divergence.
+        Scalar inputs are cached, so repeated calls with the same beam are
+        free.
     """
+    if all(np.ndim(x) == 0 for x in (M, lamb, n, w_0)):
+        return _calc_theta_e2_cached(float(M), float(lamb), float(n), float(w_0))
+    return M**2 * lamb/(np.pi*n*w_0)
+
+@lru_cache(maxsize=None)
+def _calc_theta_e2_cached(M, lamb, n, w_0):
     return M**2 * lamb/(np.pi*n*w_0)
+
+def _captured_fraction(r, w, r_RX):
+    """
+    Inputs:
+        r: Array. Distance in meters between the beam center and the center
+            of the RX aperture, in the RX plane.
+        w: Array. 1/e^2 beam radius in meters at the RX plane.
+        r_RX: Array. Radius of the RX aperture in meters.
+        All three are the same shape.
+    Outputs:
+        Returns the fraction of the Gaussian beam's power which falls on the
+        circular aperture. The integral is done in polar coordinates around
+        the aperture center, with both the radial and angular ranges cut down
+        to where the beam isn't negligible so narrow beams are resolved too.
+    """
+    k = (np.arange(QUAD_NODES) + 0.5)/QUAD_NODES
+    r = r[:, None, None]
+    w = w[:, None, None]
+
+    # Radial extent of the beam inside the aperture
+    rho_lo = np.maximum(0, r - QUAD_RADII*w)
+    rho_hi = np.minimum(r_RX[:, None, None], r + QUAD_RADII*w)
+    span = np.maximum(rho_hi - rho_lo, 0)
+    rho = rho_lo + span*k[None, :, None]
+
+    # Angular extent (the integrand is symmetric, so only [0, pi] is done)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_min = 1 - QUAD_RADII**2*w**2/(2*rho*r)
+    phi_max = np.where(rho*r > 0, np.arccos(np.clip(cos_min, -1, 1)), np.pi)
+    phi = phi_max*k[None, None, :]
+
+    d2 = (rho-r)**2 + 2*rho*r*(1-np.cos(phi))
+    integrand = np.exp(-2*d2/w**2) * rho
+    power = 2 * (integrand * (span/QUAD_NODES) * (phi_max/QUAD_NODES)).sum(axis=(1, 2))
+    return power/(np.pi*w[:, 0, 0]**2/2)
+
+def calc_L_point(theta, z, r_RX, M=None, lamb=None, n=None, w_0=None, theta_e2=None):
+    """
+    Inputs:
+        theta: Pointing error in radians.
+        z: Distance in meters between TX and RX.
+        r_RX: Radius of the RX aperture in meters.
+        M, lamb, n, w_0, theta_e2: Beam parameters, see calc_sigma.
+        Any of the inputs can be arrays, as long as they broadcast together.
+    Outputs:
+        Fractional pointing loss (what calc_rx_power takes as L_point): one
+        minus the power the aperture collects from the beam relative to
+        perfect pointing.
+
+    >>> float(calc_L_point(0, 1e3, .01, theta_e2=1e-4))
+    0.0
+    >>> L = calc_L_point(np.array([1e-5, 1e-4, 3e-4]), 1e3, .01, theta_e2=1e-4)
+    >>> np.round(L, 3).tolist()
+    [0.02, 0.862, 1.0]
+    """
+    if theta_e2 is None:
+        theta_e2 = calc_theta_e2(M, lamb, n, w_0)
+    theta, z, r_RX, theta_e2 = np.broadcast_arrays(*[np.asarray(x, dtype=float)
+        for x in (theta, z, r_RX, theta_e2)])
+    shape = theta.shape
+    r = (z*np.tan(np.abs(theta))).ravel()
+    w = (z*np.tan(theta_e2)).ravel()
+    r_RX = r_RX.ravel()
+
+    captured = np.empty(r.shape)
+    for i in range(0, len(r), QUAD_CHUNK):
+        chunk = slice(i, i+QUAD_CHUNK)
+        captured[chunk] = _captured_fraction(r[chunk], w[chunk], r_RX[chunk])
+    # Perfect pointing has a closed form
+    captured_0 = 1 - np.exp(-2*r_RX**2/w**2)
+    return np.clip(1 - captured/captured_0, 0, 1).reshape(shape)
+
+@lru_cache(maxsize=32)
+def _L_point_table(theta_e2, r_RX, theta_max, z_min, z_max, n_theta, n_z):
+    """
+    Outputs:
+        Returns (theta, log_z, L) where L[i, j] is the pointing loss at
+        theta[i] and exp(log_z[j]). Cached on its (hashable) arguments.
+    """
+    theta = np.linspace(0, theta_max, n_theta)
+    log_z = np.linspace(np.log(z_min), np.log(z_max), n_z)
+    L = calc_L_point(theta[:, None], np.exp(log_z)[None, :], r_RX, theta_e2=theta_e2)
+    L.setflags(write=False)
+    return theta, log_z, L
+
+def interp_L_point(theta, z, r_RX, z_range, M=None, lamb=None, n=None, w_0=None,
+    theta_e2=None, theta_max=None, n_theta=256, n_z=64):
+    """
+    Inputs:
+        theta: Pointing error in radians. Float or array.
+        z: Distance in meters between TX and RX. Float or array.
+        r_RX: Float. Radius of the RX aperture in meters.
+        z_range: (z_min, z_max) in meters covered by the table.
+        M, lamb, n, w_0, theta_e2: Beam parameters (scalars), see calc_sigma.
+        theta_max: Float. Largest angle covered by the table. Defaults to
+            three times the beam divergence.
+        n_theta: Integer. Number of angles in the table.
+        n_z: Integer. Number of (log-spaced) distances in the table.
+    Outputs:
+        Returns calc_L_point(theta, z, ...) bilinearly interpolated from a
+        table which is built once per set of beam parameters and then
+        cached, so repeated link-budget sweeps skip the integration. Points
+        outside the table are integrated directly.
+
+    >>> theta = np.array([1e-5, 1e-4, 2e-4])
+    >>> exact = calc_L_point(theta, 2e3, .01, theta_e2=1e-4)
+    >>> approx = interp_L_point(theta, 2e3, .01, (1e2, 1e4), theta_e2=1e-4)
+    >>> bool(np.abs(exact - approx).max() < 1e-3)
+    True
+    """
+    if theta_e2 is None:
+        theta_e2 = calc_theta_e2(M, lamb, n, w_0)
+    if theta_max is None:
+        theta_max = 3*theta_e2
+    table_theta, table_log_z, table = _L_point_table(float(theta_e2), float(r_RX),
+        float(theta_max), float(z_range[0]), float(z_range[1]), n_theta, n_z)
+
+    theta, z = np.broadcast_arrays(np.abs(np.asarray(theta, dtype=float)),
+        np.asarray(z, dtype=float))
+    log_z = np.log(z)
+
+    # Fractional index into the table along each axis
+    fi = (theta - table_theta[0])/(table_theta[1] - table_theta[0])
+    fj = (log_z - table_log_z[0])/(table_log_z[1] - table_log_z[0])
+    inside = (fi >= 0) & (fi <= n_theta-1) & (fj >= 0) & (fj <= n_z-1)
+    i = np.clip(np.floor(fi).astype(int), 0, n_theta-2)
+    j = np.clip(np.floor(fj).astype(int), 0, n_z-2)
+    ti = np.clip(fi - i, 0, 1)
+    tj = np.clip(fj - j, 0, 1)
+    L = (table[i, j]*(1-ti)*(1-tj) + table[i+1, j]*ti*(1-tj)
+        + table[i, j+1]*(1-ti)*tj + table[i+1, j+1]*ti*tj)
+
+    if not inside.all():
+        L = np.array(L)
+        L[~inside] = calc_L_point(theta[~inside], z[~inside], r_RX, theta_e2=theta_e2)
+    return L
+
+def sample_L_point(num_samples, sigma_theta, z, r_RX, M=None, lamb=None, n=None,
+    w_0=None, theta_e2=None, theta_bias=0, z_range=None, rng=None):
+    """
+    Inputs:
+        num_samples: Integer. Number of pointing-jitter draws.
+        sigma_theta: Float. Standard deviation in radians of the pointing
+            jitter along each of the two axes.
+        z: Float. Distance in meters between TX and RX.
+        r_RX: Float. Radius of the RX aperture in meters.
+        M, lamb, n, w_0, theta_e2: Beam parameters, see calc_sigma.
+        theta_bias: Float. Static pointing offset in radians (boresight
+            error) along one axis.
+        z_range: (z_min, z_max) or None. If given, losses come from the
+            cached table in interp_L_point instead of being integrated.
+        rng: np.random.Generator. Source of randomness.
+    Outputs:
+        Returns an array of num_samples L_point values, the distribution of
+        pointing loss to feed into link_base.calc_rx_power.
+
+    >>> L = sample_L_point(10000, 2e-5, 1e3, .01, theta_e2=1e-4, rng=np.random.default_rng(0))
+    >>> L.shape, round(float(L.mean()), 3)
+    ((10000,), 0.136)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if theta_e2 is None:
+        theta_e2 = calc_theta_e2(M, lamb, n, w_0)
+    jitter = rng.normal(0, sigma_theta, size=(2, num_samples))
+    theta = np.hypot(theta_bias + jitter[0], jitter[1])
+    if z_range is None:
+        return calc_L_point(theta, z, r_RX, theta_e2=theta_e2)
+    return interp_L_point(theta, z, r_RX, z_range, theta_e2=theta_e2)